@@ -1,11 +1,21 @@
 // Configuration
-const API_URL = 'https://tuteur-educatif.onrender.com';
+// Page servie par le backend : la balise api-url (vide) indique la même origine
+const API_URL = document.querySelector('meta[name="api-url"]')?.content ?? 'https://tuteur-educatif.onrender.com';
+
+// Identifiant de l'élève, conservé dans le navigateur
+const STUDENT_ID = getStudentId();
 
 let currentSubject = 'histoire_geo';
 let currentQuizSubject = 'histoire_geo';
 let currentQuizId = null;
 let userAnswers = [];
 
+// Historique chargé page par page en remontant (défilement infini)
+const HISTORY_PAGE_SIZE = 20;
+let historyCursor = null;     // id du plus ancien message affiché
+let historyHasMore = false;
+let historyLoading = false;
+
 // Éléments DOM
 const navBtns = document.querySelectorAll('.nav-btn');
 const sections = document.querySelectorAll('.section');
@@ -79,10 +89,13 @@ async function sendMessage() {
     addMessage('user', message);
     chatInput.value = '';
     
+    let textNode = null;
+    
     try {
         showLoading(true);
         
-        const response = await fetch(`${API_URL}/chat`, {
+        // Réponse en streaming (SSE) : les jetons s'affichent au fur et à mesure
+        const response = await fetch(`${API_URL}/chat/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -90,20 +103,40 @@ async function sendMessage() {
             body: JSON.stringify({
                 message: message,
                 subject: currentSubject,
-                student_level: 'lycée'
+                student_level: 'lycée',
+                student_id: STUDENT_ID
             })
         });
         
-        if (!response.ok) {
+        if (!response.ok || !response.body) {
             throw new Error('Erreur lors de l\'envoi du message');
         }
         
-        const data = await response.json();
-        addMessage('assistant', data.response);
+        await readEventStream(response, (event, data) => {
+            if (event === 'token') {
+                if (!textNode) {
+                    showLoading(false);
+                    textNode = addMessage('assistant', '');
+                }
+                textNode.appendData(data.delta);
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            } else if (event === 'error') {
+                throw new Error(data.detail);
+            }
+        });
+        
+        if (!textNode) {
+            throw new Error('Réponse vide');
+        }
         
     } catch (error) {
         console.error('Erreur:', error);
-        addMessage('assistant', '❌ Désolé, une erreur s\'est produite. Vérifie que le serveur est bien démarré.');
+        const errorMessage = '❌ Désolé, une erreur s\'est produite. Vérifie que le serveur est bien démarré.';
+        if (textNode) {
+            textNode.appendData(`\n\n${errorMessage}`);
+        } else {
+            addMessage('assistant', errorMessage);
+        }
     } finally {
         showLoading(false);
         chatInput.disabled = false;
@@ -112,7 +145,39 @@ async function sendMessage() {
     }
 }
 
-function addMessage(role, content) {
+// Lit un flux Server-Sent Events et appelle onEvent(event, data) pour chaque événement
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+}
+
+function addMessage(role, content, prepend = false) {
     // Supprimer le message de bienvenue si présent
     const welcomeMsg = chatMessages.querySelector('.welcome-message');
     if (welcomeMsg) {
@@ -128,7 +193,8 @@ function addMessage(role, content) {
     
     const contentDiv = document.createElement('div');
     contentDiv.className = 'message-content';
-    contentDiv.textContent = content;
+    const textNode = document.createTextNode(content);
+    contentDiv.appendChild(textNode);
     
     const time = document.createElement('div');
     time.className = 'message-time';
@@ -146,14 +212,32 @@ function addMessage(role, content) {
     }
     
     contentDiv.appendChild(time);
-    chatMessages.appendChild(messageDiv);
-    chatMessages.scrollTop = chatMessages.scrollHeight;
+    if (prepend) {
+        // Anciens messages ajoutés au-dessus : la position de lecture ne bouge pas
+        const previousHeight = chatMessages.scrollHeight;
+        chatMessages.insertBefore(messageDiv, chatMessages.firstChild);
+        chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+    } else {
+        chatMessages.appendChild(messageDiv);
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+    }
+    
+    // Nœud texte renvoyé pour pouvoir compléter le message pendant le streaming
+    return textNode;
+}
+
+function historyUrl(before) {
+    const cursor = before !== null ? `&before=${before}` : '';
+    return `${API_URL}/history/${currentSubject}?limit=${HISTORY_PAGE_SIZE}&compact=true${cursor}&${studentQuery()}`;
 }
 
 async function loadChatHistory() {
     try {
-        const response = await fetch(`${API_URL}/history/${currentSubject}`);
+        historyLoading = true;
+        const response = await fetch(historyUrl(null));
         const data = await response.json();
+        historyCursor = data.next_before;
+        historyHasMore = data.has_more;
         
         chatMessages.innerHTML = '';
         
@@ -172,9 +256,43 @@ async function loadChatHistory() {
         }
     } catch (error) {
         console.error('Erreur lors du chargement de l\'historique:', error);
+    } finally {
+        historyLoading = false;
     }
 }
 
+async function loadOlderMessages() {
+    if (historyLoading || !historyHasMore) {
+        return;
+    }
+    historyLoading = true;
+    const subject = currentSubject;
+    try {
+        const response = await fetch(historyUrl(historyCursor));
+        const data = await response.json();
+        if (subject !== currentSubject) {
+            return;  // matière changée entre-temps
+        }
+        historyCursor = data.next_before;
+        historyHasMore = data.has_more;
+        // Du plus récent au plus ancien, chacun inséré en tête
+        data.history.slice().reverse().forEach(msg => {
+            addMessage(msg.role, msg.content, true);
+        });
+    } catch (error) {
+        console.error('Erreur lors du chargement des anciens messages:', error);
+    } finally {
+        historyLoading = false;
+    }
+}
+
+// Arrivé en haut de la conversation : charger la page précédente
+chatMessages.addEventListener('scroll', () => {
+    if (chatMessages.scrollTop < 80) {
+        loadOlderMessages();
+    }
+});
+
 async function clearHistory() {
     if (!confirm('Êtes-vous sûr de vouloir effacer l\'historique de cette matière ?')) {
         return;
@@ -182,7 +300,7 @@ async function clearHistory() {
     
     try {
         showLoading(true);
-        await fetch(`${API_URL}/history/${currentSubject}`, {
+        await fetch(`${API_URL}/history/${currentSubject}?${studentQuery()}`, {
             method: 'DELETE'
         });
         loadChatHistory();
@@ -235,7 +353,8 @@ async function generateQuiz() {
                 subject: currentQuizSubject,
                 topic: topic,
                 difficulty: difficulty,
-                num_questions: numQuestions
+                num_questions: numQuestions,
+                student_id: STUDENT_ID
             })
         });
         
@@ -312,7 +431,8 @@ async function submitQuiz() {
             },
             body: JSON.stringify({
                 quiz_id: currentQuizId,
-                answers: userAnswers
+                answers: userAnswers,
+                student_id: STUDENT_ID
             })
         });
         
@@ -389,7 +509,7 @@ async function loadProgress() {
         showLoading(true);
         
         // Charger le leaderboard global
-        const leaderboardResponse = await fetch(`${API_URL}/leaderboard`);
+        const leaderboardResponse = await fetch(`${API_URL}/leaderboard?${studentQuery()}`);
         const leaderboard = await leaderboardResponse.json();
         
         // Mettre à jour les stats globales
@@ -465,6 +585,21 @@ async function loadProgress() {
 }
 
 // ========== UTILITY FUNCTIONS ==========
+function getStudentId() {
+    let studentId = localStorage.getItem('student_id');
+    if (!studentId) {
+        studentId = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `eleve-${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        localStorage.setItem('student_id', studentId);
+    }
+    return studentId;
+}
+
+function studentQuery() {
+    return `student_id=${encodeURIComponent(STUDENT_ID)}`;
+}
+
 function showLoading(show) {
     loadingOverlay.style.display = show ? 'flex' : 'none';
 }
@@ -0,0 +1,139 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+# Priorités (plus petit = servi d'abord)
+PRIORITY_INTERACTIVE = 0   # un élève attend la réponse (chat)
+PRIORITY_QUIZ = 1          # génération de quiz à la demande
+PRIORITY_BACKGROUND = 2    # pré-génération de la réserve de quiz
+
+
+class Overloaded(Exception):
+    """Trop de requêtes en attente : à traduire en 503 + Retry-After"""
+
+    def __init__(self, retry_after, reason="Service saturé"):
+        super().__init__(f"{reason}, réessaie dans {retry_after:.0f}s")
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+class SingleFlight:
+    """Fusionne les appels identiques en cours : un seul calcul, tous reçoivent le résultat"""
+
+    def __init__(self):
+        self._in_flight = {}
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(fn())
+        self._in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+
+class TokenBucket:
+    """Limiteur de débit : ``rate`` jetons par seconde, au plus ``burst`` d'avance.
+
+    ``name`` : fournisseur dont c'est le quota (dans le message d'Overloaded).
+    """
+
+    def __init__(self, rate, burst, name="groq"):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, max_wait):
+        """Prend un jeton, en attendant au plus ``max_wait`` secondes (sinon Overloaded)"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            # Le jeton est réservé tout de suite ; le solde peut devenir négatif
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                raise Overloaded(wait, f"Quota {self.name} atteint")
+            self._tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AdmissionController:
+    """Limite les appels sortants simultanés, avec une file d'attente bornée et prioritaire.
+
+    Au-delà de ``max_queue`` requêtes en attente, ou après ``queue_timeout``
+    secondes d'attente, la requête est refusée immédiatement (Overloaded)
+    plutôt que d'empiler les timeouts.
+    """
+
+    def __init__(self, max_concurrent=20, max_queue=100, queue_timeout=10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters = []  # tas de (priorité, ordre d'arrivée, future)
+        self._counter = itertools.count()
+        self.rejected = 0
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE):
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.queue_timeout, "File d'attente pleine")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._counter), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            # Le créneau est transmis directement par release()
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except BaseException as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if future.done() and not future.cancelled():
+                if timed_out:
+                    return  # créneau obtenu au dernier moment
+                self.release()  # annulé après avoir reçu le créneau : le passer au suivant
+                raise
+            future.cancel()
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            if timed_out:
+                self.rejected += 1
+                raise Overloaded(self.queue_timeout, "Attente trop longue")
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self):
+        return {
+            "active": self._active,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected
+        }
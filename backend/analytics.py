@@ -0,0 +1,399 @@
+"""Export incrémental vers une base d'analyse séparée, avec agrégats journaliers.
+
+Les rapports de l'équipe pédagogique ne lisent plus la base de l'application :
+les nouvelles lignes de ``progress``, ``quiz_results`` et ``chat_history``
+sont copiées par petits lots (repérées par leur id, toujours croissant) dans
+``tuteur_analytics.db``, et les agrégats par jour, matière et thème y sont
+mis à jour dans la même transaction que le repère d'export.
+
+    python analytics.py export      # un passage d'export (ex. depuis cron)
+
+Le contenu des messages n'est pas copié : seulement leur auteur, leur
+matière, leur longueur et leur date.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+ANALYTICS_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "temp_store": "MEMORY",
+}
+
+ANALYTICS_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS export_watermarks (
+        source TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        last_id INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (source, table_name)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS progress_events (
+        day TEXT NOT NULL,
+        student_id TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        activity_type TEXT NOT NULL,
+        points INTEGER NOT NULL,
+        activities INTEGER NOT NULL DEFAULT 1
+    )""",
+    """CREATE TABLE IF NOT EXISTS quiz_events (
+        day TEXT NOT NULL,
+        student_id TEXT NOT NULL,
+        quiz_id INTEGER NOT NULL,
+        subject TEXT NOT NULL,
+        topic TEXT,
+        score REAL NOT NULL,
+        correct_answers INTEGER NOT NULL,
+        total_questions INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS message_events (
+        day TEXT NOT NULL,
+        student_id TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        role TEXT NOT NULL,
+        length INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_progress_events_day ON progress_events (day)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_events_day ON quiz_events (day)",
+    "CREATE INDEX IF NOT EXISTS idx_message_events_day ON message_events (day)",
+    """CREATE TABLE IF NOT EXISTS daily_subject (
+        day TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        interactions INTEGER NOT NULL DEFAULT 0,
+        points INTEGER NOT NULL DEFAULT 0,
+        quizzes_completed INTEGER NOT NULL DEFAULT 0,
+        score_sum REAL NOT NULL DEFAULT 0,
+        messages INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, subject)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS daily_topic (
+        day TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        quizzes_completed INTEGER NOT NULL DEFAULT 0,
+        score_sum REAL NOT NULL DEFAULT 0,
+        best_score REAL NOT NULL DEFAULT 0,
+        questions INTEGER NOT NULL DEFAULT 0,
+        correct_answers INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, subject, topic)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS daily_active (
+        day TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        student_id TEXT NOT NULL,
+        PRIMARY KEY (day, subject, student_id)
+    ) WITHOUT ROWID""",
+]
+
+# Lecture des nouvelles lignes de la base de l'application, par id croissant
+SOURCE_QUERIES = {
+    # Une ligne regroupée par la rétention compte pour ``details.compacted`` activités
+    "progress": """SELECT id, date(timestamp), student_id, subject, activity_type, points,
+                          COALESCE(json_extract(details, '$.compacted'), 1)
+                   FROM progress WHERE id > ? ORDER BY id LIMIT ?""",
+    "quiz_results": """SELECT id, date(completed_at), student_id, quiz_id, subject, topic, score,
+                          correct_answers, total_questions
+                       FROM quiz_results WHERE id > ? ORDER BY id LIMIT ?""",
+    "chat_history": """SELECT id, date(timestamp), student_id, subject, role, length(content)
+                       FROM chat_history WHERE id > ? ORDER BY id LIMIT ?""",
+}
+
+SQL_DAILY_SUBJECT = """INSERT INTO daily_subject
+               (day, subject, interactions, points, quizzes_completed, score_sum, messages)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(day, subject) DO UPDATE SET
+                   interactions = interactions + excluded.interactions,
+                   points = points + excluded.points,
+                   quizzes_completed = quizzes_completed + excluded.quizzes_completed,
+                   score_sum = score_sum + excluded.score_sum,
+                   messages = messages + excluded.messages"""
+
+SQL_DAILY_TOPIC = """INSERT INTO daily_topic
+               (day, subject, topic, quizzes_completed, score_sum, best_score, questions, correct_answers)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(day, subject, topic) DO UPDATE SET
+                   quizzes_completed = quizzes_completed + excluded.quizzes_completed,
+                   score_sum = score_sum + excluded.score_sum,
+                   best_score = MAX(best_score, excluded.best_score),
+                   questions = questions + excluded.questions,
+                   correct_answers = correct_answers + excluded.correct_answers"""
+
+SQL_DAILY_REPORT = """SELECT s.day, s.subject, s.interactions, s.points, s.quizzes_completed,
+                             s.score_sum, s.messages,
+                             (SELECT COUNT(*) FROM daily_active a
+                              WHERE a.day = s.day AND a.subject = s.subject) AS active_students
+                      FROM daily_subject s
+                      WHERE s.subject = ? AND s.day >= date('now', ?)
+                      ORDER BY s.day"""
+
+SQL_TOPIC_REPORT = """SELECT topic, SUM(quizzes_completed) AS quizzes_completed, SUM(score_sum) AS score_sum,
+                             MAX(best_score) AS best_score, SUM(questions) AS questions,
+                             SUM(correct_answers) AS correct_answers
+                      FROM daily_topic
+                      WHERE subject = ? AND day >= date('now', ?)
+                      GROUP BY topic
+                      ORDER BY quizzes_completed DESC"""
+
+
+class AnalyticsStore:
+    """Base d'analyse (fichier SQLite séparé) et export depuis les bases de l'application"""
+
+    def __init__(self, path="tuteur_analytics.db", batch_size=5000):
+        self.path = path
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        with self.transaction() as conn:
+            for statement in ANALYTICS_SCHEMA:
+                conn.execute(statement)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(progress_events)")}
+            if "activities" not in columns:  # fichier créé avant le regroupement de la progression
+                conn.execute("ALTER TABLE progress_events ADD COLUMN activities INTEGER NOT NULL DEFAULT 1")
+
+    @classmethod
+    def from_env(cls):
+        return cls(path=os.getenv("TUTEUR_ANALYTICS_DB", "tuteur_analytics.db"))
+
+    def get_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for name, value in ANALYTICS_PRAGMAS.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        with conn:
+            yield conn
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    # ========== EXPORT ==========
+
+    def export(self, sources):
+        """Copie les nouvelles lignes de chaque base source ; renvoie le nombre de lignes exportées"""
+        exported = 0
+        with self._export_lock:
+            for source in sources:
+                for table in SOURCE_QUERIES:
+                    while True:
+                        count = self._export_batch(source, table)
+                        exported += count
+                        if count < self.batch_size:
+                            break
+        return exported
+
+    def _export_batch(self, source, table):
+        conn = self.get_connection()
+        row = conn.execute(
+            "SELECT last_id FROM export_watermarks WHERE source = ? AND table_name = ?",
+            (source.db_name, table)
+        ).fetchone()
+        last_id = row["last_id"] if row else 0
+
+        # Lecture courte : en WAL, elle ne bloque pas les écritures de l'application
+        rows = source.get_connection().execute(SOURCE_QUERIES[table], (last_id, self.batch_size)).fetchall()
+        if not rows:
+            return 0
+
+        with self.transaction() as conn:
+            # Un autre processus a pu exporter ce lot entre-temps (export manuel pendant l'export périodique)
+            current = conn.execute(
+                "SELECT last_id FROM export_watermarks WHERE source = ? AND table_name = ?",
+                (source.db_name, table)
+            ).fetchone()
+            if (current["last_id"] if current else 0) != last_id:
+                return 0
+            getattr(self, f"_load_{table}")(conn, [tuple(r)[1:] for r in rows])
+            conn.execute(
+                """INSERT INTO export_watermarks (source, table_name, last_id) VALUES (?, ?, ?)
+                   ON CONFLICT(source, table_name) DO UPDATE SET last_id = excluded.last_id""",
+                (source.db_name, table, rows[-1][0])
+            )
+        return len(rows)
+
+    def _load_progress(self, conn, rows):
+        conn.executemany(
+            """INSERT INTO progress_events (day, student_id, subject, activity_type, points, activities)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            rows
+        )
+        totals = {}
+        for day, student_id, subject, activity_type, points, activities in rows:
+            entry = totals.setdefault((day, subject), [0, 0])
+            entry[0] += activities if activity_type == "interaction" else 0
+            entry[1] += points
+        conn.executemany(SQL_DAILY_SUBJECT, [
+            (day, subject, interactions, points, 0, 0, 0)
+            for (day, subject), (interactions, points) in totals.items()
+        ])
+        self._mark_active(conn, {(day, subject, student_id) for day, student_id, subject, *_ in rows})
+
+    def _load_quiz_results(self, conn, rows):
+        conn.executemany(
+            """INSERT INTO quiz_events
+               (day, student_id, quiz_id, subject, topic, score, correct_answers, total_questions)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows
+        )
+        by_subject = {}
+        by_topic = {}
+        for day, student_id, quiz_id, subject, topic, score, correct, total in rows:
+            entry = by_subject.setdefault((day, subject), [0, 0.0])
+            entry[0] += 1
+            entry[1] += score
+            entry = by_topic.setdefault((day, subject, topic or ""), [0, 0.0, 0.0, 0, 0])
+            entry[0] += 1
+            entry[1] += score
+            entry[2] = max(entry[2], score)
+            entry[3] += total
+            entry[4] += correct
+        conn.executemany(SQL_DAILY_SUBJECT, [
+            (day, subject, 0, 0, quizzes, score_sum, 0)
+            for (day, subject), (quizzes, score_sum) in by_subject.items()
+        ])
+        conn.executemany(SQL_DAILY_TOPIC, [key + tuple(values) for key, values in by_topic.items()])
+        self._mark_active(conn, {(row[0], row[3], row[1]) for row in rows})
+
+    def _load_chat_history(self, conn, rows):
+        conn.executemany(
+            "INSERT INTO message_events (day, student_id, subject, role, length) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        counts = {}
+        for day, _, subject, _, _ in rows:
+            counts[(day, subject)] = counts.get((day, subject), 0) + 1
+        conn.executemany(SQL_DAILY_SUBJECT, [
+            (day, subject, 0, 0, 0, 0, messages) for (day, subject), messages in counts.items()
+        ])
+
+    def _mark_active(self, conn, day_subject_students):
+        conn.executemany(
+            "INSERT OR IGNORE INTO daily_active (day, subject, student_id) VALUES (?, ?, ?)",
+            day_subject_students
+        )
+
+    # ========== RAPPORTS ==========
+
+    def daily_report(self, subject, days=30):
+        """Activité par jour pour une matière (agrégats uniquement)"""
+        rows = self.get_connection().execute(SQL_DAILY_REPORT, (subject, f"-{int(days)} days")).fetchall()
+        return [
+            {
+                "day": row["day"],
+                "interactions": row["interactions"],
+                "points": row["points"],
+                "quizzes_completed": row["quizzes_completed"],
+                "avg_score": round(row["score_sum"] / row["quizzes_completed"], 2) if row["quizzes_completed"] else 0,
+                "messages": row["messages"],
+                "active_students": row["active_students"]
+            }
+            for row in rows
+        ]
+
+    def topic_report(self, subject, days=30):
+        """Résultats de quiz par thème sur la période"""
+        rows = self.get_connection().execute(SQL_TOPIC_REPORT, (subject, f"-{int(days)} days")).fetchall()
+        return [
+            {
+                "topic": row["topic"],
+                "quizzes_completed": row["quizzes_completed"],
+                "avg_score": round(row["score_sum"] / row["quizzes_completed"], 2),
+                "best_score": round(row["best_score"], 2),
+                "success_rate": round(row["correct_answers"] / row["questions"], 4) if row["questions"] else 0
+            }
+            for row in rows
+        ]
+
+    def exported_until(self, source, table):
+        """Dernier id de ``table`` copié depuis la base ``source`` (0 si rien n'a encore été exporté)"""
+        row = self.get_connection().execute(
+            "SELECT last_id FROM export_watermarks WHERE source = ? AND table_name = ?", (source.db_name, table)
+        ).fetchone()
+        return row["last_id"] if row else 0
+
+    def stats(self):
+        rows = self.get_connection().execute("SELECT source, table_name, last_id FROM export_watermarks").fetchall()
+        return {f"{row['source']}:{row['table_name']}": row["last_id"] for row in rows}
+
+
+class AnalyticsExporter:
+    """Tâche de fond qui lance un export toutes les ``interval`` secondes.
+
+    Avec plusieurs workers, ``lease`` réserve la tâche à un seul d'entre eux.
+    """
+
+    def __init__(self, store, sources, interval=300.0, lease=None):
+        self.store = store
+        self.sources = sources
+        self.interval = interval
+        self.lease = lease
+        self.exported = 0
+        self._task = None
+
+    async def export_once(self):
+        # Hors de la boucle d'événements : un gros rattrapage ne bloque pas les requêtes
+        count = await asyncio.to_thread(self.store.export, self.sources)
+        self.exported += count
+        return count
+
+    async def _run(self):
+        while True:
+            try:
+                if self.lease is not None and not await asyncio.to_thread(self.lease.acquire):
+                    await asyncio.sleep(self.interval)
+                    continue
+                count = await self.export_once()
+                if count:
+                    print(f"✅ Export analytique: {count} lignes")
+            except Exception as e:
+                print(f"❌ Erreur de l'export analytique: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self.lease is not None:
+                await asyncio.to_thread(self.lease.release)
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import open_database
+
+    parser = argparse.ArgumentParser(description="Export vers la base d'analyse")
+    parser.add_argument("command", choices=["export"])
+    args = parser.parse_args()
+
+    db = open_database()
+    store = AnalyticsStore.from_env()
+    count = store.export(db.student_stores)
+    print(f"✅ {count} lignes exportées vers {store.path}")
+    store.close()
+    db.close()
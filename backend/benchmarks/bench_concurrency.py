@@ -0,0 +1,75 @@
+"""Benchmark de charge de /chat et /quiz/generate contre un faux Groq local.
+
+À lancer depuis backend/ :
+
+    python -m benchmarks.bench_concurrency --requests 200 --concurrency 100 --latency 0.5
+
+Le backend tourne dans un seul worker uvicorn, comme en production ; la base
+SQLite est créée dans un dossier temporaire. ``--failure-rate`` fait répondre
+le faux Groq en 429/503 pour vérifier les nouveaux essais et le contrôle
+d'admission ; ``--rpm`` active le limiteur de débit (désactivé par défaut).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks.fake_groq import create_app, serve_in_thread
+
+FAKE_GROQ_PORT = 9100
+APP_PORT = 9101
+
+
+def start_backend(rpm):
+    os.environ["GROQ_API_KEY"] = "gsk_benchmark"
+    os.environ["GROQ_RATE_LIMIT_RPM"] = str(rpm)
+    os.environ["GROQ_API_URL"] = f"http://127.0.0.1:{FAKE_GROQ_PORT}/openai/v1/chat/completions"
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, backend_dir)
+    os.chdir(tempfile.mkdtemp(prefix="tuteur-bench-"))
+    import main
+    return serve_in_thread(main.app, APP_PORT)
+
+
+async def run(path, body, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{APP_PORT}", limits=limits, timeout=300) as client:
+        async def one():
+            async with semaphore:
+                response = await client.post(path, json=body)
+                return response.status_code
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+    overloaded = sum(1 for s in statuses if s == 503)
+    errors = sum(1 for s in statuses if s not in (200, 503))
+    print(f"{path:<16} {total} requêtes, concurrence {concurrency}: "
+          f"{elapsed:.2f}s, {total / elapsed:.1f} req/s, {overloaded} refus 503, {errors} erreurs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de concurrence du backend")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.5, help="latence simulée de Groq (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="part des appels en 429/503")
+    parser.add_argument("--rpm", type=float, default=0, help="quota Groq simulé (requêtes/min, 0 = aucun)")
+    args = parser.parse_args()
+
+    fake_groq = create_app(args.latency, args.failure_rate)
+    serve_in_thread(fake_groq, FAKE_GROQ_PORT)
+    start_backend(args.rpm)
+
+    chat = {"message": "Explique-moi la Révolution française", "subject": "histoire_geo"}
+    quiz = {"subject": "svt", "topic": "La photosynthèse", "difficulty": "moyen", "num_questions": 5}
+    asyncio.run(run("/chat", chat, args.requests, args.concurrency))
+    asyncio.run(run("/quiz/generate", quiz, args.requests, args.concurrency))
+    print(f"Appels reçus par le faux Groq: {fake_groq.state.calls}")
+
+
+if __name__ == "__main__":
+    main()
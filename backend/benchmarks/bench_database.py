@@ -0,0 +1,135 @@
+"""Micro-benchmark de la couche SQLite sous écritures concurrentes.
+
+Compare l'ancien fonctionnement (une connexion ouverte et fermée à chaque
+appel, journal par défaut) aux connexions persistantes par thread en WAL,
+puis les écritures d'un échange /chat (deux messages et une progression)
+immédiates ou passées par la file d'écriture différée.
+
+    python -m benchmarks.bench_database --threads 8 --operations 500
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing, contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database, BUSY_TIMEOUT
+from write_behind import WriteBehind
+
+
+class ConnectPerCallDatabase(Database):
+    """Reproduit l'ancien comportement : une connexion par appel, sans PRAGMA.
+
+    La connexion est fermée à la fin de l'appel, comme avant : sans cela les
+    descripteurs de fichier s'accumulent et faussent la comparaison.
+    """
+
+    @contextmanager
+    def _call(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:  # appel imbriqué : même connexion
+            yield conn
+            return
+        with closing(sqlite3.connect(self.db_name, timeout=BUSY_TIMEOUT)) as conn:
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+
+    def get_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            raise RuntimeError("get_connection hors d'un appel")
+        return conn
+
+    def init_database(self):
+        with self._call():
+            super().init_database()
+
+    def save_message(self, *args, **kwargs):
+        with self._call():
+            super().save_message(*args, **kwargs)
+
+    def get_chat_history(self, *args, **kwargs):
+        with self._call():
+            return super().get_chat_history(*args, **kwargs)
+
+
+def worker(db, thread_index, operations, errors):
+    subject = "svt" if thread_index % 2 else "histoire_geo"
+    try:
+        for i in range(operations):
+            db.save_message(subject, "user", f"Question {i} du thread {thread_index}")
+            db.get_chat_history(subject, 10)
+    except sqlite3.OperationalError as e:
+        errors.append(str(e))
+
+
+def run(db_class, threads, operations):
+    path = os.path.join(tempfile.mkdtemp(prefix="tuteur-bench-db-"), "bench.db")
+    db = db_class(path)
+    errors = []
+    pool = [threading.Thread(target=worker, args=(db, t, operations, errors)) for t in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = threads * operations
+    print(f"{db_class.__name__:<24} {total} save_message + {total} get_chat_history "
+          f"en {elapsed:.2f}s : {2 * total / elapsed:.0f} op/s, {len(errors)} erreurs")
+    db.close()
+
+
+def exchange_worker(db, thread_index, operations, latencies):
+    student_id = f"eleve_{thread_index}"
+    for i in range(operations):
+        start = time.perf_counter()
+        db.save_message("svt", "user", f"Question {i}", student_id=student_id)
+        db.save_message("svt", "assistant", f"Réponse {i}", student_id=student_id)
+        db.update_progress("svt", "interaction", student_id=student_id)
+        latencies.append(time.perf_counter() - start)
+
+
+def run_exchanges(write_behind, threads, operations):
+    path = os.path.join(tempfile.mkdtemp(prefix="tuteur-bench-db-"), "bench.db")
+    db = Database(path)
+    if write_behind:
+        db.attach_write_behind(WriteBehind())
+    latencies = []
+    pool = [threading.Thread(target=exchange_worker, args=(db, t, operations, latencies)) for t in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    db.close()  # inclut l'écriture de ce qui reste en file
+    elapsed = time.perf_counter() - start
+    total = threads * operations
+    label = "file d'écriture différée" if write_behind else "écritures immédiates"
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    print(f"{label:<24} {total} échanges en {elapsed:.2f}s : {total / elapsed:.0f} échanges/s, "
+          f"latence p50 {statistics.median(latencies) * 1000:.2f} ms, p95 {p95 * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=500, help="opérations par thread")
+    args = parser.parse_args()
+    run(ConnectPerCallDatabase, args.threads, args.operations)
+    run(Database, args.threads, args.operations)
+    run_exchanges(False, args.threads, args.operations)
+    run_exchanges(True, args.threads, args.operations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark de la correction groupée : copies corrigées une par une ou en lot.
+
+    python -m benchmarks.bench_grading --submissions 10000 --questions 10
+
+« Une par une » reproduit /quiz/submit appelé pour chaque copie (boucle
+Python, résultat et progression écrits à chaque appel) ; « en lot » reproduit
+/quiz/submit/batch (matrice numpy, une seule transaction).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+from grading import grade_quiz
+from quiz_parser import CompiledQuizCache
+
+
+def make_quiz(db, num_questions):
+    quiz_data = {
+        "title": "Quiz de benchmark",
+        "questions": [
+            {
+                "question": f"Question {i + 1} ?",
+                "options": ["Option A", "Option B", "Option C", "Option D"],
+                "correct_answer": random.randrange(4),
+                "explanation": "Explication"
+            }
+            for i in range(num_questions)
+        ]
+    }
+    return db.save_quiz("svt", "Benchmark", quiz_data)
+
+
+def one_by_one(db, quiz, submissions):
+    for student_id, answers in submissions:
+        correct, _ = quiz.score(answers)
+        score = correct / len(quiz.answer_key) * 100
+        db.save_quiz_result(quiz.quiz_id, quiz.subject, score, correct, len(quiz.answer_key),
+                            student_id=student_id, topic=quiz.topic)
+        db.update_progress(quiz.subject, "quiz_completed", score, student_id=student_id)
+
+
+def batched(db, quiz, submissions):
+    correct, scores, _ = grade_quiz(quiz, [answers for _, answers in submissions])
+    total = len(quiz.answer_key)
+    db.save_quiz_results([
+        (student_id, quiz.quiz_id, quiz.subject, quiz.topic, score, n_correct, total)
+        for (student_id, _), n_correct, score in zip(submissions, correct.tolist(), scores.tolist())
+    ])
+
+
+def run(label, grade, submissions, num_questions):
+    db = Database(os.path.join(tempfile.mkdtemp(prefix="tuteur-bench-grading-"), "bench.db"))
+    quiz = CompiledQuizCache(db).get(make_quiz(db, num_questions))
+    start = time.perf_counter()
+    grade(db, quiz, submissions)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {len(submissions)} copies en {elapsed:.3f}s : {len(submissions) / elapsed:.0f} copies/s")
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la correction des quiz")
+    parser.add_argument("--submissions", type=int, default=10000)
+    parser.add_argument("--questions", type=int, default=10)
+    args = parser.parse_args()
+
+    submissions = [
+        (f"eleve_{i}", [random.randrange(4) for _ in range(args.questions)])
+        for i in range(args.submissions)
+    ]
+    run("une par une", one_by_one, submissions, args.questions)
+    run("en lot", batched, submissions, args.questions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Benchmark de la rétention : archivage, effacement par lots, taille du fichier.
+
+    python -m benchmarks.bench_retention --messages 300000 --students 200 --old-share 0.8
+
+Remplit une base temporaire avec des messages datés sur un an (les
+``--old-share`` plus anciens au-delà de l'âge de rétention), puis mesure :
+le passage d'archivage (débit, taux de compression, pages rendues) et la
+pagination de /history jusque dans l'archive. Compare ensuite, sur l'élève
+qui a le plus de messages, l'effacement en un seul DELETE et l'effacement
+par lots, du point de vue d'un autre thread qui écrit pendant ce temps.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+
+WORDS = ["la", "cellule", "méiose", "mitose", "chromosome", "révolution", "guerre", "empire", "écosystème",
+         "énergie", "génétique", "photosynthèse", "explique", "pourquoi", "comment", "exemple", "causes"]
+RETENTION_DAYS = 90
+
+
+def fill(db, messages, students, old_share, rng, batch=20000):
+    """Messages d'id croissant et de date croissante, sur un an"""
+    old = int(messages * old_share)
+    for first in range(0, messages, batch):
+        rows = []
+        for index in range(first, min(messages, first + batch)):
+            # Les ``old`` premiers entre 365 et 91 jours, les suivants sur les 90 derniers jours
+            if index < old:
+                age = 365 - (365 - RETENTION_DAYS - 1) * index / max(old, 1)
+            else:
+                age = RETENTION_DAYS * (1 - (index - old) / max(messages - old, 1))
+            # Un élève très bavard, pour l'effacement
+            student_id = "eleve_bavard" if rng.random() < 0.2 else f"eleve_{rng.randrange(students)}"
+            content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 60)))
+            rows.append((student_id, "svt", rng.choice(("user", "assistant")), content, f"-{age:.4f} days"))
+        with db.transaction() as conn:
+            conn.executemany(
+                """INSERT INTO chat_history (student_id, subject, role, content, timestamp)
+                   VALUES (?, ?, ?, ?, datetime('now', ?))""",
+                rows
+            )
+
+
+def writer_waits(db, stop):
+    """Durées d'écriture d'un autre écrivain (un message à la fois) pendant une opération"""
+    waits = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        db.save_message("histoire_geo", "user", "message écrit pendant l'effacement", student_id="eleve_temoin")
+        waits.append(time.perf_counter() - start)
+        time.sleep(0.005)
+    return sorted(waits)
+
+
+def timed_with_writer(db, operation):
+    stop = threading.Event()
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("waits", writer_waits(db, stop)))
+    thread.start()
+    start = time.perf_counter()
+    operation()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    thread.join()
+    return elapsed, result["waits"]
+
+
+def single_delete(db, student_id):
+    # Ancienne version de clear_chat_history : un seul DELETE
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM chat_history WHERE student_id = ? AND subject = ?", (student_id, "svt"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la rétention")
+    parser.add_argument("--messages", type=int, default=300000)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--old-share", type=float, default=0.8, help="part des messages à archiver")
+    parser.add_argument("--block-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="tuteur-bench-retention-")
+    for label, clear in (("un seul DELETE", single_delete),
+                         ("par lots", lambda db, student_id: db.clear_chat_history("svt", student_id=student_id))):
+        db = Database(os.path.join(directory, f"{label.replace(' ', '_')}.db"))
+        fill(db, args.messages, args.students, 0.0, random.Random(args.seed))
+        count = db.get_connection().execute(
+            "SELECT COUNT(*) FROM chat_history WHERE student_id = 'eleve_bavard'"
+        ).fetchone()[0]
+        elapsed, waits = timed_with_writer(db, lambda: clear(db, "eleve_bavard"))
+        p90 = waits[min(len(waits) - 1, int(len(waits) * 0.9))]
+        print(f"Effacement {label:<15} {count} messages en {elapsed * 1000:6.0f} ms ; autre écrivain : "
+              f"{len(waits)} écritures, p90 {p90 * 1000:5.1f} ms, pire {waits[-1] * 1000:5.0f} ms")
+        db.close()
+
+    db = Database(os.path.join(directory, "bench.db"))
+    fill(db, args.messages, args.students, args.old_share, random.Random(args.seed))
+    path = db.db_name
+    size_before = os.path.getsize(path)
+    student_id = "eleve_0"
+    full = db.get_chat_history("svt", limit=args.messages, student_id=student_id)
+
+    start = time.perf_counter()
+    archived = db.archive_chat_history(RETENTION_DAYS, block_size=args.block_size)
+    archive_time = time.perf_counter() - start
+    start = time.perf_counter()
+    freed = db.incremental_vacuum()
+    vacuum_time = time.perf_counter() - start
+    db.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    stats = db.get_archive_stats()
+    raw = sum(len(message["content"]) for message in full) / max(len(full), 1) * archived
+    print(f"Archivage : {archived} messages en {archive_time:.1f}s ({archived / archive_time:.0f} messages/s), "
+          f"{stats['archive_blocks']} blocs, {stats['archive_bytes'] / 1e6:.1f} Mo "
+          f"(contenu ≈ {raw / 1e6:.1f} Mo)")
+    print(f"Fichier : {size_before / 1e6:.1f} Mo → {os.path.getsize(path) / 1e6:.1f} Mo "
+          f"({freed} pages rendues en {vacuum_time:.2f}s)")
+
+    # Relire tout l'historique d'un élève, page par page, de la fin jusqu'au début de l'archive
+    pages = []
+    before = None
+    start = time.perf_counter()
+    while True:
+        rows = db.get_chat_history("svt", limit=20, before_id=before, student_id=student_id)
+        if not rows:
+            break
+        pages = rows + pages
+        before = rows[0]["id"]
+    elapsed = time.perf_counter() - start
+    requests = -(-len(full) // 20) + 1
+    print(f"Pagination de {student_id} : {len(full)} messages en {requests} pages, "
+          f"{elapsed / requests * 1000:.2f} ms par page, identique avant/après : {pages == full}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
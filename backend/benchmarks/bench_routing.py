@@ -0,0 +1,98 @@
+"""Benchmark du routage entre fournisseurs : secours seul ou appel doublé au p95.
+
+    python -m benchmarks.bench_routing --requests 300 --slow-rate 0.03
+
+Deux faux serveurs compatibles OpenAI : un « primaire » rapide mais avec une
+longue traîne (``--slow-rate`` des appels prennent ``--slow-latency``), et un
+« local » plus lent mais régulier. On mesure les latences de
+ProviderRouter.complete avec et sans hedging, puis, avec le primaire en
+panne, la part des requêtes sauvées par le secours.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from admission import AdmissionController, TokenBucket
+from benchmarks.fake_groq import create_app, serve_in_thread
+from groq_client import GroqClient
+from providers import ProviderRouter
+
+PRIMARY_PORT = 9200
+LOCAL_PORT = 9201
+MESSAGES = [{"role": "system", "content": "Tu es un tuteur."}, {"role": "user", "content": "Explique la mitose."}]
+
+
+def provider(name, port):
+    return GroqClient(
+        name=name, api_key=None, model="bench",
+        api_url=f"http://127.0.0.1:{port}/openai/v1/chat/completions",
+        admission=AdmissionController(max_concurrent=100, max_queue=1000, queue_timeout=60),
+        rate_limiter=TokenBucket(rate=0, burst=1), max_retries=0,
+    )
+
+
+async def run(label, router, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await router.complete(MESSAGES, max_tokens=100, temperature=0.7)
+            except Exception:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000 if latencies else float("nan")
+
+    print(f"{label:<22} p50 {statistics.median(latencies) * 1000 if latencies else float('nan'):7.0f} ms  "
+          f"p95 {pct(0.95):7.0f} ms  p99 {pct(0.99):7.0f} ms  échecs {failures}  "
+          f"doublés {router.hedged}  bascules {router.fallbacks}")
+
+
+async def scenarios(args, primary_app):
+    providers = [provider("groq", PRIMARY_PORT), provider("local", LOCAL_PORT)]
+    # Les 50 premières requêtes servent à apprendre le p95 du primaire
+    for label, quantile in (("secours seul", None), ("hedging p95", 0.95)):
+        router = ProviderRouter(providers, hedge_quantile=quantile, min_samples=20)
+        await run(f"{label} (rodage)", router, 50, args.concurrency)
+        router.hedged = router.fallbacks = 0
+        await run(label, router, args.requests, args.concurrency)
+
+    primary_app.state.failure_rate = 1.0
+    router = ProviderRouter(providers, hedge_quantile=0.95)
+    await run("primaire en panne", router, args.requests, args.concurrency)
+    for p in providers:
+        await p.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du routage entre fournisseurs")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="latence normale du primaire (s)")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="part des appels lents du primaire")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="latence des appels lents (s)")
+    parser.add_argument("--local-latency", type=float, default=0.6, help="latence du serveur local (s)")
+    args = parser.parse_args()
+
+    primary_app = create_app(args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+    serve_in_thread(primary_app, PRIMARY_PORT)
+    serve_in_thread(create_app(args.local_latency), LOCAL_PORT)
+    asyncio.run(scenarios(args, primary_app))
+
+
+if __name__ == "__main__":
+    main()
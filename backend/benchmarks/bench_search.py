@@ -0,0 +1,78 @@
+"""Benchmark de la recherche plein texte (FTS5) dans l'historique.
+
+    python -m benchmarks.bench_search --messages 2000000 --students 5000 --queries 500
+
+Remplit une base temporaire avec des messages aléatoires (vocabulaire de
+quelques milliers de mots, dont des mots accentués), puis mesure la latence
+de search_chat_history pour des élèves et des requêtes tirés au hasard.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+
+COMMON_WORDS = ["la", "le", "les", "des", "une", "est", "dans", "pour", "que", "qui", "cellule", "méiose",
+                "mitose", "chromosome", "révolution", "guerre", "empire", "écosystème", "énergie", "génétique"]
+SYLLABLES = ["ba", "ce", "di", "fo", "gu", "la", "mé", "no", "pi", "ré", "sa", "té", "vo", "zé", "tion", "ment"]
+
+
+def vocabulary(size, rng):
+    words = set(COMMON_WORDS)
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def fill(db, messages, students, rng, words, batch=50000):
+    start = time.perf_counter()
+    for first in range(0, messages, batch):
+        rows = []
+        for _ in range(min(batch, messages - first)):
+            student_id = f"eleve_{rng.randrange(students)}"
+            subject = rng.choice(("svt", "histoire_geo"))
+            content = " ".join(rng.choice(words) for _ in range(rng.randint(8, 40)))
+            rows.append((student_id, subject, rng.choice(("user", "assistant")), content))
+        db.write_batch(messages=rows)
+    elapsed = time.perf_counter() - start
+    print(f"{messages} messages insérés (index compris) en {elapsed:.1f}s : {messages / elapsed:.0f} messages/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la recherche dans l'historique")
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary(3000, rng)
+    db = Database(os.path.join(tempfile.mkdtemp(prefix="tuteur-bench-search-"), "bench.db"))
+    fill(db, args.messages, args.students, rng, words)
+
+    latencies = []
+    found = 0
+    for _ in range(args.queries):
+        student_id = f"eleve_{rng.randrange(args.students)}"
+        subject = rng.choice(("svt", "histoire_geo"))
+        query = " ".join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+        start = time.perf_counter()
+        results = db.search_chat_history(subject, query, limit=20, student_id=student_id)
+        latencies.append(time.perf_counter() - start)
+        found += len(results)
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{args.queries} recherches : p50 {statistics.median(latencies) * 1000:.2f} ms, "
+          f"p95 {p95 * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms, {found / args.queries:.1f} résultats en moyenne")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""Suite de benchmarks de bout en bout : scénarios de trafic à concurrence croissante.
+
+    python -m benchmarks.bench_suite
+    python -m benchmarks.bench_suite --scenarios chat,quiz --concurrency 1,8,32 --profile
+    python -m benchmarks.compare benchmarks/results/AVANT.json benchmarks/results/APRES.json
+
+Démarre le faux Groq (latence et débit de génération réglables) puis
+l'application de main.py, chacun dans un thread de ce processus, avec la
+base dans un dossier temporaire. Pour chaque scénario (voir scenarios.py) et
+chaque niveau de concurrence, rejoue ``--requests`` requêtes tirées avec une
+graine fixe et mesure le débit, les latences p50/p95/p99 (globales et par
+type de requête) et les erreurs. Les résultats, avec les paramètres, le
+commit git et la machine, sont écrits en JSON dans benchmarks/results/ ;
+``--baseline`` les compare aussitôt à un résultat précédent.
+
+``--profile`` active cProfile dans le thread du serveur pendant chaque
+scénario : un fichier .prof par scénario, à côté du JSON (à ouvrir avec snakeviz,
+flameprof...), et les fonctions les plus coûteuses dans le JSON. ``--py-spy``
+enregistre en plus un profil échantillonné au format speedscope, si py-spy
+est installé. Le profilage ralentit le serveur : comparer des résultats
+obtenus avec les mêmes options.
+"""
+import argparse
+import asyncio
+import cProfile
+import json
+import os
+import platform
+import pstats
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+import httpx
+from benchmarks.compare import compare, print_comparison
+from benchmarks.fake_groq import create_app, serve_in_thread
+from benchmarks.scenarios import SCENARIOS, TOPICS, Workload
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+FAKE_GROQ_PORT = 9600
+APP_PORT = 9601
+PROFILE_TOP = 25
+
+
+def start_backend():
+    """Importe main avec une base neuve et un faux Groq sans quota, puis le sert dans un thread"""
+    os.environ.update(
+        GROQ_API_KEY="gsk_benchmark",
+        GROQ_API_URL=f"http://127.0.0.1:{FAKE_GROQ_PORT}/openai/v1/chat/completions",
+        GROQ_RATE_LIMIT_RPM="0",
+        GROQ_MAX_CONCURRENT="1000",
+        GROQ_MAX_QUEUE="10000",
+        # Pas de tâche de fond pendant les mesures, ni de fournisseur ou d'état partagé venus d'un .env
+        TUTEUR_QUIZ_POOL_TARGET="0",
+        TUTEUR_ANALYTICS_INTERVAL="0",
+        LOCAL_LLM_URL="",
+        TUTEUR_SHARED_STATE="",
+    )
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tempfile.mkdtemp(prefix="tuteur-bench-suite-"))
+    import main
+    return serve_in_thread(main.app, APP_PORT)
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {"count": 0}
+    ordered = sorted(latencies)
+
+    def pct(q):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+async def send(client, kind, method, path, body):
+    """Envoie une requête ; renvoie (succès, réponse JSON ou None)"""
+    if kind == "chat_stream":
+        async with client.stream(method, path, json=body) as response:
+            content = await response.aread()
+        return response.status_code == 200 and b"event: error" not in content, None
+    response = await client.request(method, path, json=body)
+    if response.status_code != 200:
+        return False, None
+    return True, response.json()
+
+
+async def seed_quizzes(client, workload):
+    """Génère un quiz par thème pour que les soumissions portent sur des quiz existants"""
+    for subject, topics in TOPICS.items():
+        for topic in topics:
+            ok, data = await send(client, "quiz_generate", "POST", "/quiz/generate", {
+                "subject": subject, "topic": topic, "difficulty": "moyen", "num_questions": 5
+            })
+            if ok:
+                workload.quiz_ids.append(data["quiz_id"])
+
+
+async def run_level(client, workload, total, concurrency):
+    # Requêtes tirées à l'avance : même séquence d'un lancement à l'autre
+    planned = [(kind, *workload.request(kind)) for kind in (workload.next_kind() for _ in range(total))]
+    latencies = {kind: [] for kind in workload.kinds}
+    errors = {}
+    pending = iter(planned)
+
+    async def worker():
+        for kind, method, path, body in pending:
+            start = time.perf_counter()
+            try:
+                ok, _ = await send(client, kind, method, path, body)
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies[kind].append(time.perf_counter() - start)
+            else:
+                errors[kind] = errors.get(kind, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    succeeded = [latency for values in latencies.values() for latency in values]
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": sum(errors.values()),
+        "errors_by_kind": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(succeeded) / elapsed, 1),
+        "latency_ms": percentiles(succeeded),
+        "by_kind": {kind: percentiles(values) for kind, values in latencies.items()},
+    }
+
+
+def in_server_thread(server, fn):
+    """Exécute ``fn`` dans le thread du serveur (cProfile ne profile que le thread qui l'active)"""
+    done = threading.Event()
+
+    def call():
+        try:
+            fn()
+        finally:
+            done.set()
+
+    server.loop.call_soon_threadsafe(call)
+    done.wait()
+
+
+def profile_summary(profiler):
+    """Fonctions les plus coûteuses : en temps propre (hors attente de la boucle
+    d'événements) et, pour le code du backend, en temps cumulé"""
+    def label(filename, line, name):
+        if filename.startswith(BACKEND_DIR):
+            filename = os.path.relpath(filename, BACKEND_DIR)
+        return f"{filename}:{line}({name})"
+
+    def row(key, values):
+        _, calls, tottime, cumtime, _ = values
+        return {"function": label(*key), "calls": calls,
+                "tottime_s": round(tottime, 4), "cumtime_s": round(cumtime, 4)}
+
+    entries = pstats.Stats(profiler).stats.items()
+    busy = [(key, values) for key, values in entries if "select." not in key[2]]
+    backend = [(key, values) for key, values in entries
+               if key[0].startswith(BACKEND_DIR) and not key[0].startswith(os.path.join(BACKEND_DIR, "benchmarks"))]
+    return {
+        "self": [row(*item) for item in sorted(busy, key=lambda item: item[1][2], reverse=True)[:PROFILE_TOP]],
+        "backend": [row(*item) for item in sorted(backend, key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]],
+    }
+
+
+def start_py_spy(path):
+    if shutil.which("py-spy") is None:
+        print("⚠️ py-spy introuvable : profil échantillonné ignoré")
+        return None
+    return subprocess.Popen(
+        ["py-spy", "record", "--pid", str(os.getpid()), "--format", "speedscope", "--output", path, "--nonblocking"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def run_scenario(name, args, server, fake_groq, output_prefix):
+    limits = httpx.Limits(max_connections=max(args.concurrency_levels))
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{APP_PORT}", limits=limits, timeout=120) as client:
+        workload = Workload(name, students=args.students, seed=args.seed)
+        if "quiz_submit" in workload.mix:
+            await seed_quizzes(client, workload)
+        await run_level(client, workload, args.warmup, 1)
+
+        profiler = cProfile.Profile() if args.profile else None
+        spy = start_py_spy(f"{output_prefix}-{name}.speedscope.json") if args.py_spy else None
+        if profiler is not None:
+            in_server_thread(server, profiler.enable)
+        calls_before = fake_groq.state.calls
+        cache_before = (await client.get("/cache/stats")).json()
+        levels = []
+        for concurrency in args.concurrency_levels:
+            level = await run_level(client, workload, args.requests, concurrency)
+            levels.append(level)
+            latency = level["latency_ms"]
+            print(f"{name:<16} c={concurrency:<4} {level['throughput_rps']:8.1f} req/s  "
+                  f"p50 {latency.get('p50_ms', float('nan')):8.1f} ms  p95 {latency.get('p95_ms', float('nan')):8.1f} ms  "
+                  f"p99 {latency.get('p99_ms', float('nan')):8.1f} ms  erreurs {level['errors']}")
+        if profiler is not None:
+            in_server_thread(server, profiler.disable)
+        if spy is not None:
+            spy.send_signal(signal.SIGINT)
+            spy.wait(timeout=60)
+
+        cache_after = (await client.get("/cache/stats")).json()
+        cache = {key: cache_after[key] - cache_before[key]
+                 for key in ("hits", "similar_hits", "shared_hits", "misses", "bypassed")}
+        served = cache["hits"] + cache["similar_hits"] + cache["shared_hits"]
+        cache["hit_rate"] = round(served / (served + cache["misses"]), 4) if served + cache["misses"] else 0.0
+        server_stats = {"upstream_calls": fake_groq.state.calls - calls_before, "response_cache": cache}
+
+    result = {"scenario": name, "levels": levels, "server": server_stats}
+    if profiler is not None:
+        profile_path = f"{output_prefix}-{name}.prof"
+        profiler.dump_stats(profile_path)
+        result["profile"] = {"file": os.path.basename(profile_path), "top": profile_summary(profiler)}
+    return result
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks de bout en bout")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"parmi {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32,128", help="niveaux de concurrence successifs")
+    parser.add_argument("--requests", type=int, default=400, help="requêtes par niveau")
+    parser.add_argument("--warmup", type=int, default=20, help="requêtes non mesurées avant chaque scénario")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency", type=float, default=0.2, help="latence du faux Groq avant le premier mot (s)")
+    parser.add_argument("--token-rate", type=float, default=200, help="mots générés par seconde par le faux Groq")
+    parser.add_argument("--profile", action="store_true", help="cProfile du serveur pendant chaque scénario")
+    parser.add_argument("--py-spy", action="store_true", help="profil py-spy (speedscope) pendant chaque scénario")
+    parser.add_argument("--output", help="fichier JSON des résultats (défaut : benchmarks/results/<date>-<commit>.json)")
+    parser.add_argument("--baseline", help="résultat précédent auquel comparer")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="écart toléré avant de signaler une régression")
+    args = parser.parse_args()
+    args.concurrency_levels = [int(c) for c in args.concurrency.split(",")]
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+
+    commit, dirty = git_revision()
+    started = datetime.now()
+    output = os.path.abspath(args.output or os.path.join(
+        RESULTS_DIR, f"{started:%Y%m%d-%H%M%S}-{commit or 'sans-git'}.json"
+    ))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    output_prefix = output[:-len(".json")] if output.endswith(".json") else output
+
+    fake_groq = create_app(args.latency, token_rate=args.token_rate)
+    serve_in_thread(fake_groq, FAKE_GROQ_PORT)
+    server = start_backend()
+
+    results = [asyncio.run(run_scenario(name, args, server, fake_groq, output_prefix)) for name in scenarios]
+    report = {
+        "meta": {
+            "date": started.isoformat(timespec="seconds"),
+            "git_commit": commit,
+            "git_dirty": dirty,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "scenarios": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ Résultats écrits dans {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = print_comparison(compare(baseline, report, args.tolerance))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Test de charge du déploiement multi-processus : débit selon le nombre de workers.
+
+    python -m benchmarks.bench_workers --workers 1,2,4 --duration 15
+
+Pour chaque nombre de workers, lance ``python serve.py`` (base et état
+partagé dans un dossier temporaire, faux Groq local), puis plusieurs
+processus clients qui mélangent pendant ``--duration`` secondes des lectures
+(/progress, /history, /leaderboard) et des échanges /chat avec des élèves tirés
+au hasard. Affiche le débit et les latences p50/p95/p99.
+
+Les clients tournent sur la même machine que le serveur : pour mesurer le
+serveur seul, les lancer depuis une autre machine avec ``--url``.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_GROQ_PORT = 9400
+APP_PORT = 9401
+SUBJECTS = ("svt", "histoire_geo")
+# (poids, méthode, chemin) ; {s} = matière, {e} = élève
+MIX = [
+    (4, "GET", "/progress/{s}?student_id={e}"),
+    (3, "GET", "/history/{s}?student_id={e}&limit=20"),
+    (2, "GET", "/leaderboard?student_id={e}"),
+    (1, "POST", "/chat"),
+]
+
+
+async def client_loop(url, duration, concurrency, students, seed):
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    weights = [weight for weight, _, _ in MIX]
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                _, method, path = rng.choices(MIX, weights)[0]
+                student = f"eleve_{rng.randrange(students)}"
+                subject = rng.choice(SUBJECTS)
+                start = time.perf_counter()
+                try:
+                    if method == "GET":
+                        response = await client.get(path.format(s=subject, e=student))
+                    else:
+                        response = await client.post(path, json={
+                            "message": f"Explique-moi la notion numéro {rng.randrange(10 ** 6)} du programme",
+                            "subject": subject, "student_id": student
+                        })
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run_client(args):
+    return asyncio.run(client_loop(*args))
+
+
+def wait_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url + "/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Le serveur ne répond pas sur {url}")
+
+
+def start_server(workers, latency):
+    env = dict(
+        os.environ,
+        TUTEUR_WORKERS=str(workers),
+        PORT=str(APP_PORT),
+        HOST="127.0.0.1",
+        GROQ_API_KEY="gsk_benchmark",
+        GROQ_API_URL=f"http://127.0.0.1:{FAKE_GROQ_PORT}/openai/v1/chat/completions",
+        GROQ_RATE_LIMIT_RPM="0",
+        GROQ_MAX_CONCURRENT="1000",
+        GROQ_MAX_QUEUE="10000",
+        TUTEUR_QUIZ_POOL_TARGET="0",
+        TUTEUR_ANALYTICS_INTERVAL="0",
+    )
+    return subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "serve.py")],
+        cwd=tempfile.mkdtemp(prefix="tuteur-bench-workers-"), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def measure(url, args):
+    jobs = [(url, args.duration, args.concurrency, args.students, seed) for seed in range(args.clients)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.clients) as pool:
+        results = pool.map(run_client, jobs)
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for result, _ in results for latency in result)
+    errors = sum(count for _, count in results)
+    return latencies, errors, elapsed
+
+
+def report(label, latencies, errors, elapsed):
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000 if latencies else float("nan")
+
+    print(f"{label:<12} {len(latencies) / elapsed:8.0f} req/s  p50 {pct(0.5):6.1f} ms  "
+          f"p95 {pct(0.95):6.1f} ms  p99 {pct(0.99):6.1f} ms  erreurs {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge multi-workers")
+    parser.add_argument("--workers", default="1,2,4", help="nombres de workers à comparer")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--clients", type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help="processus clients")
+    parser.add_argument("--concurrency", type=int, default=32, help="requêtes en cours par client")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05, help="latence du faux Groq (s)")
+    parser.add_argument("--url", help="serveur déjà lancé (sinon lancé ici pour chaque nombre de workers)")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cœur(s), {args.clients} processus client(s) x {args.concurrency} requêtes en cours")
+    if args.url:
+        report("serveur", *measure(args.url.rstrip("/"), args))
+        return
+
+    fake_groq = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_groq", "--port", str(FAKE_GROQ_PORT), "--latency", str(args.latency)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{APP_PORT}"
+    try:
+        for workers in [int(w) for w in args.workers.split(",")]:
+            server = start_server(workers, args.latency)
+            try:
+                wait_ready(url)
+                report(f"{workers} worker(s)", *measure(url, args))
+            finally:
+                server.terminate()
+                server.wait(timeout=60)
+    finally:
+        fake_groq.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare deux résultats de bench_suite et signale les régressions.
+
+    python -m benchmarks.compare benchmarks/results/AVANT.json benchmarks/results/APRES.json --tolerance 0.1
+
+Pour chaque couple (scénario, concurrence) présent dans les deux fichiers :
+débit et latences p50/p95/p99 avant et après. Une baisse du débit ou une
+hausse du p95 au-delà de la tolérance est une régression (code de sortie 1).
+Le p99, trop bruité sur quelques centaines de requêtes, est affiché sans
+être jugé.
+"""
+import argparse
+import json
+import sys
+
+
+def index_levels(report):
+    return {
+        (scenario["scenario"], level["concurrency"]): level
+        for scenario in report["scenarios"]
+        for level in scenario["levels"]
+    }
+
+
+def relative_change(before, after):
+    if not before:
+        return 0.0
+    return (after - before) / before
+
+
+def compare(baseline, current, tolerance=0.10):
+    """Lignes de comparaison (dict) pour les niveaux communs aux deux résultats"""
+    before_levels = index_levels(baseline)
+    rows = []
+    for key, after in index_levels(current).items():
+        before = before_levels.get(key)
+        if before is None:
+            continue
+        throughput = relative_change(before["throughput_rps"], after["throughput_rps"])
+        p95 = relative_change(before["latency_ms"].get("p95_ms"), after["latency_ms"].get("p95_ms", 0))
+        rows.append({
+            "scenario": key[0],
+            "concurrency": key[1],
+            "throughput_rps": (before["throughput_rps"], after["throughput_rps"], throughput),
+            "p50_ms": (before["latency_ms"].get("p50_ms"), after["latency_ms"].get("p50_ms")),
+            "p95_ms": (before["latency_ms"].get("p95_ms"), after["latency_ms"].get("p95_ms"), p95),
+            "p99_ms": (before["latency_ms"].get("p99_ms"), after["latency_ms"].get("p99_ms")),
+            "errors": (before["errors"], after["errors"]),
+            "regression": throughput < -tolerance or p95 > tolerance or after["errors"] > before["errors"],
+        })
+    return rows
+
+
+def print_comparison(rows):
+    """Affiche le tableau ; renvoie le nombre de régressions"""
+    print(f"{'scénario':<16} {'c':>4} {'débit (req/s)':>24} {'p95 (ms)':>26} {'p99 (ms)':>20} {'erreurs':>9}")
+    for row in rows:
+        rps_before, rps_after, rps_change = row["throughput_rps"]
+        p95_before, p95_after, p95_change = row["p95_ms"]
+        p99_before, p99_after = row["p99_ms"]
+        errors_before, errors_after = row["errors"]
+        flag = "  ⚠️ régression" if row["regression"] else ""
+        print(f"{row['scenario']:<16} {row['concurrency']:>4} "
+              f"{rps_before:>8.1f} → {rps_after:>7.1f} {rps_change:+6.0%} "
+              f"{p95_before or 0:>8.1f} → {p95_after or 0:>7.1f} {p95_change:+6.0%} "
+              f"{p99_before or 0:>8.1f} → {p99_after or 0:>7.1f} "
+              f"{errors_before:>4} → {errors_after:<3}{flag}")
+    regressions = sum(row["regression"] for row in rows)
+    if not rows:
+        print("⚠️ Aucun scénario commun aux deux résultats")
+    elif regressions:
+        print(f"❌ {regressions} régression(s)")
+    else:
+        print("✅ Pas de régression")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare deux résultats de bench_suite")
+    parser.add_argument("baseline", help="résultat de référence")
+    parser.add_argument("current", help="nouveau résultat")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="écart toléré (0.10 = 10 %%)")
+    args = parser.parse_args()
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    sys.exit(1 if print_comparison(compare(baseline, current, args.tolerance)) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Faux serveur Groq (API compatible OpenAI) pour les benchmarks.
+
+Répond à POST /openai/v1/chat/completions après une latence configurable,
+sans jamais contacter le vrai service. ``failure_rate`` simule un service
+instable : une part des requêtes reçoit un 429 (avec Retry-After) ou un 503.
+``slow_rate`` simule une latence à longue traîne : cette part des requêtes
+attend ``slow_latency`` au lieu de ``latency``. ``token_rate`` fixe le débit
+de génération (mots par seconde) : les fragments d'un flux sont espacés
+d'autant, et une réponse complète attend en plus le temps de la générer.
+
+    python -m benchmarks.fake_groq --port 9000 --latency 0.5 --failure-rate 0.2
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+QUIZ_JSON = json.dumps({
+    "title": "Quiz de test",
+    "questions": [
+        {
+            "question": f"Question {i + 1} ?",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "correct_answer": i % 4,
+            "explanation": "Explication de test"
+        }
+        for i in range(5)
+    ]
+})
+
+CHAT_TEXT = "Voici une explication détaillée pour t'aider à comprendre ce point du programme."
+
+
+def create_app(latency=0.5, failure_rate=0.0, slow_rate=0.0, slow_latency=5.0, token_rate=None):
+    app = FastAPI()
+    app.state.latency = latency
+    app.state.failure_rate = failure_rate
+    app.state.slow_rate = slow_rate
+    app.state.slow_latency = slow_latency
+    app.state.token_rate = token_rate
+    app.state.calls = 0
+
+    @app.post("/openai/v1/chat/completions")
+    async def completions(request: Request):
+        payload = await request.json()
+        app.state.calls += 1
+        if random.random() < app.state.failure_rate:
+            if random.random() < 0.5:
+                return JSONResponse({"error": {"message": "Rate limit reached"}}, status_code=429,
+                                    headers={"Retry-After": "1"})
+            return JSONResponse({"error": {"message": "Service unavailable"}}, status_code=503)
+        slow = random.random() < app.state.slow_rate
+        await asyncio.sleep(app.state.slow_latency if slow else app.state.latency)
+        is_quiz = "quiz" in payload["messages"][0]["content"].lower()
+        content = QUIZ_JSON if is_quiz else CHAT_TEXT
+        words = content.split(" ")
+        pace = 1 / app.state.token_rate if app.state.token_rate else 0.01
+        if payload.get("stream"):
+            return StreamingResponse(stream_chunks(words, pace), media_type="text/event-stream")
+        if app.state.token_rate:
+            await asyncio.sleep(len(words) * pace)
+        return {
+            "id": "fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": len(content) // 4, "total_tokens": 100 + len(content) // 4}
+        }
+
+    return app
+
+
+async def stream_chunks(words, pace):
+    """Envoie la réponse mot par mot au format SSE d'OpenAI, un fragment toutes les ``pace`` secondes"""
+    for word in words:
+        chunk = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(pace)
+    completion_tokens = sum(len(word) + 1 for word in words) // 4
+    usage = {"prompt_tokens": 100, "completion_tokens": completion_tokens, "total_tokens": 100 + completion_tokens}
+    yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def serve_in_thread(app, port):
+    """Démarre un serveur uvicorn dans un thread et attend qu'il soit prêt.
+
+    ``server.loop`` est la boucle d'événements de ce thread : on peut y
+    planifier des appels (``loop.call_soon_threadsafe``), par exemple pour
+    activer un profileur dans le thread du serveur.
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server.loop = asyncio.new_event_loop()
+
+    def run():
+        asyncio.set_event_loop(server.loop)
+        server.loop.run_until_complete(server.serve())
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Faux serveur Groq")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--token-rate", type=float, default=None, help="mots générés par seconde")
+    args = parser.parse_args()
+    app = create_app(args.latency, args.failure_rate, args.slow_rate, args.slow_latency, args.token_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,86 @@
+"""Mélanges de trafic rejoués par la suite de benchmarks (bench_suite).
+
+Un scénario est une liste pondérée de types de requêtes. Workload construit
+chaque requête de façon déterministe (graine fixe) : élèves tirés dans une
+population donnée, questions fréquentes mêlées de questions uniques (pour
+un taux de succès du cache réaliste), quiz sur une poignée de thèmes
+populaires, copies soumises sur des quiz réellement générés.
+"""
+import random
+
+SCENARIOS = {
+    # Élèves qui consultent leur tableau de bord
+    "tableau_de_bord": {"progress": 45, "leaderboard": 35, "history": 20},
+    # Classe en activité : un peu de tout
+    "classe": {"chat": 30, "quiz_generate": 10, "quiz_submit": 20, "progress": 25, "leaderboard": 15},
+    # Conversation avec le tuteur, réponses complètes ou en flux
+    "chat": {"chat": 70, "chat_stream": 30},
+    # Séance de quiz
+    "quiz": {"quiz_generate": 40, "quiz_submit": 60},
+}
+
+SUBJECTS = ("svt", "histoire_geo")
+TOPICS = {
+    "svt": ("La photosynthèse", "La cellule", "La génétique", "Les écosystèmes"),
+    "histoire_geo": ("La Révolution française", "La Première Guerre mondiale", "La mondialisation", "L'Empire romain"),
+}
+POPULAR_QUESTIONS = {
+    "svt": ("Explique-moi la photosynthèse simplement", "Quelle est la différence entre mitose et méiose ?",
+            "Comment fonctionne l'ADN dans une cellule ?"),
+    "histoire_geo": ("Quelles sont les causes de la Révolution française ?",
+                     "Pourquoi la Première Guerre mondiale a-t-elle éclaté ?",
+                     "Qu'est-ce que la mondialisation économique ?"),
+}
+POPULAR_SHARE = 0.3  # part des questions de chat qui reviennent souvent
+VOCABULARY = ("rôle", "causes", "conséquences", "exemple", "schéma", "définition", "étapes", "acteurs",
+              "chronologie", "enjeux", "mécanisme", "limites", "comparaison", "origine", "évolution",
+              "carte", "document", "expérience", "hypothèse", "bilan", "source", "échelle", "impact",
+              "résumé", "vocabulaire", "méthode", "argument", "contexte", "fonction", "structure")
+
+
+class Workload:
+    """Fabrique les requêtes d'un scénario"""
+
+    def __init__(self, scenario, students=500, seed=42):
+        self.mix = SCENARIOS[scenario]
+        self.kinds = list(self.mix)
+        self.weights = [self.mix[kind] for kind in self.kinds]
+        self.students = students
+        self.rng = random.Random(seed)
+        self.quiz_ids = []  # quiz générés, pour les soumissions (alimenté par bench_suite)
+
+    def next_kind(self):
+        return self.rng.choices(self.kinds, self.weights)[0]
+
+    def request(self, kind):
+        """(méthode, chemin, corps JSON) de la prochaine requête de ce type"""
+        student = f"eleve_{self.rng.randrange(self.students)}"
+        subject = self.rng.choice(SUBJECTS)
+        if kind in ("chat", "chat_stream"):
+            path = "/chat" if kind == "chat" else "/chat/stream"
+            return "POST", path, {"message": self._question(subject), "subject": subject, "student_id": student}
+        if kind == "quiz_generate":
+            return "POST", "/quiz/generate", {
+                "subject": subject, "topic": self.rng.choice(TOPICS[subject]),
+                "difficulty": "moyen", "num_questions": 5, "student_id": student
+            }
+        if kind == "quiz_submit":
+            return "POST", "/quiz/submit", {
+                "quiz_id": self.rng.choice(self.quiz_ids),
+                "answers": [self.rng.randrange(4) for _ in range(5)],
+                "student_id": student
+            }
+        if kind == "progress":
+            return "GET", f"/progress/{subject}?student_id={student}", None
+        if kind == "leaderboard":
+            return "GET", f"/leaderboard?student_id={student}", None
+        if kind == "history":
+            return "GET", f"/history/{subject}?student_id={student}&limit=20", None
+        raise ValueError(f"Type de requête inconnu: {kind}")
+
+    def _question(self, subject):
+        if self.rng.random() < POPULAR_SHARE:
+            return self.rng.choice(POPULAR_QUESTIONS[subject])
+        # Mots tirés au hasard : assez éloignés des autres questions pour ne pas profiter du cache
+        topic = self.rng.choice(TOPICS[subject])
+        return f"{topic} : {' '.join(self.rng.sample(VOCABULARY, 5))} ?"
@@ -0,0 +1,111 @@
+import os
+import re
+from database import NO_LIMIT_ID
+
+CHARS_PER_TOKEN = 4      # estimation locale, suffisante pour du français
+MESSAGE_OVERHEAD = 4     # jetons ajoutés par message (rôle, séparateurs)
+SUMMARY_LINE_CHARS = 160
+
+
+def estimate_tokens(text):
+    """Nombre de jetons approximatif, sans tokenizer"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def first_sentence(text, max_chars=SUMMARY_LINE_CHARS):
+    text = " ".join(text.split())
+    match = re.match(r"(.+?[.!?])(\s|$)", text)
+    sentence = match.group(1) if match else text
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars - 1].rstrip() + "…"
+    return sentence
+
+
+class ContextBuilder:
+    """Assemble le contexte envoyé au LLM dans un budget de jetons fixe.
+
+    L'historique est lu par petites pages, du plus récent au plus ancien, et
+    s'arrête dès que le budget est atteint. Les échanges qui sortent de la
+    fenêtre sont condensés dans un résumé par élève et par matière, stocké en
+    base et complété à chaque débordement : la taille du prompt reste stable
+    quelle que soit la longueur de la conversation.
+    """
+
+    def __init__(self, history_budget=1500, summary_budget=300, page_size=8, max_summarized_per_update=50):
+        self.history_budget = history_budget
+        self.summary_budget = summary_budget
+        self.page_size = page_size
+        self.max_summarized_per_update = max_summarized_per_update
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            history_budget=int(os.getenv("TUTEUR_CONTEXT_TOKENS", "1500")),
+            summary_budget=int(os.getenv("TUTEUR_SUMMARY_TOKENS", "300")),
+        )
+
+    def build(self, store, subject, student_id, system_prompt, question):
+        """Renvoie (messages, historique retenu dans l'ordre chronologique)"""
+        history, oldest_kept_id, overflowed = self._pack_history(store, subject, student_id)
+
+        summary, summarized_until_id = store.get_conversation_summary(subject, student_id=student_id)
+        if overflowed and oldest_kept_id - 1 > summarized_until_id:
+            summary = self._update_summary(store, subject, student_id, summary, summarized_until_id, oldest_kept_id)
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if summary:
+            messages.append({
+                "role": "system",
+                "content": f"Résumé des échanges précédents avec l'élève :\n{summary}"
+            })
+        messages.extend({"role": h["role"], "content": h["content"]} for h in history)
+        messages.append({"role": "user", "content": question})
+        return messages, history
+
+    def _pack_history(self, store, subject, student_id):
+        """Prend les messages les plus récents tant qu'ils tiennent dans le budget"""
+        packed = []
+        used = 0
+        before_id = NO_LIMIT_ID
+        while True:
+            page = store.get_messages_before(subject, before_id, self.page_size, student_id=student_id)
+            for row in page:
+                cost = estimate_tokens(row["content"]) + MESSAGE_OVERHEAD
+                if used + cost > self.history_budget:
+                    packed.reverse()
+                    return packed, before_id, True
+                packed.append(row)
+                used += cost
+                before_id = row["id"]
+            if len(page) < self.page_size:
+                packed.reverse()
+                return packed, before_id, False
+
+    def _update_summary(self, store, subject, student_id, summary, summarized_until_id, oldest_kept_id):
+        """Ajoute au résumé les messages sortis de la fenêtre depuis la dernière mise à jour.
+
+        On avance depuis ``summarized_until_id`` dans l'ordre chronologique, au
+        plus ``max_summarized_per_update`` messages par appel : s'il en reste,
+        l'appel suivant reprend juste après le dernier message résumé.
+        """
+        rows = store.get_messages_between(
+            subject, summarized_until_id, oldest_kept_id, self.max_summarized_per_update,
+            student_id=student_id
+        )
+        if not rows:
+            return summary
+
+        lines = summary.splitlines() if summary else []
+        for row in rows:
+            if row["role"] == "user":
+                lines.append(f"- L'élève a demandé : {first_sentence(row['content'])}")
+            else:
+                lines.append(f"  Réponse : {first_sentence(row['content'])}")
+
+        # Les plus anciennes lignes disparaissent en premier
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+        summary = "\n".join(lines)
+
+        store.save_conversation_summary(subject, summary, rows[-1]["id"], student_id=student_id)
+        return summary
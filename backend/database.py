@@ -1,22 +1,573 @@
+import heapq
+import html
+import os
+import re
 import sqlite3
-from datetime import datetime
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
 import json
+from text_utils import normalize_text
+from write_behind import WriteBehind
+from quiz_parser import answer_key
+from shared_state import LocalVersions, SharedVersions
+
+# Réglages SQLite appliqués à chaque connexion
+PRAGMAS = {
+    "auto_vacuum": "INCREMENTAL",  # nouveaux fichiers : pages libérées rendues par incremental_vacuum
+    "journal_mode": "WAL",       # lecteurs et écrivain ne se bloquent plus mutuellement
+    "synchronous": "NORMAL",     # sûr en WAL, un fsync par checkpoint au lieu d'un par commit
+    "cache_size": -16000,        # 16 Mo de cache de pages
+    "mmap_size": 134217728,      # 128 Mo lus via mmap
+    "temp_store": "MEMORY",
+}
+BUSY_TIMEOUT = 5.0               # secondes d'attente quand la base est verrouillée (TUTEUR_BUSY_TIMEOUT)
+STATEMENT_CACHE_SIZE = 256       # requêtes préparées conservées par connexion
+
+DEFAULT_STUDENT = "default_student"
+STATS_CACHE_SIZE = 10000         # statistiques (élève, matière) gardées en mémoire
+RANKING_KEY = ("classement",)    # version du classement, changée par toute écriture de points
+NO_LIMIT_ID = 2 ** 63 - 1
+ARCHIVE_COMPRESSION = 9          # niveau zlib des blocs d'archive (écrits en tâche de fond)
+VACUUM_STEP_PAGES = 1000         # pages rendues au système par transaction d'incremental_vacuum
+
+
+def rebuild_summary(conn):
+    """Remplit student_summary et student_totals à partir de progress et quiz_results"""
+    conn.execute("DELETE FROM student_summary")
+    conn.execute("DELETE FROM student_totals")
+    # Une ligne compactée (compact_progress) compte pour ``details.compacted`` activités
+    conn.execute("""
+        INSERT INTO student_summary (student_id, subject, total_points, interactions)
+        SELECT student_id, subject, COALESCE(SUM(points), 0),
+               COALESCE(SUM(CASE WHEN activity_type = 'interaction'
+                                 THEN COALESCE(json_extract(details, '$.compacted'), 1) ELSE 0 END), 0)
+        FROM progress GROUP BY student_id, subject
+    """)
+    conn.execute("""
+        INSERT INTO student_summary (student_id, subject, quizzes_completed, score_sum, best_score)
+        SELECT student_id, subject, COUNT(*), COALESCE(SUM(score), 0), COALESCE(MAX(score), 0)
+        FROM quiz_results WHERE true GROUP BY student_id, subject
+        ON CONFLICT(student_id, subject) DO UPDATE SET
+            quizzes_completed = excluded.quizzes_completed,
+            score_sum = excluded.score_sum,
+            best_score = excluded.best_score
+    """)
+    conn.execute("""
+        INSERT INTO student_totals (student_id, total_points, quizzes_completed)
+        SELECT student_id, SUM(total_points), SUM(quizzes_completed)
+        FROM student_summary GROUP BY student_id
+    """)
+
+def pack_archive(rows):
+    """Bloc d'archive : liste JSON [id, rôle, contenu, date] compressée"""
+    messages = [[row["id"], row["role"], row["content"], row["timestamp"]] for row in rows]
+    return zlib.compress(json.dumps(messages, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+                         ARCHIVE_COMPRESSION)
+
+def unpack_archive(data):
+    return [
+        {"id": message_id, "role": role, "content": content, "timestamp": timestamp}
+        for message_id, role, content, timestamp in json.loads(zlib.decompress(data))
+    ]
+
+def compacted_count(details):
+    """Nombre d'activités représentées par une ligne de progress"""
+    if not details:
+        return 1
+    return json.loads(details).get("compacted", 1)
+
+def shard_index(student_id, num_shards):
+    """Numéro de fichier d'un élève (hachage stable d'un processus à l'autre)"""
+    return zlib.crc32(student_id.encode("utf-8")) % num_shards
+
+# ========== MIGRATIONS ==========
+# Chaque migration reçoit une connexion déjà dans une transaction.
+# Ne jamais modifier une migration publiée : en ajouter une nouvelle.
+
+def _migration_subject_summary(conn):
+    # Synthèse par matière, tenue à jour à chaque écriture
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS subject_summary (
+            subject TEXT PRIMARY KEY,
+            total_points INTEGER NOT NULL DEFAULT 0,
+            interactions INTEGER NOT NULL DEFAULT 0,
+            quizzes_completed INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            best_score REAL NOT NULL DEFAULT 0
+        )
+    """)
+    # Base existante : remplir la synthèse depuis l'historique
+    conn.execute("DELETE FROM subject_summary")
+    conn.execute("""
+        INSERT INTO subject_summary (subject, total_points, interactions)
+        SELECT subject, COALESCE(SUM(points), 0), COALESCE(SUM(activity_type = 'interaction'), 0)
+        FROM progress GROUP BY subject
+    """)
+    conn.execute("""
+        INSERT INTO subject_summary (subject, quizzes_completed, score_sum, best_score)
+        SELECT subject, COUNT(*), COALESCE(SUM(score), 0), COALESCE(MAX(score), 0)
+        FROM quiz_results WHERE true GROUP BY subject
+        ON CONFLICT(subject) DO UPDATE SET
+            quizzes_completed = excluded.quizzes_completed,
+            score_sum = excluded.score_sum,
+            best_score = excluded.best_score
+    """)
+
+def _migration_hot_query_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_subject_timestamp ON chat_history (subject, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_progress_subject_activity ON progress (subject, activity_type, points)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_quiz_results_subject_completed ON quiz_results (subject, completed_at)")
+
+def _migration_student_scoping(conn):
+    # Chaque ligne appartient à un élève ; l'existant revient à l'élève par défaut
+    for table in ("chat_history", "progress", "quiz_results"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN student_id TEXT NOT NULL DEFAULT '{DEFAULT_STUDENT}'")
+    
+    # Le thème est recopié dans le résultat : plus de jointure avec quizzes,
+    # qui peut vivre dans un autre fichier quand la base est répartie
+    conn.execute("ALTER TABLE quiz_results ADD COLUMN topic TEXT")
+    conn.execute("UPDATE quiz_results SET topic = (SELECT topic FROM quizzes WHERE quizzes.id = quiz_results.quiz_id)")
+    
+    conn.execute("DROP INDEX IF EXISTS idx_chat_history_subject_timestamp")
+    conn.execute("DROP INDEX IF EXISTS idx_progress_subject_activity")
+    conn.execute("DROP INDEX IF EXISTS idx_quiz_results_subject_completed")
+    conn.execute("CREATE INDEX idx_chat_history_student_subject_timestamp ON chat_history (student_id, subject, timestamp)")
+    conn.execute("CREATE INDEX idx_progress_student_subject_activity ON progress (student_id, subject, activity_type, points)")
+    conn.execute("CREATE INDEX idx_quiz_results_student_subject_completed ON quiz_results (student_id, subject, completed_at)")
+    
+    # Synthèse par élève et par matière, plus un total par élève pour le classement
+    conn.execute("DROP TABLE IF EXISTS subject_summary")
+    conn.execute("""
+        CREATE TABLE student_summary (
+            student_id TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            total_points INTEGER NOT NULL DEFAULT 0,
+            interactions INTEGER NOT NULL DEFAULT 0,
+            quizzes_completed INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            best_score REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (student_id, subject)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE student_totals (
+            student_id TEXT PRIMARY KEY,
+            total_points INTEGER NOT NULL DEFAULT 0,
+            quizzes_completed INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX idx_student_totals_points ON student_totals (total_points)")
+    rebuild_summary(conn)
+
+def _migration_quiz_pool(conn):
+    # Caractéristiques de génération, pour retrouver un quiz déjà prêt
+    conn.execute("ALTER TABLE quizzes ADD COLUMN topic_key TEXT")
+    conn.execute("ALTER TABLE quizzes ADD COLUMN difficulty TEXT")
+    conn.execute("ALTER TABLE quizzes ADD COLUMN num_questions INTEGER")
+    rows = conn.execute("SELECT id, topic, quiz_data FROM quizzes").fetchall()
+    for row in rows:
+        try:
+            num_questions = len(json.loads(row["quiz_data"])["questions"])
+        except (ValueError, KeyError, TypeError):
+            num_questions = None
+        conn.execute(
+            "UPDATE quizzes SET topic_key = ?, num_questions = ? WHERE id = ?",
+            (normalize_text(row["topic"]), num_questions, row["id"])
+        )
+    conn.execute("""
+        CREATE INDEX idx_quizzes_pool ON quizzes (subject, topic_key, difficulty, num_questions)
+    """)
+    
+    # Quiz déjà proposés à chaque élève (pour ne jamais servir deux fois le même)
+    conn.execute("""
+        CREATE TABLE quiz_served (
+            student_id TEXT NOT NULL,
+            quiz_id INTEGER NOT NULL,
+            served_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (student_id, quiz_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_quiz_served_quiz ON quiz_served (quiz_id)")
+    
+    # Combinaisons demandées, pour savoir lesquelles pré-générer
+    conn.execute("""
+        CREATE TABLE quiz_demand (
+            subject TEXT NOT NULL,
+            topic_key TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            num_questions INTEGER NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            last_requested_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (subject, topic_key, difficulty, num_questions)
+        ) WITHOUT ROWID
+    """)
+
+def _migration_conversation_context(conn):
+    # Lecture de l'historique par pages, du plus récent au plus ancien, sur l'id
+    conn.execute("CREATE INDEX idx_chat_history_student_subject_id ON chat_history (student_id, subject, id)")
+    
+    # Résumé des anciens échanges, mis à jour au fil de l'eau
+    conn.execute("""
+        CREATE TABLE conversation_summary (
+            student_id TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            summary TEXT NOT NULL DEFAULT '',
+            summarized_until_id INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (student_id, subject)
+        ) WITHOUT ROWID
+    """)
+
+def _backfill_answer_keys(conn):
+    """Calcule la clé des quiz qui n'en ont pas (réponse en lettre ou en texte comprise)"""
+    rows = conn.execute("SELECT id, quiz_data FROM quizzes WHERE answer_key IS NULL").fetchall()
+    keys = []
+    for quiz_id, quiz_data in rows:
+        try:
+            keys.append((answer_key(json.loads(quiz_data)), quiz_id))
+        except (ValueError, KeyError, TypeError):
+            continue  # quiz illisible : la clé sera recalculée à la lecture si possible
+    conn.executemany("UPDATE quizzes SET answer_key = ? WHERE id = ?", keys)
+
+def _migration_quiz_answer_key(conn):
+    # Clé de correction à part du document JSON (« 0,2,1,3 ») : corriger sans relire tout le quiz
+    conn.execute("ALTER TABLE quizzes ADD COLUMN answer_key TEXT")
+    _backfill_answer_keys(conn)
+
+def _migration_legacy_answer_keys(conn):
+    # La migration 6 laissait sans clé les anciens quiz dont la réponse était « B » ou le texte
+    _backfill_answer_keys(conn)
+
+def _migration_chat_search(conn):
+    # Index plein texte de l'historique, tenu à jour par triggers. Le contenu n'est pas
+    # dupliqué : la table virtuelle relit chat_history (via une vue) pour les extraits.
+    # ``scope`` est un jeton unique par élève et matière (hex) : filtrer sur lui dans
+    # MATCH ne lit que la liste des messages de cet élève, même sur des millions de lignes.
+    conn.execute("""
+        CREATE VIEW chat_history_search_source AS
+        SELECT id, content, hex(student_id) || 'x' || hex(subject) AS scope FROM chat_history
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE chat_history_fts USING fts5(
+            content, scope,
+            content='chat_history_search_source', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER chat_history_fts_insert AFTER INSERT ON chat_history BEGIN
+            INSERT INTO chat_history_fts (rowid, content, scope)
+            VALUES (new.id, new.content, hex(new.student_id) || 'x' || hex(new.subject));
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER chat_history_fts_delete AFTER DELETE ON chat_history BEGIN
+            INSERT INTO chat_history_fts (chat_history_fts, rowid, content, scope)
+            VALUES ('delete', old.id, old.content, hex(old.student_id) || 'x' || hex(old.subject));
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER chat_history_fts_update AFTER UPDATE ON chat_history BEGIN
+            INSERT INTO chat_history_fts (chat_history_fts, rowid, content, scope)
+            VALUES ('delete', old.id, old.content, hex(old.student_id) || 'x' || hex(old.subject));
+            INSERT INTO chat_history_fts (rowid, content, scope)
+            VALUES (new.id, new.content, hex(new.student_id) || 'x' || hex(new.subject));
+        END
+    """)
+    # Classement bm25 sur le seul contenu ; trié par FTS5 lui-même (ORDER BY rank)
+    conn.execute("INSERT INTO chat_history_fts (chat_history_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+    conn.execute("INSERT INTO chat_history_fts (chat_history_fts) VALUES ('rebuild')")
+
+def _migration_chat_archive(conn):
+    # Anciens messages compressés par blocs (zlib d'une liste JSON), un bloc ne
+    # contenant que des messages d'un élève dans une matière, d'ids consécutifs
+    conn.execute("""
+        CREATE TABLE chat_archive (
+            id INTEGER PRIMARY KEY,
+            student_id TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            message_count INTEGER NOT NULL,
+            first_timestamp DATETIME,
+            last_timestamp DATETIME,
+            data BLOB NOT NULL
+        )
+    """)
+    # Pages vers le passé (first_id) et vers le présent (last_id)
+    conn.execute("CREATE INDEX idx_chat_archive_student_subject_first ON chat_archive (student_id, subject, first_id)")
+    conn.execute("CREATE INDEX idx_chat_archive_student_subject_last ON chat_archive (student_id, subject, last_id)")
+    # Dernier id déjà traité par la rétention, par table
+    conn.execute("""
+        CREATE TABLE retention_watermarks (
+            table_name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+MIGRATIONS = [
+    (1, "table de synthèse subject_summary", _migration_subject_summary),
+    (2, "index des requêtes fréquentes", _migration_hot_query_indexes),
+    (3, "données par élève (student_id) et classement", _migration_student_scoping),
+    (4, "réserve de quiz pré-générés", _migration_quiz_pool),
+    (5, "contexte de conversation (pages par id, résumé)", _migration_conversation_context),
+    (6, "clé de correction des quiz", _migration_quiz_answer_key),
+    (7, "recherche plein texte dans l'historique (FTS5)", _migration_chat_search),
+    (8, "archive compressée de l'historique", _migration_chat_archive),
+    (9, "clés de correction des anciens quiz (lettre ou texte)", _migration_legacy_answer_keys),
+]
+
+# ========== REQUÊTES FRÉQUENTES ==========
+# Utilisées telles quelles par Database et vérifiées par check_indexes()
+
+# Pages de l'historique sur l'id (croissant, unique) : ordre stable même pour
+# des messages de la même seconde, et coût constant quelle que soit la page
+SQL_CHAT_HISTORY = """SELECT id, role, content, timestamp FROM chat_history
+               WHERE student_id = ? AND subject = ? AND id < ? ORDER BY id DESC LIMIT ?"""
+
+SQL_CHAT_HISTORY_AFTER = """SELECT id, role, content, timestamp FROM chat_history
+               WHERE student_id = ? AND subject = ? AND id > ? ORDER BY id LIMIT ?"""
+
+SQL_MESSAGES_BEFORE = """SELECT id, role, content FROM chat_history
+               WHERE student_id = ? AND subject = ? AND id < ? ORDER BY id DESC LIMIT ?"""
+
+SQL_MESSAGES_BETWEEN = """SELECT id, role, content FROM chat_history
+               WHERE student_id = ? AND subject = ? AND id > ? AND id < ? ORDER BY id LIMIT ?"""
+
+# Blocs d'archive, lus seulement quand une page déborde de chat_history
+SQL_ARCHIVE_BEFORE = """SELECT data FROM chat_archive
+               WHERE student_id = ? AND subject = ? AND first_id < ? ORDER BY first_id DESC"""
+
+SQL_ARCHIVE_AFTER = """SELECT data FROM chat_archive
+               WHERE student_id = ? AND subject = ? AND last_id > ? ORDER BY last_id"""
+
+SQL_MESSAGES_TO_ARCHIVE = """SELECT id, role, content, timestamp FROM chat_history
+               WHERE student_id = ? AND subject = ? AND id < ? ORDER BY id LIMIT ?"""
+
+# Combinaisons (élève, matière, type) qui ont de nouvelles lignes à regrouper, et leur plus ancien jour
+SQL_PROGRESS_KEYS_TO_COMPACT = """SELECT student_id, subject, activity_type, MIN(date(timestamp)) AS first_day
+               FROM progress WHERE id > ? AND id < ?
+               GROUP BY student_id, subject, activity_type"""
+
+# Toutes les lignes de ces jours-là, y compris celles regroupées lors d'un passage précédent
+SQL_PROGRESS_TO_COMPACT = """SELECT id, points, details, date(timestamp) AS day FROM progress
+               WHERE student_id = ? AND subject = ? AND activity_type = ? AND id < ? AND timestamp >= ?"""
+
+SQL_CONVERSATION_SUMMARY = """SELECT summary, summarized_until_id FROM conversation_summary
+               WHERE student_id = ? AND subject = ?"""
+
+# Le contenu des extraits est échappé en Python : SNIPPET_START/END marquent les termes trouvés
+SNIPPET_START, SNIPPET_END = "\x02", "\x03"
+SEARCH_MAX_TERMS = 10
+
+SQL_SEARCH_HISTORY = """SELECT h.id, h.role, h.timestamp,
+                      snippet(chat_history_fts, 0, char(2), char(3), '…', 16) AS snippet,
+                      chat_history_fts.rank AS rank
+               FROM chat_history_fts
+               JOIN chat_history h ON h.id = chat_history_fts.rowid
+               WHERE chat_history_fts MATCH ? AND h.student_id = ? AND h.subject = ?
+               ORDER BY chat_history_fts.rank LIMIT ? OFFSET ?"""
+
+SQL_STUDENT_SUMMARY = """SELECT total_points, interactions, quizzes_completed, score_sum, best_score
+               FROM student_summary WHERE student_id = ? AND subject = ?"""
+
+SQL_RECENT_QUIZZES = """SELECT score, completed_at, topic
+               FROM quiz_results
+               WHERE student_id = ? AND subject = ?
+               ORDER BY completed_at DESC
+               LIMIT 5"""
+
+SQL_GET_QUIZ = "SELECT * FROM quizzes WHERE id = ?"
+
+SQL_POOLED_QUIZ = """SELECT id, subject, topic, quiz_data FROM quizzes q
+               WHERE subject = ? AND topic_key = ? AND difficulty = ? AND num_questions = ?
+                 AND NOT EXISTS (SELECT 1 FROM quiz_served s WHERE s.student_id = ? AND s.quiz_id = q.id)
+               ORDER BY id LIMIT 1"""
+
+SQL_TOP_STUDENTS = """SELECT student_id, total_points, quizzes_completed FROM student_totals
+               ORDER BY total_points DESC LIMIT ?"""
+
+SQL_STUDENTS_AHEAD = "SELECT COUNT(*) FROM student_totals WHERE total_points > ?"
+
+# ========== ÉCRITURES PAR LOTS ==========
+# Partagées par les écritures immédiates et par write_batch() (executemany)
+
+SQL_INSERT_MESSAGE = "INSERT INTO chat_history (student_id, subject, role, content) VALUES (?, ?, ?, ?)"
+
+SQL_INSERT_PROGRESS = """INSERT INTO progress (student_id, subject, activity_type, points, details)
+               VALUES (?, ?, ?, ?, ?)"""
+
+SQL_SUMMARY_PROGRESS = """INSERT INTO student_summary (student_id, subject, total_points, interactions)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT(student_id, subject) DO UPDATE SET
+                   total_points = total_points + excluded.total_points,
+                   interactions = interactions + excluded.interactions"""
+
+SQL_TOTALS_PROGRESS = """INSERT INTO student_totals (student_id, total_points) VALUES (?, ?)
+               ON CONFLICT(student_id) DO UPDATE SET total_points = total_points + excluded.total_points"""
+
+SQL_INSERT_QUIZ_RESULT = """INSERT INTO quiz_results
+               (student_id, quiz_id, subject, topic, score, correct_answers, total_questions)
+               VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+SQL_SUMMARY_QUIZ_RESULT = """INSERT INTO student_summary (student_id, subject, quizzes_completed, score_sum, best_score)
+               VALUES (?, ?, 1, ?, ?)
+               ON CONFLICT(student_id, subject) DO UPDATE SET
+                   quizzes_completed = quizzes_completed + 1,
+                   score_sum = score_sum + excluded.score_sum,
+                   best_score = MAX(best_score, excluded.best_score)"""
+
+SQL_TOTALS_QUIZ_RESULT = """INSERT INTO student_totals (student_id, quizzes_completed) VALUES (?, 1)
+               ON CONFLICT(student_id) DO UPDATE SET quizzes_completed = quizzes_completed + 1"""
+
+
+def progress_points(activity_type, score):
+    """Système de points"""
+    points = 0
+    if activity_type == "interaction":
+        points = 5
+    elif activity_type == "quiz_completed":
+        points = 10
+        if score and score >= 80:
+            points += 10  # Bonus pour excellent score
+        elif score and score >= 60:
+            points += 5   # Bonus pour bon score
+    return points
+
+
+HOT_QUERIES = {
+    "get_chat_history": (SQL_CHAT_HISTORY, (DEFAULT_STUDENT, "svt", 1000, 50)),
+    "get_chat_history/after": (SQL_CHAT_HISTORY_AFTER, (DEFAULT_STUDENT, "svt", 1000, 50)),
+    "get_chat_history/archive": (SQL_ARCHIVE_BEFORE, (DEFAULT_STUDENT, "svt", 1000)),
+    "get_chat_history/archive_after": (SQL_ARCHIVE_AFTER, (DEFAULT_STUDENT, "svt", 1000)),
+    "get_messages_before": (SQL_MESSAGES_BEFORE, (DEFAULT_STUDENT, "svt", 1000, 20)),
+    "get_messages_between": (SQL_MESSAGES_BETWEEN, (DEFAULT_STUDENT, "svt", 10, 1000, 50)),
+    "get_conversation_summary": (SQL_CONVERSATION_SUMMARY, (DEFAULT_STUDENT, "svt")),
+    "search_chat_history": (SQL_SEARCH_HISTORY, ('content : "cellule"', DEFAULT_STUDENT, "svt", 20, 0)),
+    "get_statistics/summary": (SQL_STUDENT_SUMMARY, (DEFAULT_STUDENT, "svt")),
+    "get_statistics/recent_quizzes": (SQL_RECENT_QUIZZES, (DEFAULT_STUDENT, "svt")),
+    "get_quiz": (SQL_GET_QUIZ, (1,)),
+    "take_pooled_quiz": (SQL_POOLED_QUIZ, ("svt", "adn", "moyen", 5, DEFAULT_STUDENT)),
+    "top_students": (SQL_TOP_STUDENTS, (10,)),
+    "student_rank": (SQL_STUDENTS_AHEAD, (100,)),
+}
 
 class Database:
-    def __init__(self, db_name="tuteur_educatif.db"):
+    def __init__(self, db_name="tuteur_educatif.db", busy_timeout=BUSY_TIMEOUT):
         self.db_name = db_name
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.write_behind = None
+        # Versions des données de progression, pour le cache de statistiques et les ETag.
+        # En mémoire par défaut, dans le store partagé avec plusieurs workers
+        # (attach_shared_state) ; ``versions.instance`` change à chaque ouverture ou
+        # reconstruction : une version n'est jamais réutilisée pour d'autres données.
+        self.versions = LocalVersions()
+        self._stats_lock = threading.Lock()
+        self._stats_cache = OrderedDict()  # (student_id, subject) -> (version, statistiques)
         self.init_database()
     
     def get_connection(self):
-        conn = sqlite3.connect(self.db_name)
-        conn.row_factory = sqlite3.Row
+        """Renvoie la connexion persistante du thread courant (créée au besoin).
+        
+        Chaque thread garde sa propre connexion ouverte : plus de connect/close
+        à chaque requête, et les requêtes préparées restent dans le cache de
+        la connexion tant que le texte SQL est identique.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_name,
+                timeout=self.busy_timeout,
+                cached_statements=STATEMENT_CACHE_SIZE,
+                check_same_thread=False  # uniquement pour pouvoir fermer depuis close()
+            )
+            conn.row_factory = sqlite3.Row
+            for name, value in PRAGMAS.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
         return conn
     
+    @contextmanager
+    def transaction(self):
+        """Ouvre une transaction d'écriture : commit si tout se passe bien, rollback sinon.
+        
+        BEGIN IMMEDIATE prend le verrou d'écriture dès le début (en attendant au
+        plus ``busy_timeout``) : avec plusieurs processus, une transaction qui
+        lit puis écrit ne peut plus échouer en SQLITE_BUSY au moment d'écrire.
+        """
+        conn = self.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        with conn:
+            yield conn
+    
+    def close(self):
+        """Ferme toutes les connexions ouvertes par les différents threads"""
+        if self.write_behind is not None:
+            self.write_behind.stop()  # écrit ce qui reste en file avant de fermer
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+    
     def init_database(self):
-        """Initialise les tables de la base de données"""
+        """Initialise les tables de la base de données puis applique les migrations"""
+        with self.transaction() as conn:
+            self._create_tables(conn.cursor())
+        self.migrate()
+    
+    def schema_version(self):
+        return self.get_connection().execute("PRAGMA user_version").fetchone()[0]
+    
+    def migrate(self):
+        """Applique dans l'ordre les migrations pas encore passées sur ce fichier.
+        
+        La version du schéma est stockée dans ``PRAGMA user_version``. Chaque
+        migration tourne dans sa propre transaction (BEGIN IMMEDIATE) : si elle
+        échoue, le fichier reste à la version précédente, et deux processus qui
+        démarrent en même temps ne l'appliquent pas deux fois.
+        """
         conn = self.get_connection()
-        cursor = conn.cursor()
+        for version, description, apply in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    conn.rollback()
+                    continue
+                apply(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+                print(f"✅ Migration {version} appliquée : {description}")
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def check_indexes(self):
+        """Renvoie les requêtes fréquentes dont le plan d'exécution parcourt une table entière.
         
+        Une liste vide signifie que toutes les requêtes de HOT_QUERIES passent
+        par un index (ou la clé primaire) sans tri temporaire.
+        """
+        conn = self.get_connection()
+        problems = []
+        for name, (sql, params) in HOT_QUERIES.items():
+            plan = [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            for detail in plan:
+                full_scan = detail.startswith("SCAN") and "INDEX" not in detail
+                if full_scan or "TEMP B-TREE" in detail:
+                    problems.append((name, detail))
+        return problems
+    
+    def _create_tables(self, cursor):
+        """Crée les tables si elles n'existent pas encore"""
         # Table pour l'historique des conversations
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS chat_history (
@@ -64,153 +615,522 @@ class Database:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         """)
+    
+    def rebuild_summary(self):
+        """Recalcule entièrement la table de synthèse depuis progress et quiz_results"""
+        with self.transaction() as conn:
+            rebuild_summary(conn)
+        self.versions.reset()
+        with self._stats_lock:
+            self._stats_cache.clear()
+    
+    @property
+    def instance(self):
+        return self.versions.instance
+    
+    def data_version(self, subject, student_id=DEFAULT_STUDENT):
+        """Version des statistiques de l'élève dans cette matière (change à chaque écriture)"""
+        return self.versions.get((student_id, subject))
+    
+    @property
+    def ranking_version(self):
+        return self.versions.get(RANKING_KEY)
+    
+    def _bump_versions(self, keys):
+        """Invalide statistiques et classement après une écriture de progression ou de résultat.
         
-        conn.commit()
-        conn.close()
+        Appelé une première fois au dépôt d'une écriture mise en file : une lecture
+        qui voit la nouvelle version attend la file (_sync_writes) avant de calculer.
+        Puis une seconde fois après le commit (write_batch) : un autre worker, qui
+        ne peut pas vider notre file, a pu calculer entre-temps sans l'écriture.
+        """
+        self.versions.bump(list(keys) + [RANKING_KEY])
+    
+    # Une base mono-fichier joue à la fois le rôle de catalogue et de shard unique
+    
+    @property
+    def catalog(self):
+        """Base qui contient les quiz (partagés entre tous les élèves)"""
+        return self
     
-    def save_message(self, subject, role, content):
+    def for_student(self, student_id):
+        """Base qui contient les données de cet élève"""
+        return self
+    
+    @property
+    def student_stores(self):
+        """Toutes les bases contenant des données d'élèves"""
+        return [self]
+    
+    def attach_write_behind(self, write_behind):
+        """Fait passer messages, progression et résultats de quiz par la file d'écriture différée"""
+        self.write_behind = write_behind
+        write_behind.start()
+    
+    def attach_shared_state(self, store):
+        """Range les versions dans le store partagé entre workers"""
+        self.versions = SharedVersions(store, os.path.abspath(self.db_name))
+    
+    def _write(self, kind, row, student_id):
+        if self.write_behind is not None:
+            if kind != "messages":
+                self._bump_versions([(student_id, row[1] if kind == "progress" else row[2])])
+            self.write_behind.submit(self, kind, row, student_id)
+        else:
+            self.write_batch(**{kind: [row]})
+    
+    def _sync_writes(self, student_id):
+        """Lire ses propres écritures : celles de l'élève encore en file partent d'abord"""
+        if self.write_behind is not None:
+            self.write_behind.flush_student(student_id)
+    
+    def write_batch(self, messages=(), progress=(), quiz_results=()):
+        """Écrit un lot d'événements en une seule transaction.
+        
+        ``messages`` : (student_id, subject, role, content)
+        ``progress`` : (student_id, subject, activity_type, score)
+        ``quiz_results`` : (student_id, quiz_id, subject, topic, score, correct, total)
+        """
+        with self.transaction() as conn:
+            if messages:
+                conn.executemany(SQL_INSERT_MESSAGE, messages)
+            if progress:
+                rows = [
+                    (student_id, subject, activity_type, progress_points(activity_type, score),
+                     json.dumps({"score": score}) if score else None)
+                    for student_id, subject, activity_type, score in progress
+                ]
+                conn.executemany(SQL_INSERT_PROGRESS, rows)
+                conn.executemany(SQL_SUMMARY_PROGRESS, [
+                    (student_id, subject, points, 1 if activity_type == "interaction" else 0)
+                    for student_id, subject, activity_type, points, _ in rows
+                ])
+                conn.executemany(SQL_TOTALS_PROGRESS, [(row[0], row[3]) for row in rows])
+            if quiz_results:
+                conn.executemany(SQL_INSERT_QUIZ_RESULT, quiz_results)
+                conn.executemany(SQL_SUMMARY_QUIZ_RESULT, [(r[0], r[2], r[4], r[4]) for r in quiz_results])
+                conn.executemany(SQL_TOTALS_QUIZ_RESULT, [(r[0],) for r in quiz_results])
+        if progress or quiz_results:
+            self._bump_versions({(r[0], r[1]) for r in progress} | {(r[0], r[2]) for r in quiz_results})
+    
+    def save_message(self, subject, role, content, student_id=DEFAULT_STUDENT):
         """Sauvegarde un message dans l'historique"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO chat_history (subject, role, content) VALUES (?, ?, ?)",
-            (subject, role, content)
-        )
-        conn.commit()
-        conn.close()
+        self._write("messages", (student_id, subject, role, content), student_id)
     
-    def get_chat_history(self, subject, limit=50):
-        """Récupère l'historique des conversations"""
+    def get_chat_history(self, subject, limit=50, before_id=None, after_id=None, student_id=DEFAULT_STUDENT):
+        """Récupère une page de l'historique, dans l'ordre chronologique.
+        
+        Sans curseur : les ``limit`` derniers messages. ``before_id`` : les
+        ``limit`` messages qui précèdent ; ``after_id`` : les ``limit`` qui suivent.
+        Les messages archivés (tous plus anciens que ceux de chat_history) sont
+        lus dans leurs blocs compressés quand la page déborde sur eux.
+        """
+        self._sync_writes(student_id)
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT role, content, timestamp FROM chat_history WHERE subject = ? ORDER BY timestamp DESC LIMIT ?",
-            (subject, limit)
-        )
-        rows = cursor.fetchall()
-        conn.close()
+        if after_id is not None:
+            rows = self._archived_after(conn, subject, after_id, limit, student_id)
+            if len(rows) < limit:
+                after = rows[-1]["id"] if rows else after_id
+                rows += [dict(row) for row in conn.execute(
+                    SQL_CHAT_HISTORY_AFTER, (student_id, subject, after, limit - len(rows))
+                )]
+            return rows
         
+        before = NO_LIMIT_ID if before_id is None else before_id
+        rows = [dict(row) for row in conn.execute(SQL_CHAT_HISTORY, (student_id, subject, before, limit))]
+        if len(rows) < limit:
+            before = rows[-1]["id"] if rows else before
+            rows += self._archived_before(conn, subject, before, limit - len(rows), student_id)
         # Inverser pour avoir l'ordre chronologique
-        return [dict(row) for row in reversed(rows)]
+        return rows[::-1]
     
-    def clear_chat_history(self, subject):
-        """Efface l'historique d'une matière"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM chat_history WHERE subject = ?", (subject,))
-        conn.commit()
-        conn.close()
+    def _archived_before(self, conn, subject, before_id, limit, student_id):
+        """Messages archivés d'id < before_id, du plus récent au plus ancien"""
+        rows = []
+        for block in conn.execute(SQL_ARCHIVE_BEFORE, (student_id, subject, before_id)):
+            rows += [message for message in reversed(unpack_archive(block["data"])) if message["id"] < before_id]
+            if len(rows) >= limit:
+                break
+        return rows[:limit]
     
-    def save_quiz(self, subject, topic, quiz_data):
-        """Sauvegarde un nouveau quiz"""
+    def _archived_after(self, conn, subject, after_id, limit, student_id):
+        """Messages archivés d'id > after_id, dans l'ordre chronologique"""
+        rows = []
+        for block in conn.execute(SQL_ARCHIVE_AFTER, (student_id, subject, after_id)):
+            rows += [message for message in unpack_archive(block["data"]) if message["id"] > after_id]
+            if len(rows) >= limit:
+                break
+        return rows[:limit]
+    
+    def clear_chat_history(self, subject, student_id=DEFAULT_STUDENT, batch_size=500):
+        """Efface l'historique d'une matière (messages et archive).
+        
+        Les messages partent par lots de ``batch_size``, chacun dans sa propre
+        transaction : un long historique ne bloque plus les autres écritures du
+        fichier pendant tout l'effacement. Les messages envoyés pendant
+        l'effacement sont conservés.
+        """
+        self._sync_writes(student_id)
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO quizzes (subject, topic, quiz_data) VALUES (?, ?, ?)",
-            (subject, topic, json.dumps(quiz_data))
-        )
-        quiz_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return quiz_id
+        last_id = conn.execute(
+            "SELECT MAX(id) FROM chat_history WHERE student_id = ? AND subject = ?", (student_id, subject)
+        ).fetchone()[0]
+        while last_id is not None:
+            with self.transaction() as conn:
+                deleted = conn.execute(
+                    """DELETE FROM chat_history WHERE id IN (
+                           SELECT id FROM chat_history WHERE student_id = ? AND subject = ? AND id <= ?
+                           ORDER BY id LIMIT ?)""",
+                    (student_id, subject, last_id, batch_size)
+                ).rowcount
+            if deleted < batch_size:
+                break
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM chat_archive WHERE student_id = ? AND subject = ?", (student_id, subject))
+            conn.execute("DELETE FROM conversation_summary WHERE student_id = ? AND subject = ?", (student_id, subject))
     
-    def get_quiz(self, quiz_id):
-        """Récupère un quiz par son ID"""
+    # ========== RÉTENTION ==========
+    
+    def _first_id_since(self, conn, table, days, after_id=0):
+        """Plus petit id de ``table`` daté de moins de ``days`` jours (ids et dates croissent ensemble).
+        
+        Le parcours s'arrête au premier message récent : il ne lit que les
+        lignes anciennes, celles que la rétention s'apprête à traiter.
+        """
+        row = conn.execute(
+            f"SELECT id FROM {table} WHERE id > ? AND timestamp >= datetime('now', ?) ORDER BY id LIMIT 1",
+            (after_id, f"-{int(days)} days")
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        return (conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0) + 1
+    
+    def archive_chat_history(self, days, block_size=200, exported_id=None):
+        """Déplace les messages de plus de ``days`` jours dans chat_archive ; renvoie le nombre archivé.
+        
+        Un bloc par élève et matière d'au plus ``block_size`` messages, écrit
+        dans la même transaction que la suppression des messages qu'il contient.
+        Les messages archivés ne sont plus trouvés par la recherche plein texte.
+        
+        ``exported_id`` : dernier id copié par la base d'analyse. Seuls les
+        messages déjà exportés sont archivés ; les autres attendent le passage suivant.
+        """
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM quizzes WHERE id = ?", (quiz_id,))
-        row = cursor.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        cutoff = self._first_id_since(conn, "chat_history", days)
+        if exported_id is not None:
+            cutoff = min(cutoff, exported_id + 1)
+        groups = conn.execute(
+            "SELECT DISTINCT student_id, subject FROM chat_history WHERE id < ?", (cutoff,)
+        ).fetchall()
+        archived = 0
+        for student_id, subject in groups:
+            while True:
+                with self.transaction() as conn:
+                    rows = conn.execute(SQL_MESSAGES_TO_ARCHIVE, (student_id, subject, cutoff, block_size)).fetchall()
+                    if not rows:
+                        break
+                    conn.execute(
+                        """INSERT INTO chat_archive (student_id, subject, first_id, last_id, message_count,
+                                                     first_timestamp, last_timestamp, data)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (student_id, subject, rows[0]["id"], rows[-1]["id"], len(rows),
+                         rows[0]["timestamp"], rows[-1]["timestamp"], pack_archive(rows))
+                    )
+                    conn.execute(
+                        "DELETE FROM chat_history WHERE student_id = ? AND subject = ? AND id BETWEEN ? AND ?",
+                        (student_id, subject, rows[0]["id"], rows[-1]["id"])
+                    )
+                archived += len(rows)
+                if len(rows) < block_size:
+                    break
+        return archived
     
-    def save_quiz_result(self, quiz_id, subject, score, correct, total):
-        """Sauvegarde le résultat d'un quiz"""
+    def compact_progress(self, days, batch_size=500, exported_id=None):
+        """Regroupe les lignes de progression de plus de ``days`` jours ; renvoie le nombre de lignes supprimées.
+        
+        Les activités d'un même élève, d'une même matière, d'un même type et
+        d'un même jour ne forment plus qu'une ligne : points additionnés,
+        nombre d'activités dans ``details`` (``{"compacted": n}``), pour que
+        rebuild_summary et l'export analytique retrouvent les mêmes totaux.
+        Le regroupement se fait par clé, pas par lot d'ids : une journée déjà
+        regroupée lors d'un passage précédent absorbe ses nouvelles lignes.
+        
+        ``exported_id`` : dernier id copié par la base d'analyse. Seules les
+        lignes déjà exportées sont regroupées ou supprimées ; les autres
+        attendent le passage suivant. ``batch_size`` : combinaisons (élève,
+        matière, type) traitées par transaction.
+        """
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO quiz_results (quiz_id, subject, score, correct_answers, total_questions) VALUES (?, ?, ?, ?, ?)",
-            (quiz_id, subject, score, correct, total)
-        )
-        conn.commit()
-        conn.close()
+        row = conn.execute("SELECT last_id FROM retention_watermarks WHERE table_name = 'progress'").fetchone()
+        start = row[0] if row else 0
+        cutoff = self._first_id_since(conn, "progress", days, after_id=start)
+        if exported_id is not None:
+            cutoff = min(cutoff, exported_id + 1)
+        if cutoff <= start + 1:
+            return 0
+        
+        keys = conn.execute(SQL_PROGRESS_KEYS_TO_COMPACT, (start, cutoff)).fetchall()
+        removed = 0
+        for first in range(0, len(keys), batch_size):
+            with self.transaction() as conn:
+                updates, deletions = [], []
+                for student_id, subject, activity_type, first_day in keys[first:first + batch_size]:
+                    groups = {}
+                    for row in conn.execute(SQL_PROGRESS_TO_COMPACT, (student_id, subject, activity_type,
+                                                                       cutoff, first_day)):
+                        groups.setdefault(row["day"], []).append(row)
+                    for group in groups.values():
+                        if len(group) == 1:
+                            continue
+                        group.sort(key=lambda row: row["id"])
+                        count = sum(compacted_count(row["details"]) for row in group)
+                        updates.append((sum(row["points"] for row in group), json.dumps({"compacted": count}),
+                                        group[0]["id"]))
+                        deletions += [(row["id"],) for row in group[1:]]
+                conn.executemany("UPDATE progress SET points = ?, details = ? WHERE id = ?", updates)
+                conn.executemany("DELETE FROM progress WHERE id = ?", deletions)
+            removed += len(deletions)
+        # Repère posé à la fin : un passage interrompu est repris en entier (regrouper deux fois ne change rien)
+        with self.transaction() as conn:
+            conn.execute(
+                """INSERT INTO retention_watermarks (table_name, last_id) VALUES ('progress', ?)
+                   ON CONFLICT(table_name) DO UPDATE SET last_id = excluded.last_id""",
+                (cutoff - 1,)
+            )
+        return removed
     
-    def update_progress(self, subject, activity_type, score=None):
-        """Met à jour la progression de l'étudiant"""
-        # Système de points
-        points = 0
-        if activity_type == "interaction":
-            points = 5
-        elif activity_type == "quiz_completed":
-            points = 10
-            if score and score >= 80:
-                points += 10  # Bonus pour excellent score
-            elif score and score >= 60:
-                points += 5   # Bonus pour bon score
+    def incremental_vacuum(self, max_pages=None):
+        """Rend au système les pages libérées par les suppressions ; renvoie le nombre de pages rendues.
         
+        Par étapes de VACUUM_STEP_PAGES pages, chacune dans sa propre courte
+        transaction. Sans effet sur un fichier créé sans auto_vacuum
+        incrémental (``python database.py vacuum`` le convertit une fois).
+        """
         conn = self.get_connection()
-        cursor = conn.cursor()
-        details = json.dumps({"score": score}) if score else None
-        cursor.execute(
-            "INSERT INTO progress (subject, activity_type, points, details) VALUES (?, ?, ?, ?)",
-            (subject, activity_type, points, details)
-        )
-        conn.commit()
-        conn.close()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        freed = 0
+        while max_pages is None or freed < max_pages:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if max_pages is not None:
+                free = min(free, max_pages - freed)
+            step = min(free, VACUUM_STEP_PAGES)
+            if step <= 0:
+                break
+            # executescript exécute le pragma jusqu'au bout (execute ne libère qu'une page)
+            conn.executescript(f"PRAGMA incremental_vacuum({step});")
+            freed += step
+        return freed
     
-    def get_statistics(self, subject):
-        """Récupère les statistiques d'une matière"""
+    def get_archive_stats(self):
+        """Taille de l'archive et du fichier (dont pages libres pas encore rendues)"""
         conn = self.get_connection()
-        cursor = conn.cursor()
+        row = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(message_count), 0), COALESCE(SUM(length(data)), 0) FROM chat_archive"
+        ).fetchone()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "archive_blocks": row[0],
+            "archived_messages": row[1],
+            "archive_bytes": row[2],
+            "file_bytes": conn.execute("PRAGMA page_count").fetchone()[0] * page_size,
+            "free_bytes": conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size,
+        }
+    
+    def get_messages_before(self, subject, before_id, limit, student_id=DEFAULT_STUDENT):
+        """Messages d'id < before_id, du plus récent au plus ancien (avec leur id)"""
+        self._sync_writes(student_id)
+        rows = self.get_connection().execute(
+            SQL_MESSAGES_BEFORE, (student_id, subject, before_id, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def get_messages_between(self, subject, after_id, before_id, limit, student_id=DEFAULT_STUDENT):
+        """Les ``limit`` premiers messages d'id strictement compris entre after_id et before_id, dans l'ordre"""
+        self._sync_writes(student_id)
+        rows = self.get_connection().execute(
+            SQL_MESSAGES_BETWEEN, (student_id, subject, after_id, before_id, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def search_chat_history(self, subject, query, limit=20, offset=0, student_id=DEFAULT_STUDENT):
+        """Messages contenant tous les mots de ``query`` (accents et casse ignorés), les plus pertinents d'abord.
         
-        # Points totaux
-        cursor.execute(
-            "SELECT COALESCE(SUM(points), 0) as total_points FROM progress WHERE subject = ?",
-            (subject,)
-        )
-        total_points = cursor.fetchone()["total_points"]
+        Les mots de 4 lettres ou plus sont cherchés comme préfixes (« cellule »
+        trouve aussi « cellules »). Chaque résultat porte un extrait HTML où
+        les mots trouvés sont entourés de <mark>.
+        """
+        terms = re.findall(r"\w+", query)[:SEARCH_MAX_TERMS]
+        if not terms:
+            return []
+        self._sync_writes(student_id)
+        scope = (student_id.encode().hex() + "x" + subject.encode().hex()).lower()
+        phrases = " ".join(f'"{term}"*' if len(term) >= 4 else f'"{term}"' for term in terms)
+        match = f'scope : "{scope}" AND content : ({phrases})'
+        rows = self.get_connection().execute(
+            SQL_SEARCH_HISTORY, (match, student_id, subject, limit, offset)
+        ).fetchall()
+        results = []
+        for row in rows:
+            snippet = html.escape(row["snippet"]).replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+            results.append({
+                "id": row["id"],
+                "role": row["role"],
+                "timestamp": row["timestamp"],
+                "snippet": snippet,
+                "rank": round(row["rank"], 4)
+            })
+        return results
+    
+    def get_conversation_summary(self, subject, student_id=DEFAULT_STUDENT):
+        """Renvoie (résumé, id du dernier message résumé)"""
+        row = self.get_connection().execute(SQL_CONVERSATION_SUMMARY, (student_id, subject)).fetchone()
+        return (row["summary"], row["summarized_until_id"]) if row else ("", 0)
+    
+    def save_conversation_summary(self, subject, summary, summarized_until_id, student_id=DEFAULT_STUDENT):
+        with self.transaction() as conn:
+            conn.execute(
+                """INSERT INTO conversation_summary (student_id, subject, summary, summarized_until_id)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(student_id, subject) DO UPDATE SET
+                       summary = excluded.summary,
+                       summarized_until_id = excluded.summarized_until_id,
+                       updated_at = CURRENT_TIMESTAMP""",
+                (student_id, subject, summary, summarized_until_id)
+            )
+    
+    def save_quiz(self, subject, topic, quiz_data, difficulty=None, num_questions=None):
+        """Sauvegarde un nouveau quiz (déjà validé par quiz_parser), avec sa clé de correction"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                """INSERT INTO quizzes (subject, topic, topic_key, difficulty, num_questions, quiz_data, answer_key)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (subject, topic, normalize_text(topic), difficulty, num_questions,
+                 json.dumps(quiz_data, ensure_ascii=False, separators=(",", ":")), answer_key(quiz_data))
+            )
+            return cursor.lastrowid
+    
+    def take_pooled_quiz(self, subject, topic, difficulty, num_questions, student_id=DEFAULT_STUDENT):
+        """Prend dans la réserve un quiz jamais servi à cet élève, ou None.
         
-        # Nombre d'interactions
-        cursor.execute(
-            "SELECT COUNT(*) as count FROM progress WHERE subject = ? AND activity_type = 'interaction'",
-            (subject,)
-        )
-        interactions = cursor.fetchone()["count"]
+        Les plus anciens partent en premier : les quiz tout neufs restent
+        disponibles pour les élèves suivants.
+        """
+        params = (subject, normalize_text(topic), difficulty, num_questions, student_id)
+        for _ in range(3):
+            with self.transaction() as conn:
+                row = conn.execute(SQL_POOLED_QUIZ, params).fetchone()
+                if row is None:
+                    return None
+                # Deux requêtes simultanées du même élève : une seule obtient ce quiz
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO quiz_served (student_id, quiz_id) VALUES (?, ?)",
+                    (student_id, row["id"])
+                )
+                if cursor.rowcount == 1:
+                    return dict(row)
+        return None
+    
+    def mark_quiz_served(self, quiz_id, student_id=DEFAULT_STUDENT):
+        """Note que ce quiz a été servi à cet élève"""
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO quiz_served (student_id, quiz_id) VALUES (?, ?)",
+                (student_id, quiz_id)
+            )
+    
+    def record_quiz_demand(self, subject, topic, difficulty, num_questions):
+        """Compte une demande de quiz pour cette combinaison"""
+        with self.transaction() as conn:
+            conn.execute(
+                """INSERT INTO quiz_demand (subject, topic_key, topic, difficulty, num_questions, requests)
+                   VALUES (?, ?, ?, ?, ?, 1)
+                   ON CONFLICT(subject, topic_key, difficulty, num_questions) DO UPDATE SET
+                       requests = requests + 1,
+                       last_requested_at = CURRENT_TIMESTAMP""",
+                (subject, normalize_text(topic), topic, difficulty, num_questions)
+            )
+    
+    def quiz_pool_shortfall(self, target, limit=20, days=7):
+        """Combinaisons populaires (récemment demandées) ayant moins de ``target`` quiz jamais servis.
         
-        # Quiz complétés
-        cursor.execute(
-            "SELECT COUNT(*) as count FROM quiz_results WHERE subject = ?",
-            (subject,)
-        )
-        quizzes_completed = cursor.fetchone()["count"]
+        Renvoie des dicts subject/topic/difficulty/num_questions/missing,
+        les plus demandées en premier.
+        """
+        rows = self.get_connection().execute(
+            """SELECT d.subject, d.topic, d.difficulty, d.num_questions,
+                      ? - (SELECT COUNT(*) FROM quizzes q
+                           WHERE q.subject = d.subject AND q.topic_key = d.topic_key
+                             AND q.difficulty = d.difficulty AND q.num_questions = d.num_questions
+                             AND NOT EXISTS (SELECT 1 FROM quiz_served s WHERE s.quiz_id = q.id)) AS missing
+               FROM quiz_demand d
+               WHERE d.last_requested_at >= datetime('now', ?)
+               ORDER BY d.requests DESC
+               LIMIT ?""",
+            (target, f"-{days} days", limit)
+        ).fetchall()
+        return [dict(row) for row in rows if row["missing"] > 0]
+    
+    def get_quiz(self, quiz_id):
+        """Récupère un quiz par son ID"""
+        row = self.get_connection().execute(SQL_GET_QUIZ, (quiz_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def save_quiz_result(self, quiz_id, subject, score, correct, total, student_id=DEFAULT_STUDENT, topic=None):
+        """Sauvegarde le résultat d'un quiz"""
+        self._write("quiz_results", (student_id, quiz_id, subject, topic, score, correct, total), student_id)
+    
+    def update_progress(self, subject, activity_type, score=None, student_id=DEFAULT_STUDENT):
+        """Met à jour la progression de l'étudiant"""
+        self._write("progress", (student_id, subject, activity_type, score), student_id)
+    
+    def save_quiz_results(self, results):
+        """Enregistre des résultats corrigés en lot (résultat + progression), en une transaction.
         
-        # Score moyen
-        cursor.execute(
-            "SELECT COALESCE(AVG(score), 0) as avg_score FROM quiz_results WHERE subject = ?",
-            (subject,)
+        ``results`` : (student_id, quiz_id, subject, topic, score, correct, total)
+        """
+        self.write_batch(
+            quiz_results=results,
+            progress=[(r[0], r[2], "quiz_completed", r[4]) for r in results]
         )
-        avg_score = cursor.fetchone()["avg_score"]
+    
+    def get_statistics(self, subject, student_id=DEFAULT_STUDENT):
+        """Récupère les statistiques d'une matière (recalculées seulement si la version a changé).
         
-        # Meilleur score
-        cursor.execute(
-            "SELECT COALESCE(MAX(score), 0) as best_score FROM quiz_results WHERE subject = ?",
-            (subject,)
-        )
-        best_score = cursor.fetchone()["best_score"]
+        Le dictionnaire renvoyé peut être partagé entre plusieurs appels : ne pas le modifier.
+        """
+        key = (student_id, subject)
+        version = self.data_version(subject, student_id)  # lue avant le calcul
+        with self._stats_lock:
+            cached = self._stats_cache.get(key)
+            if cached is not None and cached[0] == version:
+                self._stats_cache.move_to_end(key)
+                return cached[1]
+        stats = self._compute_statistics(subject, student_id)
+        with self._stats_lock:
+            self._stats_cache[key] = (version, stats)
+            self._stats_cache.move_to_end(key)
+            while len(self._stats_cache) > STATS_CACHE_SIZE:
+                self._stats_cache.popitem(last=False)
+        return stats
+    
+    def _compute_statistics(self, subject, student_id):
+        self._sync_writes(student_id)
+        cursor = self.get_connection().cursor()
+        
+        # Totaux lus dans la table de synthèse : coût constant quel que soit l'historique
+        cursor.execute(SQL_STUDENT_SUMMARY, (student_id, subject))
+        row = cursor.fetchone()
+        total_points = row["total_points"] if row else 0
+        interactions = row["interactions"] if row else 0
+        quizzes_completed = row["quizzes_completed"] if row else 0
+        avg_score = row["score_sum"] / quizzes_completed if quizzes_completed else 0
+        best_score = row["best_score"] if row else 0
         
         # Derniers quiz
-        cursor.execute(
-            """SELECT qr.score, qr.completed_at, q.topic 
-               FROM quiz_results qr 
-               JOIN quizzes q ON qr.quiz_id = q.id 
-               WHERE qr.subject = ? 
-               ORDER BY qr.completed_at DESC 
-               LIMIT 5""",
-            (subject,)
-        )
+        cursor.execute(SQL_RECENT_QUIZZES, (student_id, subject))
         recent_quizzes = [dict(row) for row in cursor.fetchall()]
         
-        conn.close()
-        
         return {
             "subject": subject,
             "total_points": total_points,
@@ -222,6 +1142,15 @@ class Database:
             "level": self._calculate_level(total_points)
         }
     
+    def top_students(self, limit=10):
+        """Meilleurs élèves, tous sujets confondus (parcours de l'index des points)"""
+        rows = self.get_connection().execute(SQL_TOP_STUDENTS, (limit,)).fetchall()
+        return [dict(row) for row in rows]
+    
+    def count_students_ahead(self, total_points):
+        """Nombre d'élèves ayant strictement plus de points"""
+        return self.get_connection().execute(SQL_STUDENTS_AHEAD, (total_points,)).fetchone()[0]
+    
     def _calculate_level(self, points):
         """Calcule le niveau basé sur les points"""
         if points >= 1000:
@@ -234,3 +1163,114 @@ class Database:
             return {"name": "Débutant+", "icon": "🌱"}
         else:
             return {"name": "Débutant", "icon": "🔰"}
+
+
+class ShardedDatabase:
+    """Répartit les élèves sur plusieurs fichiers SQLite, par paquet de hachage.
+    
+    Les données d'un élève (historique, progression, résultats, synthèse)
+    vivent toutes dans le même fichier ``students_XXX.db`` : les écritures de
+    deux élèves de paquets différents ne se disputent plus le même verrou.
+    Les quiz, partagés, restent dans ``catalog.db``.
+    """
+    
+    def __init__(self, directory, num_shards, busy_timeout=BUSY_TIMEOUT):
+        os.makedirs(directory, exist_ok=True)
+        self.catalog = Database(os.path.join(directory, "catalog.db"), busy_timeout)
+        self.shards = [
+            Database(os.path.join(directory, f"students_{i:03d}.db"), busy_timeout)
+            for i in range(num_shards)
+        ]
+        self.write_behind = None
+    
+    def for_student(self, student_id):
+        return self.shards[shard_index(student_id, len(self.shards))]
+    
+    @property
+    def student_stores(self):
+        return self.shards
+    
+    def top_students(self, limit=10):
+        """Fusionne le haut du classement de chaque fichier"""
+        candidates = [row for shard in self.shards for row in shard.top_students(limit)]
+        return heapq.nlargest(limit, candidates, key=lambda row: row["total_points"])
+    
+    def count_students_ahead(self, total_points):
+        return sum(shard.count_students_ahead(total_points) for shard in self.shards)
+    
+    @property
+    def ranking_version(self):
+        # Toutes les écritures passent par un shard : la somme change dès que l'une d'elles change
+        return sum(shard.ranking_version for shard in self.shards)
+    
+    def save_quiz_results(self, results):
+        """Une transaction par fichier concerné"""
+        by_shard = {}
+        for result in results:
+            by_shard.setdefault(shard_index(result[0], len(self.shards)), []).append(result)
+        for index, shard_results in by_shard.items():
+            self.shards[index].save_quiz_results(shard_results)
+    
+    def attach_write_behind(self, write_behind):
+        """Une seule file pour tous les fichiers : chaque lot est regroupé par fichier"""
+        self.write_behind = write_behind
+        for shard in self.shards:
+            shard.attach_write_behind(write_behind)
+    
+    def attach_shared_state(self, store):
+        for shard in self.shards:
+            shard.attach_shared_state(store)
+    
+    def close(self):
+        self.catalog.close()
+        for shard in self.shards:
+            shard.close()
+
+def open_database(shared=None, write_behind=True):
+    """Ouvre la base selon la configuration (TUTEUR_DB_SHARDS, TUTEUR_DB_DIR, TUTEUR_BUSY_TIMEOUT,
+    TUTEUR_WRITE_BATCH) ; ``shared`` : store partagé entre workers, s'il y en a un"""
+    num_shards = int(os.getenv("TUTEUR_DB_SHARDS", "1"))
+    busy_timeout = float(os.getenv("TUTEUR_BUSY_TIMEOUT", str(BUSY_TIMEOUT)))
+    if num_shards > 1:
+        db = ShardedDatabase(os.getenv("TUTEUR_DB_DIR", "tuteur_educatif_shards"), num_shards, busy_timeout)
+    else:
+        db = Database(busy_timeout=busy_timeout)
+    if shared is not None:
+        db.attach_shared_state(shared)
+    writer = WriteBehind.from_env() if write_behind else None
+    if writer is not None:
+        db.attach_write_behind(writer)
+    return db
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Outils de maintenance de la base")
+    parser.add_argument("command", choices=["migrate", "rebuild-summary", "check-indexes", "vacuum"])
+    parser.add_argument("--db", default="tuteur_educatif.db")
+    args = parser.parse_args()
+    
+    # L'ouverture applique déjà les migrations manquantes
+    db = Database(args.db)
+    
+    if args.command == "migrate":
+        print(f"✅ {args.db} est au schéma version {db.schema_version()}")
+    elif args.command == "rebuild-summary":
+        db.rebuild_summary()
+        print(f"✅ Table de synthèse reconstruite pour {args.db}")
+    elif args.command == "check-indexes":
+        problems = db.check_indexes()
+        for name, detail in problems:
+            print(f"❌ {name} : {detail}")
+        if problems:
+            raise SystemExit(1)
+        print(f"✅ Les {len(HOT_QUERIES)} requêtes fréquentes utilisent un index")
+    elif args.command == "vacuum":
+        # Reconstruit le fichier (verrou exclusif le temps de la copie) et le passe
+        # en auto_vacuum incrémental : la rétention pourra ensuite rendre l'espace libéré
+        conn = db.get_connection()
+        before = os.path.getsize(args.db)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        print(f"✅ {args.db} compacté : {before / 1e6:.1f} Mo → {os.path.getsize(args.db) / 1e6:.1f} Mo")
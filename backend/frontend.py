@@ -0,0 +1,189 @@
+"""Frontend servi par le backend, depuis la même origine que l'API.
+
+Construction (``python frontend.py build``, faite aussi par serve.py au
+démarrage) : app.js et style.css sont copiés sous un nom qui contient leur
+empreinte (``app.3f2a9c1d0e.js``), index.html est réécrit pour y renvoyer, et
+chaque fichier est précompressé en gzip et, si le module ``brotli`` est
+installé, en brotli.
+
+Service : les fichiers construits sont chargés en mémoire au démarrage.
+``/static/*`` est servi avec ``Cache-Control: immutable`` (un changement de
+contenu change le nom), ``/`` (index.html) est revalidé à chaque chargement
+grâce à son ETag. La variante précompressée est choisie selon
+``Accept-Encoding`` : aucune compression à la volée pour ces fichiers.
+
+Les réponses JSON volumineuses (/history, /quiz/generate...) sont compressées
+à la volée par CompressionMiddleware.
+"""
+import gzip
+import hashlib
+import os
+import re
+import shutil
+from fastapi import Request, Response
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.dirname(BACKEND_DIR)        # index.html, app.js, style.css à la racine du dépôt
+STATIC_DIR = os.path.join(BACKEND_DIR, "static")
+INDEX = "index.html"
+FINGERPRINTED = ("app.js", "style.css")
+FINGERPRINT_LENGTH = 10
+ENCODINGS = {"br": ".br", "gzip": ".gz"}        # par ordre de préférence
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+}
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Servi par le backend : l'API est à la même origine (URL relatives, pas de requête CORS)
+API_URL_META = '<meta name="api-url" content="">'
+
+
+def fingerprint(content):
+    return hashlib.sha256(content).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def build_frontend(source_dir=SOURCE_DIR, output_dir=STATIC_DIR):
+    """Construit le frontend dans ``output_dir`` ; renvoie le manifeste {nom source: nom servi}"""
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+
+    manifest = {}
+    for name in FINGERPRINTED:
+        with open(os.path.join(source_dir, name), "rb") as f:
+            content = f.read()
+        stem, extension = os.path.splitext(name)
+        manifest[name] = f"{stem}.{fingerprint(content)}{extension}"
+        _write(output_dir, manifest[name], content)
+
+    with open(os.path.join(source_dir, INDEX), encoding="utf-8") as f:
+        index = f.read()
+    index = re.sub(
+        r'(href|src)="(%s)"' % "|".join(re.escape(name) for name in FINGERPRINTED),
+        lambda match: f'{match.group(1)}="/static/{manifest[match.group(2)]}"',
+        index
+    )
+    index = index.replace("</head>", f"    {API_URL_META}\n</head>", 1)
+    _write(output_dir, INDEX, index.encode("utf-8"))
+    manifest[INDEX] = INDEX
+    return manifest
+
+
+def _write(output_dir, name, content):
+    """Écrit le fichier et ses variantes précompressées (seulement si elles sont plus petites)"""
+    path = os.path.join(output_dir, name)
+    with open(path, "wb") as f:
+        f.write(content)
+    variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(content, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(content):
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+
+
+def accepted_encodings(header):
+    """Codages acceptés par le client (``Accept-Encoding``), sans ceux refusés par q=0"""
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+class StaticFrontend:
+    """Fichiers construits par build_frontend, gardés en mémoire avec leurs variantes"""
+
+    def __init__(self, directory=STATIC_DIR):
+        self.directory = directory
+        self.files = {}  # nom -> (type, empreinte, {codage: contenu})
+        for name in os.listdir(directory):
+            if name.endswith(tuple(ENCODINGS.values())):
+                continue
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                variants = {"identity": f.read()}
+            for encoding, suffix in ENCODINGS.items():
+                if os.path.exists(path + suffix):
+                    with open(path + suffix, "rb") as f:
+                        variants[encoding] = f.read()
+            content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+            self.files[name] = (content_type, fingerprint(variants["identity"]), variants)
+
+    @classmethod
+    def from_env(cls):
+        """Frontend construit dans TUTEUR_STATIC_DIR (défaut : backend/static), ou None s'il n'y en a pas"""
+        directory = os.getenv("TUTEUR_STATIC_DIR", STATIC_DIR)
+        if not os.path.exists(os.path.join(directory, INDEX)):
+            return None
+        return cls(directory)
+
+    def response(self, name, request: Request):
+        """Réponse pour le fichier ``name`` (304 si le client l'a déjà), ou None s'il n'existe pas"""
+        entry = self.files.get(name)
+        if entry is None:
+            return None
+        content_type, digest, variants = entry
+        accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding = next((e for e in ENCODINGS if e in variants and e in accepted), "identity")
+        # Une empreinte par variante : un cache partagé ne sert pas du brotli à qui ne le lit pas
+        etag = f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache" if name == INDEX else IMMUTABLE,
+            "Vary": "Accept-Encoding",
+        }
+        if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(variants[encoding], media_type=content_type, headers=headers)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZip des réponses volumineuses, sauf les flux SSE.
+
+    GZipMiddleware garde dans son tampon les petits morceaux d'un flux jusqu'à
+    en avoir assez à compresser : les jetons de /chat/stream n'arriveraient
+    plus au fil de l'eau.
+    """
+
+    def __init__(self, app, minimum_size=1000, compresslevel=5, excluded_paths=("/chat/stream",)):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.excluded_paths = set(excluded_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Construction du frontend servi par le backend")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--source", default=os.getenv("TUTEUR_FRONTEND_DIR", SOURCE_DIR))
+    parser.add_argument("--output", default=os.getenv("TUTEUR_STATIC_DIR", STATIC_DIR))
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("⚠️ Module brotli absent : variantes gzip seulement (pip install brotli)")
+    for source, built in build_frontend(args.source, args.output).items():
+        print(f"✅ {source} → {os.path.join(args.output, built)}")
@@ -0,0 +1,53 @@
+"""Correction groupée des quiz (toute une classe d'un coup), vectorisée avec numpy.
+
+Les réponses d'un même quiz forment une matrice élèves × questions (-1 pour
+une question sans réponse) comparée en une fois à la clé de correction. Les
+agrégats par question en découlent directement : part de bonnes réponses
+(difficulté de l'item) et fréquence de chaque option (distracteurs).
+"""
+import numpy as np
+from quiz_parser import NUM_OPTIONS
+
+UNANSWERED = -1
+
+
+def answer_matrix(answer_lists, num_questions):
+    """Matrice élèves × questions ; réponses manquantes ou hors limites = -1"""
+    if all(len(answers) == num_questions for answers in answer_lists):
+        matrix = np.array(answer_lists, dtype=np.int64).reshape(len(answer_lists), num_questions)
+    else:
+        matrix = np.full((len(answer_lists), num_questions), UNANSWERED, dtype=np.int64)
+        for row, answers in enumerate(answer_lists):
+            answers = answers[:num_questions]
+            matrix[row, :len(answers)] = answers
+    matrix[(matrix < 0) | (matrix >= NUM_OPTIONS)] = UNANSWERED
+    return matrix
+
+
+def grade_quiz(compiled, answer_lists):
+    """Corrige toutes les copies d'un quiz.
+
+    Renvoie (bonnes réponses par copie, scores en %, agrégats par question).
+    """
+    key = np.asarray(compiled.answer_key, dtype=np.int64)
+    matrix = answer_matrix(answer_lists, len(key))
+    is_correct = matrix == key
+    correct = is_correct.sum(axis=1)
+    scores = correct * (100.0 / len(key))
+
+    # option_counts[o, q] : nombre de copies ayant choisi l'option o à la question q
+    option_counts = np.stack([(matrix == option).sum(axis=0) for option in range(NUM_OPTIONS)])
+    unanswered = (matrix == UNANSWERED).sum(axis=0)
+    difficulty = is_correct.mean(axis=0)
+
+    questions = []
+    for index, question in enumerate(compiled.questions):
+        questions.append({
+            "index": index,
+            "question": question["question"],
+            "correct_answer": int(key[index]),
+            "difficulty": round(float(difficulty[index]), 4),
+            "option_counts": option_counts[:, index].tolist(),  # dans l'ordre des options
+            "unanswered": int(unanswered[index])
+        })
+    return correct, scores, questions
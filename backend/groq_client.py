@@ -0,0 +1,230 @@
+import asyncio
+import os
+import json
+import random
+from contextlib import asynccontextmanager
+import httpx
+import metrics
+from admission import AdmissionController, TokenBucket, Overloaded, PRIORITY_INTERACTIVE
+from shared_state import SharedTokenBucket
+
+# Statuts pour lesquels un nouvel essai a des chances de réussir
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class GroqError(Exception):
+    """Erreur renvoyée par l'API Groq (statut HTTP non 200)"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(f"{status_code} - {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class _RetryableStreamError(Exception):
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class GroqClient:
+    """Client asynchrone pour l'API Groq, ou tout serveur compatible OpenAI.
+
+    Un seul client httpx est partagé par toute l'application : les connexions
+    keep-alive sont réutilisées d'une requête à l'autre au lieu de refaire une
+    poignée de main TLS à chaque appel, et la boucle d'événements n'est jamais
+    bloquée pendant la génération.
+
+    Devant chaque appel : un limiteur de débit calé sur le quota Groq, et un
+    contrôle d'admission (appels simultanés bornés, file prioritaire bornée,
+    refus rapide avec Overloaded). Les réponses 429/5xx et les erreurs réseau
+    sont réessayées avec un délai exponentiel aléatoire (« full jitter »), en
+    respectant l'en-tête Retry-After.
+
+    ``name`` identifie le fournisseur (groq, local) dans les métriques et le
+    routage (voir providers.py).
+    """
+
+    def __init__(self, api_key, api_url, model, name="groq", max_connections=100,
+                 max_keepalive_connections=20, connect_timeout=5.0, read_timeout=60.0,
+                 admission=None, rate_limiter=None, max_retries=3, backoff_base=0.5, backoff_cap=8.0):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.model = model
+        self.name = name
+        self.admission = admission or AdmissionController()
+        self.rate_limiter = rate_limiter or TokenBucket(rate=0, burst=1, name=name)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self._timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._client = None
+
+    @classmethod
+    def from_env(cls, shared=None):
+        """Construit le client à partir des variables d'environnement.
+
+        Avec ``shared`` (plusieurs workers), le quota est compté dans le store
+        partagé : il vaut pour l'ensemble des processus, pas pour chacun.
+        """
+        rate = float(os.getenv("GROQ_RATE_LIMIT_RPM", "30")) / 60
+        burst = int(os.getenv("GROQ_RATE_LIMIT_BURST", "10"))
+        return cls(
+            api_key=os.getenv("GROQ_API_KEY"),
+            api_url=os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions"),
+            model=os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile"),
+            max_connections=int(os.getenv("GROQ_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("GROQ_MAX_KEEPALIVE", "20")),
+            connect_timeout=float(os.getenv("GROQ_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("GROQ_READ_TIMEOUT", "60")),
+            admission=AdmissionController(
+                max_concurrent=int(os.getenv("GROQ_MAX_CONCURRENT", "20")),
+                max_queue=int(os.getenv("GROQ_MAX_QUEUE", "100")),
+                queue_timeout=float(os.getenv("GROQ_QUEUE_TIMEOUT", "10")),
+            ),
+            # Offre gratuite de Groq : 30 requêtes par minute (0 = pas de limite)
+            rate_limiter=(
+                SharedTokenBucket(shared, "groq", rate, burst) if shared is not None
+                else TokenBucket(rate=rate, burst=burst, name="groq")
+            ),
+            max_retries=int(os.getenv("GROQ_MAX_RETRIES", "3")),
+        )
+
+    @property
+    def client(self):
+        # Création paresseuse : le client doit naître dans la boucle qui l'utilise
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=self._limits, timeout=self._timeout)
+        return self._client
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        # Les serveurs locaux n'exigent en général pas de clé
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    @asynccontextmanager
+    async def _admitted(self, priority):
+        await self.admission.acquire(priority)
+        try:
+            yield
+        finally:
+            self.admission.release()
+
+    def _backoff(self, attempt, retry_after=None):
+        """Délai avant le prochain essai : aléatoire dans [0, base * 2^essai], plafonné"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def _retry_or_raise(self, attempt, status_code, detail, retry_after=None):
+        """Attend avant un nouvel essai, ou lève l'erreur si c'était le dernier"""
+        if status_code is not None and status_code not in RETRYABLE_STATUS:
+            raise GroqError(status_code, detail)
+        if attempt >= self.max_retries:
+            if status_code == 429:
+                raise Overloaded(self._backoff(attempt, retry_after), f"Quota {self.name} atteint")
+            if status_code is None:
+                raise detail
+            raise GroqError(status_code, detail)
+        metrics.groq_retries.inc(str(status_code or type(detail).__name__))
+        await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    async def chat(self, messages, max_tokens, temperature, priority=PRIORITY_INTERACTIVE):
+        """Envoie une complétion et renvoie le JSON complet de la réponse"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        async with self._admitted(priority):
+            for attempt in range(self.max_retries + 1):
+                await self.rate_limiter.acquire(self.admission.queue_timeout)
+                try:
+                    with metrics.stage(f"{self.name}_call"):
+                        response = await self.client.post(self.api_url, headers=self._headers(), json=payload)
+                except httpx.TransportError as e:
+                    await self._retry_or_raise(attempt, None, e)
+                    continue
+                if response.status_code == 200:
+                    break
+                await self._retry_or_raise(
+                    attempt, response.status_code, response.text, response.headers.get("retry-after")
+                )
+        result = response.json()
+        metrics.record_usage(result.get("usage"))
+        return result
+
+    async def complete(self, messages, max_tokens, temperature, priority=PRIORITY_INTERACTIVE):
+        """Raccourci qui renvoie uniquement le texte de la réponse"""
+        result = await self.chat(messages, max_tokens, temperature, priority=priority)
+        return result["choices"][0]["message"]["content"]
+
+    async def stream(self, messages, max_tokens, temperature, priority=PRIORITY_INTERACTIVE):
+        """Génère le texte au fil de l'eau (``stream: true``), fragment par fragment.
+        
+        Les nouveaux essais n'ont lieu qu'avant le premier fragment reçu.
+        """
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        async with self._admitted(priority):
+            for attempt in range(self.max_retries + 1):
+                await self.rate_limiter.acquire(self.admission.queue_timeout)
+                started = False
+                try:
+                    async for delta in self._stream_once(payload):
+                        started = True
+                        yield delta
+                    return
+                except _RetryableStreamError as e:
+                    await self._retry_or_raise(attempt, e.status_code, e.detail, e.retry_after)
+                except httpx.TransportError as e:
+                    if started:
+                        raise
+                    await self._retry_or_raise(attempt, None, e)
+
+    async def _stream_once(self, payload):
+        with metrics.stage(f"{self.name}_call"):
+            async with self.client.stream("POST", self.api_url, headers=self._headers(), json=payload) as response:
+                if response.status_code != 200:
+                    detail = (await response.aread()).decode("utf-8", errors="replace")
+                    if response.status_code in RETRYABLE_STATUS:
+                        raise _RetryableStreamError(response.status_code, detail, response.headers.get("retry-after"))
+                    raise GroqError(response.status_code, detail)
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    # Le dernier fragment porte l'usage et une liste de choix vide
+                    metrics.record_usage(chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage"))
+                    if not chunk.get("choices"):
+                        continue
+                    delta = chunk["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
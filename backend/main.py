@@ -1,18 +1,54 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.routing import Match
 from pydantic import BaseModel
 from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
 import os
+import time
 from datetime import datetime
 import json
-from database import Database
-import requests
+import httpx
+from database import Database, open_database, DEFAULT_STUDENT
+from groq_client import GroqError
+from providers import providers_from_env, ProviderRouter
+from admission import Overloaded, PRIORITY_QUIZ
+from response_cache import ResponseCache
+from quiz_pool import QuizPool
+from quiz_parser import parse_quiz, QuizParseError, CompiledQuizCache
+from grading import grade_quiz
+from analytics import AnalyticsStore, AnalyticsExporter
+from retention import Retention
+from context_builder import ContextBuilder
+from shared_state import SharedStore, Lease
+from frontend import StaticFrontend, CompressionMiddleware
+import metrics
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement
 load_dotenv()
 
-app = FastAPI(title="Tuteur Éducatif Personnalisé")
+@asynccontextmanager
+async def lifespan(app):
+    quiz_pool.start()
+    analytics_exporter.start()
+    retention.start()
+    yield
+    # Arrêter les tâches de fond, puis fermer le pool HTTP et les connexions SQLite
+    # (la fermeture écrit d'abord les écritures encore en file)
+    await quiz_pool.stop()
+    await analytics_exporter.stop()
+    await retention.stop()
+    for provider in providers.values():
+        await provider.aclose()
+    db.close()
+    analytics.close()
+    if shared is not None:
+        shared.close()
+
+app = FastAPI(title="Tuteur Éducatif Personnalisé", lifespan=lifespan)
 
 # CORS pour permettre au frontend de communiquer
 app.add_middleware(
@@ -23,8 +59,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compression des réponses JSON volumineuses (/history, /quiz/generate...), hors flux SSE
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("TUTEUR_GZIP_MIN_SIZE", "1000")))
+
+# Frontend construit par frontend.py (python serve.py le construit au démarrage) ; None sinon
+frontend = StaticFrontend.from_env()
+
+# Chaque appel à la base est chronométré (métriques SQLite et étapes db_read / db_write)
+metrics.instrument_database(Database)
+
+@app.middleware("http")
+async def collect_metrics(request: Request, call_next):
+    """Mesure la durée de chaque requête et rattache les étapes à son endpoint.
+    
+    Pour /chat/stream, la durée s'arrête à l'envoi des en-têtes ; la
+    génération elle-même apparaît dans l'étape groq_call.
+    """
+    endpoint = route_template(request)
+    metrics.current_endpoint.set(endpoint)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    except Exception as e:
+        metrics.record_error(e)
+        raise
+    finally:
+        metrics.http_request_duration.observe(time.perf_counter() - start, request.method, endpoint, status)
+
+def route_template(request: Request):
+    """Chemin déclaré de la route (/progress/{subject}) plutôt que l'URL réelle"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "non_trouve"
+
+# État partagé entre workers (versions, quota Groq, cache, tâches de fond) quand
+# TUTEUR_SHARED_STATE est défini (python serve.py le fait avec plusieurs workers)
+shared = SharedStore.from_env()
+
 # Initialisation de la base de données
-db = Database()
+db = open_database(shared)
 
 # Configuration Groq API
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -32,28 +110,54 @@ if not GROQ_API_KEY:
     print("⚠️ ATTENTION: GROQ_API_KEY non trouvée dans .env")
 else:
     print(f"✅ GROQ_API_KEY chargée: {GROQ_API_KEY[:20]}...")
-    
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-GROQ_MODEL = "llama-3.3-70b-versatile"  # Modèle gratuit et performant  
+
+# Fournisseurs de modèle : Groq (GROQ_API_URL / GROQ_MODEL) et serveur local compatible
+# OpenAI (LOCAL_LLM_URL / LOCAL_LLM_MODEL), chacun avec son pool HTTP keep-alive partagé
+providers = providers_from_env(shared)
+if "local" in providers:
+    print(f"✅ Modèle local: {providers['local'].model} sur {providers['local'].api_url}")
+
+# Routage par endpoint : ordre de préférence, secours et appel doublé au-delà du p95
+chat_llm = ProviderRouter.from_env(providers, "TUTEUR_CHAT_PROVIDERS")
+quiz_llm = ProviderRouter.from_env(providers, "TUTEUR_QUIZ_PROVIDERS")
+print(f"🧭 Fournisseurs chat: {chat_llm.names} | quiz: {quiz_llm.names}")
+NO_PROVIDER = "Aucun modèle configuré (GROQ_API_KEY ou LOCAL_LLM_URL). Vérifie ton fichier .env"
+
+# Cache des réponses aux questions récurrentes (TUTEUR_CACHE_SIZE=0 pour le désactiver)
+response_cache = ResponseCache.from_env(shared)
+
+# Contexte de conversation limité à un budget de jetons (TUTEUR_CONTEXT_TOKENS)
+context_builder = ContextBuilder.from_env()
 
 # Modèles Pydantic
 class ChatMessage(BaseModel):
     message: str
     subject: str  # "histoire_geo" ou "svt"
     student_level: str = "lycée"
+    student_id: str = DEFAULT_STUDENT
 
 class QuizRequest(BaseModel):
     subject: str
     topic: str
     difficulty: str = "moyen"
     num_questions: int = 5
+    student_id: str = DEFAULT_STUDENT
 
 class QuizAnswer(BaseModel):
     quiz_id: int
     answers: List[int]  # Liste des indices de réponses choisies
+    student_id: str = DEFAULT_STUDENT
+
+class BatchSubmission(BaseModel):
+    quiz_id: int
+    student_id: str
+    answers: List[int]
+
+class QuizBatch(BaseModel):
+    submissions: List[BatchSubmission]
 
 class StudentProgress(BaseModel):
-    student_id: str = "default_student"
+    student_id: str = DEFAULT_STUDENT
 
 # Prompts système pour le tuteur
 SYSTEM_PROMPTS = {
@@ -85,75 +189,88 @@ SYSTEM_PROMPTS = {
 }
 
 @app.get("/")
-async def root():
+async def root(request: Request):
+    """Page du frontend s'il a été construit, sinon une présentation de l'API"""
+    if frontend is not None:
+        return frontend.response("index.html", request)
+    return await api_info()
+
+@app.get("/api")
+async def api_info():
     return {
         "message": "Bienvenue sur l'API du Tuteur Éducatif Personnalisé",
         "version": "1.0.0",
         "subjects": ["histoire_geo", "svt"]
     }
 
+@app.get("/static/{name}")
+async def static_file(name: str, request: Request):
+    """Fichiers du frontend à empreinte (cache immuable, variantes précompressées)"""
+    response = frontend.response(name, request) if frontend is not None else None
+    if response is None:
+        raise HTTPException(status_code=404, detail="Fichier introuvable")
+    return response
+
+def build_chat_context(chat: ChatMessage):
+    """Prépare les messages envoyés à Groq (prompt système, résumé, historique, question).
+    
+    Renvoie aussi l'historique retenu, qui sert à décider si la réponse peut
+    venir du cache.
+    """
+    with metrics.stage("prompt_build"):
+        return context_builder.build(
+            db.for_student(chat.student_id),
+            chat.subject,
+            chat.student_id,
+            SYSTEM_PROMPTS.get(chat.subject, SYSTEM_PROMPTS["histoire_geo"]),
+            chat.message
+        )
+
+def lookup_cache(chat: ChatMessage, history):
+    """Renvoie (cacheable, réponse en cache ou None) pour cette question"""
+    if not response_cache.is_cacheable(chat.message, history):
+        response_cache.record_bypass()
+        return False, None
+    return True, response_cache.get(chat.subject, chat.message)
+
+def save_exchange(chat: ChatMessage, assistant_response: str):
+    """Enregistre la question et la réponse, puis met à jour la progression.
+    
+    Avec la file d'écriture différée, ces trois écritures partent dans le
+    prochain lot au lieu de bloquer la réponse.
+    """
+    store = db.for_student(chat.student_id)
+    store.save_message(chat.subject, "user", chat.message, student_id=chat.student_id)
+    store.save_message(chat.subject, "assistant", assistant_response, student_id=chat.student_id)
+    store.update_progress(chat.subject, "interaction", student_id=chat.student_id)
+
 @app.post("/chat")
 async def chat_with_tutor(chat: ChatMessage):
     """Endpoint pour discuter avec le tuteur IA"""
     try:
         # Vérifier la clé API
-        if not GROQ_API_KEY:
-            raise HTTPException(status_code=500, detail="Clé API Groq non configurée. Vérifie ton fichier .env")
-        
-        # Récupérer l'historique
-        history = db.get_chat_history(chat.subject)
-        
-        # Préparer les messages pour Groq
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPTS.get(chat.subject, SYSTEM_PROMPTS["histoire_geo"])}
-        ]
-        
-        for h in history[-10:]:  # Garder les 10 derniers messages
-            messages.append({
-                "role": h["role"],
-                "content": h["content"]
-            })
-        
-        # Ajouter le nouveau message
-        messages.append({
-            "role": "user",
-            "content": chat.message
-        })
-        
-        # Appel à Groq API
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": GROQ_MODEL,
-            "messages": messages,
-            "max_tokens": 1500,
-            "temperature": 0.7
-        }
-        
-        print(f"🔄 Envoi requête à Groq pour: {chat.message[:50]}...")
-        
-        response = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
-        
-        # Afficher l'erreur si problème
-        if response.status_code != 200:
-            error_detail = response.text
-            print(f"❌ Erreur Groq API: {response.status_code} - {error_detail}")
-            raise HTTPException(status_code=500, detail=f"Erreur Groq API: {error_detail}")
-        
-        result = response.json()
-        assistant_response = result["choices"][0]["message"]["content"]
-        
-        print(f"✅ Réponse reçue de Groq: {assistant_response[:50]}...")
-        
-        # Sauvegarder dans l'historique
-        db.save_message(chat.subject, "user", chat.message)
-        db.save_message(chat.subject, "assistant", assistant_response)
+        if not chat_llm.providers:
+            raise HTTPException(status_code=500, detail=NO_PROVIDER)
+        
+        # Hors de la boucle d'événements : lectures SQLite et, avec plusieurs
+        # workers, store partagé (verrou d'écriture attendu jusqu'à busy_timeout)
+        messages, history = await asyncio.to_thread(build_chat_context, chat)
+        
+        cacheable, assistant_response = await asyncio.to_thread(lookup_cache, chat, history)
+        if assistant_response is not None:
+            print(f"⚡ Réponse trouvée en cache pour: {chat.message[:50]}...")
+        else:
+            print(f"🔄 Envoi requête au modèle ({chat_llm.names[0]}) pour: {chat.message[:50]}...")
+            
+            # Appel au modèle (non bloquant) : secours et appel doublé gérés par le routeur
+            assistant_response = await chat_llm.complete(messages, max_tokens=1500, temperature=0.7)
+            
+            print(f"✅ Réponse reçue du modèle: {assistant_response[:50]}...")
+            if cacheable:
+                await asyncio.to_thread(response_cache.put, chat.subject, chat.message, assistant_response)
         
-        # Mettre à jour la progression
-        db.update_progress(chat.subject, "interaction")
+        # Sauvegarder dans l'historique et mettre à jour la progression
+        await asyncio.to_thread(save_exchange, chat, assistant_response)
         
         return {
             "response": assistant_response,
@@ -161,188 +278,510 @@ async def chat_with_tutor(chat: ChatMessage):
             "timestamp": datetime.now().isoformat()
         }
         
-    except requests.exceptions.RequestException as e:
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except GroqError as e:
+        metrics.record_error(e)
+        print(f"❌ Erreur Groq API: {e.status_code} - {e.detail}")
+        raise HTTPException(status_code=500, detail=f"Erreur Groq API: {e.detail}")
+    except httpx.HTTPError as e:
+        metrics.record_error(e)
         print(f"❌ Erreur de connexion à Groq: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de connexion à l'API Groq: {str(e)}")
     except KeyError as e:
+        metrics.record_error(e)
         print(f"❌ Erreur dans la réponse de Groq: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Format de réponse invalide: {str(e)}")
     except Exception as e:
+        metrics.record_error(e)
         print(f"❌ Erreur générale: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+def overloaded_error(e: Overloaded) -> HTTPException:
+    """503 + Retry-After : le client peut réessayer plus tard sans insister tout de suite"""
+    metrics.record_error(e)
+    print(f"⏳ Requête refusée: {str(e)}")
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def sse_event(event: str, data: dict) -> str:
+    """Formate un événement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_with_tutor_stream(chat: ChatMessage):
+    """Même chose que /chat, mais la réponse arrive jeton par jeton (SSE).
+    
+    Événements émis : ``token`` ({"delta": ...}) pour chaque fragment, puis
+    ``done`` ({"subject", "timestamp"}) ou ``error`` ({"detail"}, plus
+    ``retry_after`` en secondes si le service est saturé).
+    La réponse complète n'est enregistrée qu'en cas de succès.
+    """
+    if not chat_llm.providers:
+        raise HTTPException(status_code=500, detail=NO_PROVIDER)
+    
+    try:
+        messages, history = await asyncio.to_thread(build_chat_context, chat)
+        cacheable, cached_response = await asyncio.to_thread(lookup_cache, chat, history)
+    except Exception as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+    
+    async def event_stream():
+        parts = []
+        try:
+            if cached_response is not None:
+                # Réponse déjà connue : envoyée d'un bloc
+                print(f"⚡ Réponse trouvée en cache pour: {chat.message[:50]}...")
+                yield sse_event("token", {"delta": cached_response})
+                assistant_response = cached_response
+            else:
+                print(f"🔄 Streaming ({chat_llm.names[0]}) pour: {chat.message[:50]}...")
+                async for delta in chat_llm.stream(messages, max_tokens=1500, temperature=0.7):
+                    parts.append(delta)
+                    yield sse_event("token", {"delta": delta})
+                assistant_response = "".join(parts)
+                if cacheable:
+                    await asyncio.to_thread(response_cache.put, chat.subject, chat.message, assistant_response)
+            
+            await asyncio.to_thread(save_exchange, chat, assistant_response)
+            print(f"✅ Réponse streamée: {assistant_response[:50]}...")
+            
+            yield sse_event("done", {
+                "subject": chat.subject,
+                "timestamp": datetime.now().isoformat()
+            })
+        except Overloaded as e:
+            metrics.record_error(e)
+            print(f"⏳ Requête refusée: {str(e)}")
+            yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+        except GroqError as e:
+            metrics.record_error(e)
+            print(f"❌ Erreur Groq API: {e.status_code} - {e.detail}")
+            yield sse_event("error", {"detail": f"Erreur Groq API: {e.detail}"})
+        except httpx.HTTPError as e:
+            metrics.record_error(e)
+            print(f"❌ Erreur de connexion à Groq: {str(e)}")
+            yield sse_event("error", {"detail": f"Erreur de connexion à l'API Groq: {str(e)}"})
+        except Exception as e:
+            metrics.record_error(e)
+            print(f"❌ Erreur générale: {str(e)}")
+            yield sse_event("error", {"detail": f"Erreur: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Métriques au format texte Prometheus"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Taux de succès du cache de réponses"""
+    return response_cache.stats()
+
+async def generate_quiz_data(subject: str, topic: str, difficulty: str, num_questions: int,
+                             priority: int = PRIORITY_QUIZ):
+    """Fait générer un quiz par le LLM et renvoie le JSON décodé"""
+    prompt = f"""Génère un quiz de {num_questions} questions sur le thème : {topic}
+    
+    Matière : {subject}
+    Niveau : Lycée
+    Difficulté : {difficulty}
+    
+    Format de réponse STRICT (JSON) :
+    {{
+        "title": "Titre du quiz",
+        "questions": [
+            {{
+                "question": "Texte de la question",
+                "options": ["Option A", "Option B", "Option C", "Option D"],
+                "correct_answer": 0,
+                "explanation": "Explication détaillée de la réponse"
+            }}
+        ]
+    }}
+    
+    Réponds UNIQUEMENT avec le JSON, sans texte avant ou après."""
+    
+    messages = [
+        {"role": "system", "content": "Tu es un expert en création de quiz éducatifs. Réponds UNIQUEMENT en JSON valide."},
+        {"role": "user", "content": prompt}
+    ]
+    
+    quiz_text = (await quiz_llm.complete(messages, max_tokens=2000, temperature=0.8, priority=priority)).strip()
+    
+    with metrics.stage("quiz_json_parse"):
+        # Extraction, réparation et validation locales plutôt qu'une nouvelle génération
+        return parse_quiz(quiz_text, topic=topic)
+
+# Réserve de quiz pré-générés (TUTEUR_QUIZ_POOL_TARGET=0 désactive la pré-génération)
+quiz_pool = QuizPool.from_env(db.catalog, generate_quiz_data, shared)
+# Quiz compilés (clé de correction décodée) pour corriger sans relire le JSON à chaque soumission
+compiled_quizzes = CompiledQuizCache(db.catalog)
+
+metrics.registry.gauge_callback(
+    "tuteur_response_cache", "Compteurs du cache de réponses", "counter",
+    lambda: {k: v for k, v in response_cache.stats().items() if k != "max_entries"}
+)
+metrics.registry.gauge_callback(
+    "tuteur_quiz_pool", "Compteurs de la réserve de quiz", "counter",
+    lambda: {k: v for k, v in quiz_pool.stats().items() if k != "target_per_combination"}
+)
+if db.write_behind is not None:
+    metrics.registry.gauge_callback(
+        "tuteur_write_behind", "File d'écriture différée vers SQLite", "counter",
+        lambda: {k: v for k, v in db.write_behind.stats().items() if k != "max_batch"}
+    )
+for provider in providers.values():
+    metrics.registry.gauge_callback(
+        f"tuteur_{provider.name}_admission", f"File d'attente et appels en cours vers {provider.name}", "counter",
+        provider.admission.stats
+    )
+
 @app.post("/quiz/generate")
 async def generate_quiz(quiz_req: QuizRequest):
-    """Génère un quiz personnalisé"""
+    """Génère un quiz personnalisé (ou en sert un déjà prêt dans la réserve)"""
     try:
-        prompt = f"""Génère un quiz de {quiz_req.num_questions} questions sur le thème : {quiz_req.topic}
-        
-        Matière : {quiz_req.subject}
-        Niveau : Lycée
-        Difficulté : {quiz_req.difficulty}
-        
-        Format de réponse STRICT (JSON) :
-        {{
-            "title": "Titre du quiz",
-            "questions": [
-                {{
-                    "question": "Texte de la question",
-                    "options": ["Option A", "Option B", "Option C", "Option D"],
-                    "correct_answer": 0,
-                    "explanation": "Explication détaillée de la réponse"
-                }}
-            ]
-        }}
-        
-        Réponds UNIQUEMENT avec le JSON, sans texte avant ou après."""
-        
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": GROQ_MODEL,
-            "messages": [
-                {"role": "system", "content": "Tu es un expert en création de quiz éducatifs. Réponds UNIQUEMENT en JSON valide."},
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 2000,
-            "temperature": 0.8
-        }
-        
-        response = requests.post(GROQ_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
-        quiz_text = result["choices"][0]["message"]["content"].strip()
-        
-        # Nettoyer le JSON si nécessaire
-        if quiz_text.startswith("```json"):
-            quiz_text = quiz_text.split("```json")[1].split("```")[0].strip()
-        elif quiz_text.startswith("```"):
-            quiz_text = quiz_text.split("```")[1].split("```")[0].strip()
-        
-        quiz_data = json.loads(quiz_text)
-        
-        # Sauvegarder le quiz
-        quiz_id = db.save_quiz(quiz_req.subject, quiz_req.topic, quiz_data)
+        quiz_id, quiz_data, from_pool = await quiz_pool.get_quiz(
+            quiz_req.subject, quiz_req.topic, quiz_req.difficulty, quiz_req.num_questions,
+            student_id=quiz_req.student_id
+        )
         
         return {
             "quiz_id": quiz_id,
             "quiz": quiz_data,
-            "subject": quiz_req.subject
+            "subject": quiz_req.subject,
+            "from_pool": from_pool
         }
         
-    except json.JSONDecodeError as e:
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except QuizParseError as e:
+        metrics.record_error(e)
         raise HTTPException(status_code=500, detail=f"Erreur de format JSON: {str(e)}")
     except Exception as e:
+        metrics.record_error(e)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+@app.get("/llm/stats")
+async def get_llm_stats():
+    """Routage par endpoint : latences par fournisseur, appels doublés, bascules, admission"""
+    return {"chat": chat_llm.stats(), "quiz": quiz_llm.stats()}
+
+@app.get("/quiz/pool/stats")
+async def get_quiz_pool_stats():
+    """Statistiques de la réserve de quiz"""
+    return quiz_pool.stats()
+
+def save_quiz_submission(submission: QuizAnswer, quiz, score, correct, total):
+    store = db.for_student(submission.student_id)
+    store.save_quiz_result(
+        submission.quiz_id, quiz.subject, score, correct, total,
+        student_id=submission.student_id, topic=quiz.topic
+    )
+    store.update_progress(quiz.subject, "quiz_completed", score, student_id=submission.student_id)
+
 @app.post("/quiz/submit")
 async def submit_quiz(submission: QuizAnswer):
     """Soumet les réponses d'un quiz et calcule le score"""
     try:
-        quiz = db.get_quiz(submission.quiz_id)
-        if not quiz:
+        quiz = await asyncio.to_thread(compiled_quizzes.get, submission.quiz_id)
+        if quiz is None:
             raise HTTPException(status_code=404, detail="Quiz non trouvé")
         
-        quiz_data = json.loads(quiz["quiz_data"])
-        questions = quiz_data["questions"]
-        
         # Calculer le score
-        correct = 0
-        results = []
-        
-        for i, user_answer in enumerate(submission.answers):
-            is_correct = user_answer == questions[i]["correct_answer"]
-            if is_correct:
-                correct += 1
-            
-            results.append({
-                "question": questions[i]["question"],
-                "user_answer": questions[i]["options"][user_answer],
-                "correct_answer": questions[i]["options"][questions[i]["correct_answer"]],
-                "is_correct": is_correct,
-                "explanation": questions[i]["explanation"]
-            })
+        correct, results = quiz.score(submission.answers)
+        total = len(quiz.answer_key)
+        score = (correct / total) * 100
         
-        score = (correct / len(questions)) * 100
-        
-        # Sauvegarder les résultats
-        db.save_quiz_result(submission.quiz_id, quiz["subject"], score, correct, len(questions))
-        
-        # Mettre à jour la progression
-        db.update_progress(quiz["subject"], "quiz_completed", score)
+        # Sauvegarder les résultats et mettre à jour la progression
+        await asyncio.to_thread(save_quiz_submission, submission, quiz, score, correct, total)
         
         return {
             "score": round(score, 2),
             "correct": correct,
-            "total": len(questions),
+            "total": total,
             "results": results,
             "performance": "Excellent !" if score >= 80 else "Bien !" if score >= 60 else "Continue à t'entraîner !"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
+        metrics.record_error(e)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+@app.post("/quiz/submit/batch")
+async def submit_quiz_batch(batch: QuizBatch):
+    """Corrige d'un coup les copies de toute une classe (un ou plusieurs quiz).
+    
+    Renvoie le score de chaque copie et, par quiz, la difficulté de chaque
+    question (part de bonnes réponses) et la fréquence de chaque option.
+    Tous les résultats sont enregistrés en une transaction (par fichier).
+    """
+    try:
+        by_quiz = {}
+        for index, submission in enumerate(batch.submissions):
+            by_quiz.setdefault(submission.quiz_id, []).append(index)
+        
+        compiled = await asyncio.to_thread(
+            lambda: {quiz_id: compiled_quizzes.get(quiz_id) for quiz_id in by_quiz}
+        )
+        missing = sorted(quiz_id for quiz_id, quiz in compiled.items() if quiz is None)
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Quiz non trouvé(s): {missing}")
+        
+        students = [None] * len(batch.submissions)
+        quizzes = []
+        rows = []
+        with metrics.stage("grading"):
+            for quiz_id, indexes in by_quiz.items():
+                quiz = compiled[quiz_id]
+                total = len(quiz.answer_key)
+                correct, scores, questions = grade_quiz(quiz, [batch.submissions[i].answers for i in indexes])
+                for i, n_correct, score in zip(indexes, correct.tolist(), scores.tolist()):
+                    student_id = batch.submissions[i].student_id
+                    students[i] = {
+                        "student_id": student_id,
+                        "quiz_id": quiz_id,
+                        "score": round(score, 2),
+                        "correct": n_correct,
+                        "total": total
+                    }
+                    rows.append((student_id, quiz_id, quiz.subject, quiz.topic, score, n_correct, total))
+                quizzes.append({
+                    "quiz_id": quiz_id,
+                    "submissions": len(indexes),
+                    "avg_score": round(float(scores.mean()), 2),
+                    "questions": questions
+                })
+        
+        await asyncio.to_thread(db.save_quiz_results, rows)
+        
+        return {"students": students, "quizzes": quizzes}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+def etag_matches(request: Request, response: Response, etag: str) -> bool:
+    """Pose l'ETag sur la réponse ; vrai si le client a déjà cette version (→ 304).
+    
+    ``no-cache`` : le navigateur garde la réponse mais revalide à chaque fois,
+    ce qui ne coûte qu'une comparaison de versions côté serveur.
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if_none_match = request.headers.get("if-none-match", "")
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
+def not_modified(response: Response) -> Response:
+    return Response(status_code=304, headers=dict(response.headers))
+
+def progress_etag(store, subject, student_id):
+    return f'W/"{store.instance}-{store.data_version(subject, student_id)}"'
+
 @app.get("/progress/{subject}")
-async def get_progress(subject: str):
-    """Récupère la progression de l'étudiant"""
+async def get_progress(subject: str, request: Request, response: Response, student_id: str = DEFAULT_STUDENT):
+    """Récupère la progression de l'étudiant (ETag : 304 si rien n'a changé)"""
     try:
-        stats = db.get_statistics(subject)
-        return stats
+        store = db.for_student(student_id)
+        # Versions et statistiques lues hors de la boucle d'événements (store partagé, SQLite)
+        etag = await asyncio.to_thread(progress_etag, store, subject, student_id)
+        if etag_matches(request, response, etag):
+            return not_modified(response)
+        return await asyncio.to_thread(store.get_statistics, subject, student_id=student_id)
     except Exception as e:
+        metrics.record_error(e)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @app.get("/history/{subject}")
-async def get_history(subject: str, limit: int = 20):
-    """Récupère l'historique des conversations"""
+async def get_history(subject: str, limit: int = 20, before: Optional[int] = None, after: Optional[int] = None,
+                      compact: bool = False, student_id: str = DEFAULT_STUDENT):
+    """Récupère l'historique des conversations, page par page.
+    
+    Curseurs sur l'id des messages : ``before`` pour remonter dans le passé
+    (``next_before`` de la page précédente), ``after`` pour les messages plus
+    récents. ``compact=true`` ne renvoie que le rôle et le contenu.
+    """
+    try:
+        if before is not None and after is not None:
+            raise HTTPException(status_code=400, detail="Utilise before ou after, pas les deux")
+        limit = max(1, min(limit, 100))
+        
+        # Un message de plus pour savoir s'il reste une page. Dans un thread : la lecture
+        # écrit d'abord les écritures en file de l'élève (transaction, verrou d'écriture)
+        rows = await asyncio.to_thread(
+            db.for_student(student_id).get_chat_history,
+            subject, limit + 1, before_id=before, after_id=after, student_id=student_id
+        )
+        has_more = len(rows) > limit
+        if has_more:
+            rows = rows[:limit] if after is not None else rows[1:]
+        
+        history = [{"role": r["role"], "content": r["content"]} for r in rows] if compact else rows
+        return {
+            "history": history,
+            "subject": subject,
+            "has_more": has_more,
+            "next_before": rows[0]["id"] if rows else before,
+            "next_after": rows[-1]["id"] if rows else after
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+@app.get("/history/{subject}/search")
+async def search_history(subject: str, q: str, page: int = 1, limit: int = 20, student_id: str = DEFAULT_STUDENT):
+    """Recherche plein texte dans les conversations passées (résultats classés, paginés, avec extraits)"""
     try:
-        history = db.get_chat_history(subject, limit)
-        return {"history": history, "subject": subject}
+        limit = max(1, min(limit, 50))
+        page = max(1, page)
+        results = await asyncio.to_thread(
+            db.for_student(student_id).search_chat_history,
+            subject, q, limit=limit + 1, offset=(page - 1) * limit, student_id=student_id
+        )
+        return {
+            "results": results[:limit],
+            "subject": subject,
+            "query": q,
+            "page": page,
+            "has_more": len(results) > limit
+        }
     except Exception as e:
+        metrics.record_error(e)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @app.delete("/history/{subject}")
-async def clear_history(subject: str):
+async def clear_history(subject: str, student_id: str = DEFAULT_STUDENT):
     """Efface l'historique d'une matière"""
     try:
-        db.clear_chat_history(subject)
+        # Suppressions par lots, chacune dans sa transaction : hors de la boucle d'événements
+        await asyncio.to_thread(db.for_student(student_id).clear_chat_history, subject, student_id=student_id)
         return {"message": f"Historique de {subject} effacé avec succès"}
     except Exception as e:
+        metrics.record_error(e)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+def leaderboard_etag(store, student_id, top):
+    return (f'W/"{store.instance}-{store.data_version("histoire_geo", student_id)}.'
+            f'{store.data_version("svt", student_id)}-{db.ranking_version}-{top}"')
+
+def build_leaderboard(store, student_id, top):
+    stats_hg = store.get_statistics("histoire_geo", student_id=student_id)
+    stats_svt = store.get_statistics("svt", student_id=student_id)
+    
+    total_points = stats_hg["total_points"] + stats_svt["total_points"]
+    total_quizzes = stats_hg["quizzes_completed"] + stats_svt["quizzes_completed"]
+    
+    badges = []
+    if total_points >= 1000:
+        badges.append({"name": "Expert", "icon": "🏆"})
+    if total_points >= 500:
+        badges.append({"name": "Avancé", "icon": "⭐"})
+    if total_quizzes >= 10:
+        badges.append({"name": "Persévérant", "icon": "💪"})
+    if stats_hg["avg_score"] >= 80 or stats_svt["avg_score"] >= 80:
+        badges.append({"name": "Excellent", "icon": "🎯"})
+    
+    # Classement entre élèves, lu dans les totaux tenus à jour par élève
+    ranking = db.top_students(top)
+    
+    return {
+        "total_points": total_points,
+        "total_quizzes": total_quizzes,
+        "badges": badges,
+        "rank": db.count_students_ahead(total_points) + 1,
+        "ranking": ranking,
+        "subjects": {
+            "histoire_geo": stats_hg,
+            "svt": stats_svt
+        }
+    }
+
 @app.get("/leaderboard")
-async def get_leaderboard():
-    """Récupère le classement global"""
+async def get_leaderboard(request: Request, response: Response, student_id: str = DEFAULT_STUDENT, top: int = 10):
+    """Récupère le classement global.
+    
+    L'ETag combine les versions des deux matières de l'élève et celle du
+    classement (qui change à chaque point gagné par n'importe quel élève).
+    """
     try:
-        stats_hg = db.get_statistics("histoire_geo")
-        stats_svt = db.get_statistics("svt")
-        
-        total_points = stats_hg["total_points"] + stats_svt["total_points"]
-        total_quizzes = stats_hg["quizzes_completed"] + stats_svt["quizzes_completed"]
-        
-        badges = []
-        if total_points >= 1000:
-            badges.append({"name": "Expert", "icon": "🏆"})
-        if total_points >= 500:
-            badges.append({"name": "Avancé", "icon": "⭐"})
-        if total_quizzes >= 10:
-            badges.append({"name": "Persévérant", "icon": "💪"})
-        if stats_hg["avg_score"] >= 80 or stats_svt["avg_score"] >= 80:
-            badges.append({"name": "Excellent", "icon": "🎯"})
-        
-        return {
-            "total_points": total_points,
-            "total_quizzes": total_quizzes,
-            "badges": badges,
-            "subjects": {
-                "histoire_geo": stats_hg,
-                "svt": stats_svt
-            }
-        }
+        store = db.for_student(student_id)
+        etag = await asyncio.to_thread(leaderboard_etag, store, student_id, top)
+        if etag_matches(request, response, etag):
+            return not_modified(response)
+        return await asyncio.to_thread(build_leaderboard, store, student_id, top)
+    except Exception as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+# Base d'analyse séparée, alimentée en continu (TUTEUR_ANALYTICS_INTERVAL=0 : export manuel seulement)
+analytics = AnalyticsStore.from_env()
+analytics_interval = float(os.getenv("TUTEUR_ANALYTICS_INTERVAL", "300"))
+analytics_exporter = AnalyticsExporter(
+    analytics, db.student_stores, interval=analytics_interval,
+    lease=Lease(shared, "analytics_export", ttl=3 * analytics_interval) if shared is not None else None
+)
+
+# Archivage des vieux messages et regroupement de la progression (TUTEUR_RETENTION_DAYS=0 pour tout garder)
+retention = Retention.from_env(db, analytics, shared)
+
+@app.get("/analytics/{subject}/daily")
+async def get_daily_analytics(subject: str, days: int = 30):
+    """Activité par jour (interactions, points, quiz, élèves actifs), lue dans les agrégats"""
+    try:
+        return {"subject": subject, "days": analytics.daily_report(subject, days)}
+    except Exception as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+@app.get("/analytics/{subject}/topics")
+async def get_topic_analytics(subject: str, days: int = 30):
+    """Résultats de quiz par thème sur la période, lus dans les agrégats"""
+    try:
+        return {"subject": subject, "topics": analytics.topic_report(subject, days)}
+    except Exception as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+@app.post("/analytics/export")
+async def run_analytics_export():
+    """Lance un export tout de suite (sans attendre le prochain passage)"""
+    try:
+        exported = await analytics_exporter.export_once()
+        return {"exported": exported, "watermarks": analytics.stats()}
+    except Exception as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+@app.get("/retention/stats")
+async def get_retention_stats():
+    """Taille de l'archive des messages et espace libre des fichiers"""
+    try:
+        return retention.stats()
+    except Exception as e:
+        metrics.record_error(e)
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+@app.post("/retention/run")
+async def run_retention():
+    """Lance un passage de rétention tout de suite (sans attendre le prochain)"""
+    try:
+        archived, compacted, freed = await retention.run_once()
+        return {"archived": archived, "compacted": compacted, "freed_pages": freed}
     except Exception as e:
+        metrics.record_error(e)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 if __name__ == "__main__":
@@ -0,0 +1,212 @@
+"""Métriques au format texte Prometheus, sans dépendance externe.
+
+    with stage("db_read"):
+        ...
+
+Les durées par étape sont rattachées à l'endpoint en cours (posé par le
+middleware HTTP via une ContextVar). Les étapes peuvent s'imbriquer :
+``prompt_build`` inclut par exemple ses propres lectures ``db_read``.
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+current_endpoint = ContextVar("current_endpoint", default="background")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # labels -> [compteurs par seau..., somme, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labels, label_values, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, label_values, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._gauge_callbacks = []  # (nom, aide, fonction -> {labels: valeur})
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge_callback(self, name, help_text, label_name, collect):
+        """Jauge calculée à la lecture : ``collect()`` renvoie {valeur_du_label: nombre}"""
+        self._gauge_callbacks.append((name, help_text, label_name, collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_text, label_name, collect in self._gauge_callbacks:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for label_value, value in sorted(collect().items()):
+                lines.append(f"{name}{_format_labels((label_name,), (label_value,))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "tuteur_http_request_duration_seconds", "Durée des requêtes HTTP par endpoint",
+    ("method", "endpoint", "status")
+)
+stage_duration = registry.histogram(
+    "tuteur_stage_duration_seconds", "Durée de chaque étape du traitement, par endpoint",
+    ("endpoint", "stage")
+)
+sqlite_query_duration = registry.histogram(
+    "tuteur_sqlite_query_duration_seconds", "Durée des appels à la base par méthode de Database",
+    ("method",)
+)
+groq_tokens = registry.counter(
+    "tuteur_groq_tokens_total", "Jetons consommés chez Groq (champ usage des réponses)",
+    ("endpoint", "kind")
+)
+groq_retries = registry.counter(
+    "tuteur_groq_retries_total", "Nouveaux essais vers Groq par cause (statut HTTP ou erreur réseau)",
+    ("reason",)
+)
+llm_routing = registry.counter(
+    "tuteur_llm_routing_total", "Routage entre fournisseurs de modèle (bascule, appel doublé, doublon gagnant, échec)",
+    ("provider", "event")
+)
+errors = registry.counter(
+    "tuteur_errors_total", "Erreurs par endpoint et par type d'exception",
+    ("endpoint", "type")
+)
+
+
+@contextmanager
+def stage(name):
+    """Mesure une étape pour l'endpoint en cours"""
+    with stage_duration.time(current_endpoint.get(), name):
+        yield
+
+
+def record_usage(usage):
+    """Comptabilise le champ ``usage`` d'une réponse compatible OpenAI"""
+    if not usage:
+        return
+    endpoint = current_endpoint.get()
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            groq_tokens.inc(endpoint, kind, amount=usage[kind])
+
+
+def record_error(error):
+    errors.inc(current_endpoint.get(), type(error).__name__)
+
+
+READ_PREFIXES = ("get_", "count_", "top_", "check_", "schema_", "search_", "quiz_pool_shortfall")
+
+
+def instrument_database(cls):
+    """Enveloppe les méthodes publiques de ``cls`` pour chronométrer chaque appel.
+
+    Chaque appel alimente l'histogramme SQLite par méthode, et l'étape
+    ``db_read`` ou ``db_write`` de l'endpoint en cours selon le nom de la
+    méthode.
+    """
+    skipped = {"get_connection", "transaction", "close", "for_student", "init_database", "migrate",
+               "attach_write_behind", "attach_shared_state", "data_version"}
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_") or name in skipped or not callable(method):
+            continue
+        kind = "db_read" if name.startswith(READ_PREFIXES) else "db_write"
+        setattr(cls, name, _timed(method, name, kind))
+    return cls
+
+
+def _timed(method, name, kind):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            sqlite_query_duration.observe(elapsed, name)
+            stage_duration.observe(elapsed, current_endpoint.get(), kind)
+    return wrapper
@@ -0,0 +1,271 @@
+"""Fournisseurs de modèle et politique de routage entre eux.
+
+Chaque fournisseur est un client compatible OpenAI (GroqClient) avec son
+propre contrôle d'admission, sa limite de débit et ses nouveaux essais :
+
+- ``groq`` : l'API Groq (GROQ_API_KEY, GROQ_API_URL, GROQ_MODEL) ;
+- ``local`` : un serveur local compatible OpenAI qui tourne sur CPU
+  (``llama-server`` de llama.cpp, Ollama...), activé par LOCAL_LLM_URL.
+
+Un ProviderRouter enchaîne une liste ordonnée de fournisseurs : le premier
+est appelé et le suivant prend le relais s'il échoue (erreur, quota,
+saturation). Si le premier n'a toujours pas répondu au bout de son p95 de
+latence observé, le suivant est lancé en parallèle (« hedging ») : la
+première réponse gagne, l'autre appel est annulé.
+
+Chaque endpoint a sa propre liste (TUTEUR_CHAT_PROVIDERS,
+TUTEUR_QUIZ_PROVIDERS) : la génération de quiz, peu exigeante, peut ainsi
+partir sur le modèle local en gardant Groq en secours.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+import httpx
+import metrics
+from admission import AdmissionController, TokenBucket, Overloaded, PRIORITY_INTERACTIVE
+from groq_client import GroqClient, GroqError
+
+# Erreurs pour lesquelles on passe au fournisseur suivant
+FALLBACK_ERRORS = (GroqError, Overloaded, httpx.HTTPError)
+
+
+def local_from_env():
+    """Serveur local compatible OpenAI, ou None si LOCAL_LLM_URL n'est pas défini"""
+    api_url = os.getenv("LOCAL_LLM_URL")
+    if not api_url:
+        return None
+    return GroqClient(
+        name="local",
+        api_key=os.getenv("LOCAL_LLM_API_KEY"),
+        api_url=api_url,
+        model=os.getenv("LOCAL_LLM_MODEL", "qwen2.5:3b-instruct"),
+        max_connections=int(os.getenv("LOCAL_LLM_MAX_CONCURRENT", "2")),
+        max_keepalive_connections=int(os.getenv("LOCAL_LLM_MAX_CONCURRENT", "2")),
+        read_timeout=float(os.getenv("LOCAL_LLM_READ_TIMEOUT", "120")),
+        # Sur CPU, quelques générations à la fois au plus : le reste attend ou bascule
+        admission=AdmissionController(
+            max_concurrent=int(os.getenv("LOCAL_LLM_MAX_CONCURRENT", "2")),
+            max_queue=int(os.getenv("LOCAL_LLM_MAX_QUEUE", "20")),
+            queue_timeout=float(os.getenv("LOCAL_LLM_QUEUE_TIMEOUT", "30")),
+        ),
+        rate_limiter=TokenBucket(rate=0, burst=1, name="local"),
+        max_retries=int(os.getenv("LOCAL_LLM_MAX_RETRIES", "1")),
+    )
+
+
+def providers_from_env(shared=None):
+    """Fournisseurs configurés, par nom (``shared`` : quota Groq commun à tous les workers)"""
+    providers = {}
+    if os.getenv("GROQ_API_KEY"):
+        providers["groq"] = GroqClient.from_env(shared)
+    local = local_from_env()
+    if local is not None:
+        providers["local"] = local
+    return providers
+
+
+class LatencyWindow:
+    """Latences des derniers appels réussis d'un fournisseur"""
+
+    def __init__(self, size=200, min_samples=20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def quantile(self, q):
+        """Quantile observé, ou None tant qu'il n'y a pas assez de mesures"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class ProviderRouter:
+    """Même interface que GroqClient (chat, complete, stream), répartie sur plusieurs fournisseurs.
+
+    ``hedge_quantile`` : quantile de latence au-delà duquel le fournisseur
+    suivant est lancé en parallèle (None pour ne faire que du secours).
+    Pour ``stream``, la latence mesurée est le délai avant le premier fragment ;
+    une fois le premier fragment reçu, le flux n'est plus jamais basculé.
+    """
+
+    def __init__(self, providers, hedge_quantile=0.95, min_samples=20):
+        self.providers = list(providers)
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self._latency = {}      # nom -> LatencyWindow (réponse complète)
+        self._first_chunk = {}  # nom -> LatencyWindow (premier fragment d'un flux)
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    @classmethod
+    def from_env(cls, providers, variable, default="groq,local"):
+        """Routeur pour un endpoint : ``variable`` liste les fournisseurs dans l'ordre de préférence"""
+        names = [name.strip() for name in os.getenv(variable, default).split(",") if name.strip()]
+        quantile = float(os.getenv("TUTEUR_HEDGE_QUANTILE", "0.95"))
+        return cls(
+            [providers[name] for name in names if name in providers],
+            hedge_quantile=quantile if quantile > 0 else None,
+            min_samples=int(os.getenv("TUTEUR_HEDGE_MIN_SAMPLES", "20")),
+        )
+
+    @property
+    def names(self):
+        return [provider.name for provider in self.providers]
+
+    def _window(self, windows, provider):
+        if provider.name not in windows:
+            windows[provider.name] = LatencyWindow(min_samples=self.min_samples)
+        return windows[provider.name]
+
+    def _hedge_delay(self, windows, running, remaining):
+        """Délai avant de lancer un second fournisseur, ou None (attendre sans limite)"""
+        if self.hedge_quantile is None or len(running) != 1 or not remaining:
+            return None
+        provider = next(iter(running.values()))
+        return self._window(windows, provider).quantile(self.hedge_quantile)
+
+    def _on_fallback(self, provider, error):
+        self.fallbacks += 1
+        metrics.llm_routing.inc(provider.name, "fallback")
+        print(f"🔀 Bascule vers {provider.name} après: {str(error)[:100]}")
+
+    def _on_hedge(self, provider):
+        self.hedged += 1
+        metrics.llm_routing.inc(provider.name, "hedge")
+
+    def _on_failure(self, provider, error):
+        metrics.llm_routing.inc(provider.name, "failure")
+        print(f"⚠️ Échec du fournisseur {provider.name}: {str(error)[:100]}")
+
+    async def _race(self, start, windows):
+        """Lance les fournisseurs selon la politique et renvoie (fournisseur, résultat) du premier succès.
+
+        ``start(provider)`` renvoie une coroutine qui produit le résultat.
+        Les appels perdants sont annulés ; ``_discard`` reçoit leurs résultats éventuels.
+        """
+        if not self.providers:
+            raise GroqError(503, "Aucun fournisseur de modèle configuré")
+
+        async def timed(provider):
+            began = time.perf_counter()
+            result = await start(provider)
+            self._window(windows, provider).add(time.perf_counter() - began)
+            return result
+
+        remaining = list(self.providers)
+        running = {}  # tâche -> fournisseur
+        hedges = set()
+        error = None
+        try:
+            while running or remaining:
+                if not running:
+                    provider = remaining.pop(0)
+                    if error is not None:
+                        self._on_fallback(provider, error)
+                    running[asyncio.ensure_future(timed(provider))] = provider
+                done, _ = await asyncio.wait(
+                    running, timeout=self._hedge_delay(windows, running, remaining),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Le fournisseur en cours dépasse son p95 : on lance le suivant en parallèle
+                    provider = remaining.pop(0)
+                    self._on_hedge(provider)
+                    hedges.add(provider.name)
+                    running[asyncio.ensure_future(timed(provider))] = provider
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    try:
+                        result = task.result()
+                    except FALLBACK_ERRORS as e:
+                        self._on_failure(provider, e)
+                        error = e
+                        continue
+                    if provider.name in hedges:
+                        self.hedge_wins += 1
+                        metrics.llm_routing.inc(provider.name, "won")
+                    return provider, result
+            raise error
+        finally:
+            losers = list(running)
+            for task in losers:
+                task.cancel()
+            if losers:
+                results = await asyncio.gather(*losers, return_exceptions=True)
+                for result in results:
+                    await self._discard(result)
+
+    async def _discard(self, result):
+        # Un flux perdant dont le premier fragment est arrivé trop tard doit être fermé
+        if isinstance(result, tuple) and hasattr(result[1], "aclose"):
+            await result[1].aclose()
+
+    async def chat(self, messages, max_tokens, temperature, priority=PRIORITY_INTERACTIVE):
+        """Envoie la complétion selon la politique de routage et renvoie le JSON complet"""
+        _, result = await self._race(
+            lambda provider: provider.chat(messages, max_tokens, temperature, priority=priority),
+            self._latency
+        )
+        return result
+
+    async def complete(self, messages, max_tokens, temperature, priority=PRIORITY_INTERACTIVE):
+        """Raccourci qui renvoie uniquement le texte de la réponse"""
+        result = await self.chat(messages, max_tokens, temperature, priority=priority)
+        return result["choices"][0]["message"]["content"]
+
+    async def stream(self, messages, max_tokens, temperature, priority=PRIORITY_INTERACTIVE):
+        """Génère le texte fragment par fragment ; la course porte sur le premier fragment"""
+
+        async def first_chunk(provider):
+            chunks = provider.stream(messages, max_tokens, temperature, priority=priority)
+            try:
+                return await chunks.__anext__(), chunks
+            except StopAsyncIteration:
+                return None, chunks
+            except BaseException:
+                await chunks.aclose()
+                raise
+
+        _, (delta, chunks) = await self._race(first_chunk, self._first_chunk)
+        try:
+            if delta is None:
+                return
+            yield delta
+            async for delta in chunks:
+                yield delta
+        finally:
+            await chunks.aclose()
+
+    def stats(self):
+        def percentiles(windows, provider):
+            window = windows.get(provider.name)
+            if window is None or not window.samples:
+                return {"samples": 0}
+            ordered = sorted(window.samples)
+            return {
+                "samples": len(ordered),
+                "p50": round(ordered[len(ordered) // 2], 3),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+            }
+
+        return {
+            "providers": {
+                provider.name: {
+                    "model": provider.model,
+                    "latency": percentiles(self._latency, provider),
+                    "first_chunk": percentiles(self._first_chunk, provider),
+                    "admission": provider.admission.stats(),
+                }
+                for provider in self.providers
+            },
+            "hedge_quantile": self.hedge_quantile,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,212 @@
+"""Extraction, validation et réparation des quiz générés par le LLM.
+
+    quiz_data = parse_quiz(texte_du_llm, topic="La photosynthèse")
+
+Le premier objet JSON de la réponse est extrait (blocs ```json, texte avant
+ou après), les défauts courants sont réparés localement (virgules finales,
+guillemets typographiques, bonne réponse donnée en lettre ou en texte,
+options préfixées « A) »), puis le quiz est validé par un schéma typé. Une
+question irréparable est écartée ; le quiz n'est refusé que s'il n'en reste
+aucune, ce qui évite de régénérer 2000 jetons pour un défaut mineur.
+"""
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import List
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+NUM_OPTIONS = 4
+OPTION_LETTERS = "ABCD"
+
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+OPTION_PREFIX = re.compile(r"^\s*(?:[A-Da-d]|[1-4])\s*[).:\-]\s+")
+LETTER_ANSWER = re.compile(r"^\s*(?:option|réponse)?\s*([A-Da-d])\s*\)?\s*$", re.IGNORECASE)
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"'})
+
+
+class QuizParseError(ValueError):
+    """Réponse du LLM inutilisable, même après réparation"""
+
+
+class QuizQuestion(BaseModel):
+    question: str = Field(min_length=1)
+    options: List[str] = Field(min_length=NUM_OPTIONS, max_length=NUM_OPTIONS)
+    correct_answer: int = Field(ge=0, lt=NUM_OPTIONS)
+    explanation: str = ""
+
+    @field_validator("options")
+    @classmethod
+    def options_not_empty(cls, options):
+        if any(not option.strip() for option in options):
+            raise ValueError("option vide")
+        return options
+
+
+class Quiz(BaseModel):
+    title: str = Field(min_length=1)
+    questions: List[QuizQuestion] = Field(min_length=1)
+
+
+def _repair_json(text):
+    return TRAILING_COMMA.sub(r"\1", text.translate(SMART_QUOTES))
+
+
+def extract_json_object(text):
+    """Renvoie le premier objet JSON présent dans ``text`` (dict), réparé si besoin"""
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        for candidate in (text[start:], _repair_json(text[start:])):
+            try:
+                value, _ = decoder.raw_decode(candidate)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, dict):
+                return value
+        start = text.find("{", start + 1)
+    raise QuizParseError("aucun objet JSON valide dans la réponse")
+
+
+def _repair_answer(raw_answer, options):
+    """Ramène la bonne réponse à un indice 0..3 (entier, chiffre, lettre ou texte de l'option)"""
+    if isinstance(raw_answer, bool):
+        return None
+    if isinstance(raw_answer, int):
+        return raw_answer
+    if isinstance(raw_answer, float) and raw_answer.is_integer():
+        return int(raw_answer)
+    if not isinstance(raw_answer, str):
+        return None
+    answer = raw_answer.strip()
+    if answer.isdigit():
+        return int(answer)
+    match = LETTER_ANSWER.match(answer)
+    if match:
+        return OPTION_LETTERS.index(match.group(1).upper())
+    cleaned = OPTION_PREFIX.sub("", answer).strip().lower()
+    for index, option in enumerate(options):
+        if option.strip().lower() == cleaned:
+            return index
+    return None
+
+
+def _repair_question(raw):
+    """Corrige une question brute ; None si elle reste inutilisable"""
+    if not isinstance(raw, dict):
+        return None
+    options = raw.get("options") or raw.get("choices") or []
+    if isinstance(options, dict):  # {"A": "...", "B": "..."}
+        options = [options[key] for key in sorted(options)]
+    if not isinstance(options, list):
+        return None
+    options = [OPTION_PREFIX.sub("", str(option)).strip() for option in options]
+    answer = _repair_answer(raw.get("correct_answer", raw.get("answer")), options)
+    try:
+        return QuizQuestion(
+            question=str(raw.get("question", "")).strip(),
+            options=options,
+            correct_answer=answer if answer is not None else -1,
+            explanation=str(raw.get("explanation") or "").strip()
+        )
+    except ValidationError:
+        return None
+
+
+def parse_quiz(text, topic=""):
+    """Extrait, répare et valide un quiz ; renvoie le dict normalisé"""
+    raw = extract_json_object(text)
+    raw_questions = raw.get("questions")
+    if not isinstance(raw_questions, list):
+        raise QuizParseError("champ 'questions' absent")
+
+    questions = [q for q in map(_repair_question, raw_questions) if q is not None]
+    dropped = len(raw_questions) - len(questions)
+    if dropped:
+        print(f"⚠️ Quiz '{topic}': {dropped} question(s) invalide(s) écartée(s)")
+    try:
+        quiz = Quiz(title=str(raw.get("title") or f"Quiz : {topic}").strip(), questions=questions)
+    except ValidationError as e:
+        raise QuizParseError(f"quiz invalide: {e.error_count()} erreur(s)") from e
+    return quiz.model_dump()
+
+
+def answer_key(quiz_data):
+    """Clé de correction compacte stockée à part du document : « 0,2,1,3 ».
+
+    Les quiz enregistrés avant quiz_parser peuvent donner la bonne réponse en
+    lettre (« B ») ou en texte : elle est ramenée à un indice par _repair_answer,
+    comme à l'analyse. QuizParseError si une réponse reste illisible.
+    """
+    key = []
+    for question in quiz_data["questions"]:
+        options = [OPTION_PREFIX.sub("", str(option)).strip() for option in question["options"]]
+        answer = _repair_answer(question.get("correct_answer"), options)
+        if answer is None or not 0 <= answer < len(options):
+            raise QuizParseError(f"bonne réponse illisible : {question.get('correct_answer')!r}")
+        key.append(str(answer))
+    return ",".join(key)
+
+
+class CompiledQuiz:
+    """Quiz prêt à corriger : clé de réponses déjà décodée, textes pour le retour à l'élève"""
+
+    __slots__ = ("quiz_id", "subject", "topic", "answer_key", "questions")
+
+    def __init__(self, quiz_id, subject, topic, answer_key, questions):
+        self.quiz_id = quiz_id
+        self.subject = subject
+        self.topic = topic
+        self.answer_key = answer_key
+        self.questions = questions
+
+    @classmethod
+    def from_row(cls, row):
+        quiz_data = json.loads(row["quiz_data"])
+        key = row["answer_key"] or answer_key(quiz_data)
+        return cls(row["id"], row["subject"], row["topic"],
+                   tuple(int(k) for k in key.split(",")), quiz_data["questions"])
+
+    def score(self, answers):
+        """Renvoie (bonnes réponses, détail par question)"""
+        correct = 0
+        results = []
+        for question, expected, user_answer in zip(self.questions, self.answer_key, answers):
+            is_correct = user_answer == expected
+            correct += is_correct
+            options = question["options"]
+            results.append({
+                "question": question["question"],
+                "user_answer": options[user_answer] if 0 <= user_answer < len(options) else None,
+                "correct_answer": options[expected],
+                "is_correct": is_correct,
+                "explanation": question["explanation"]
+            })
+        return correct, results
+
+
+class CompiledQuizCache:
+    """Cache LRU des quiz compilés : un quiz ne change jamais une fois enregistré"""
+
+    def __init__(self, db, max_entries=1000):
+        self.db = db
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, quiz_id):
+        """CompiledQuiz ou None si le quiz n'existe pas"""
+        with self._lock:
+            compiled = self._entries.get(quiz_id)
+            if compiled is not None:
+                self._entries.move_to_end(quiz_id)
+                return compiled
+        row = self.db.get_quiz(quiz_id)
+        if row is None:
+            return None
+        compiled = CompiledQuiz.from_row(row)
+        with self._lock:
+            self._entries[quiz_id] = compiled
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compiled
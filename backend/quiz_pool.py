@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+from admission import SingleFlight, PRIORITY_QUIZ, PRIORITY_BACKGROUND
+from text_utils import normalize_text
+from shared_state import Lease
+
+
+class QuizPool:
+    """Réserve de quiz pré-générés devant /quiz/generate.
+
+    Chaque demande est servie depuis la réserve (quiz déjà générés pour la
+    même matière, le même thème normalisé, la même difficulté et le même
+    nombre de questions, jamais servis à cet élève) et ne passe par le LLM
+    qu'en cas d'absence. Une tâche de fond complète la réserve des
+    combinaisons les plus demandées pour que les suivantes soient instantanées.
+
+    Les absences simultanées pour la même combinaison sont fusionnées : un
+    seul appel au LLM, le quiz obtenu est servi à tous les élèves en attente.
+    """
+
+    def __init__(self, db, generate, target=3, top_combinations=20, interval=60.0, lease=None):
+        self.db = db
+        self.generate = generate  # async (subject, topic, difficulty, num_questions, priority) -> quiz_data
+        self.target = target
+        self.top_combinations = top_combinations
+        self.interval = interval
+        self.lease = lease  # avec plusieurs workers, un seul remplit la réserve
+        self.hits = 0
+        self.misses = 0
+        self.generated_in_background = 0
+        self._task = None
+        self._single_flight = SingleFlight()
+
+    @classmethod
+    def from_env(cls, db, generate, shared=None):
+        interval = float(os.getenv("TUTEUR_QUIZ_POOL_INTERVAL", "60"))
+        return cls(
+            db,
+            generate,
+            target=int(os.getenv("TUTEUR_QUIZ_POOL_TARGET", "3")),
+            top_combinations=int(os.getenv("TUTEUR_QUIZ_POOL_TOP", "20")),
+            interval=interval,
+            lease=Lease(shared, "quiz_pool", ttl=3 * interval) if shared is not None else None,
+        )
+
+    async def get_quiz(self, subject, topic, difficulty, num_questions, student_id):
+        """Renvoie (quiz_id, quiz_data, depuis_la_reserve)"""
+        # Accès SQLite dans des threads : take_pooled_quiz prend le verrou d'écriture
+        # (BEGIN IMMEDIATE) et peut l'attendre jusqu'à busy_timeout
+        await asyncio.to_thread(self.db.record_quiz_demand, subject, topic, difficulty, num_questions)
+
+        pooled = await asyncio.to_thread(
+            self.db.take_pooled_quiz, subject, topic, difficulty, num_questions, student_id=student_id
+        )
+        if pooled is not None:
+            self.hits += 1
+            return pooled["id"], json.loads(pooled["quiz_data"]), True
+
+        self.misses += 1
+
+        async def generate_and_save():
+            quiz_data = await self.generate(subject, topic, difficulty, num_questions, PRIORITY_QUIZ)
+            quiz_id = await asyncio.to_thread(
+                self.db.save_quiz, subject, topic, quiz_data, difficulty=difficulty, num_questions=num_questions
+            )
+            return quiz_id, quiz_data
+
+        key = (subject, normalize_text(topic), difficulty, num_questions)
+        quiz_id, quiz_data = await self._single_flight.do(key, generate_and_save)
+        await asyncio.to_thread(self.db.mark_quiz_served, quiz_id, student_id=student_id)
+        return quiz_id, quiz_data, False
+
+    async def refill_once(self):
+        """Génère les quiz manquants pour les combinaisons populaires"""
+        generated = 0
+        shortfall = await asyncio.to_thread(self.db.quiz_pool_shortfall, self.target, limit=self.top_combinations)
+        for combo in shortfall:
+            for _ in range(combo["missing"]):
+                try:
+                    quiz_data = await self.generate(
+                        combo["subject"], combo["topic"], combo["difficulty"], combo["num_questions"],
+                        PRIORITY_BACKGROUND
+                    )
+                except Exception as e:
+                    print(f"❌ Pré-génération du quiz '{combo['topic']}' impossible: {str(e)}")
+                    break
+                await asyncio.to_thread(
+                    self.db.save_quiz, combo["subject"], combo["topic"], quiz_data,
+                    difficulty=combo["difficulty"], num_questions=combo["num_questions"]
+                )
+                generated += 1
+        self.generated_in_background += generated
+        if generated:
+            print(f"✅ Réserve de quiz complétée: {generated} quiz pré-générés")
+        return generated
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self.lease is not None and not await asyncio.to_thread(self.lease.acquire):
+                    continue
+                await self.refill_once()
+            except Exception as e:
+                print(f"❌ Erreur de la réserve de quiz: {str(e)}")
+
+    def start(self):
+        if self.target > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self.lease is not None:
+                await asyncio.to_thread(self.lease.release)
+
+    def stats(self):
+        served = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / served, 4) if served else 0.0,
+            "generated_in_background": self.generated_in_background,
+            "coalesced": self._single_flight.coalesced,
+            "target_per_combination": self.target
+        }
@@ -0,0 +1,187 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from text_utils import normalize_text
+
+# Débuts de questions qui renvoient à la conversation en cours
+FOLLOW_UP_PATTERN = re.compile(
+    r"^(et|mais|donc|alors|ok|oui|non|pourquoi (ca|cela)|c'est-a-dire|"
+    r"(peux-tu|tu peux) (continuer|developper|reformuler|simplifier|donner un autre)|"
+    r"encore|la suite|continue|developpe|reformule)\b"
+)
+# Pronoms et renvois qui n'ont de sens qu'avec le contexte
+CONTEXT_WORDS = {"ca", "cela", "celui", "celle", "ceux", "celles", "precedent", "precedente",
+                 "dessus", "ci-dessus", "la-dessus", "ton", "ta", "tes"}
+MIN_SELF_CONTAINED_WORDS = 4
+SHARED_NAMESPACE = "reponses"
+# Mots courts sans contenu propre : ils peuvent différer entre deux questions proches
+SHORT_FUNCTION_WORDS = {"le", "la", "les", "un", "une", "des", "de", "du", "et", "ou", "en", "au", "aux",
+                        "il", "ils", "on", "ne", "se", "sa", "son", "ses", "ce", "qui", "que", "qu", "est",
+                        "pas", "par", "sur", "je", "tu", "me", "te", "nous", "mon", "ma", "mes", "ton", "ta",
+                        "tes", "lui", "ete", "pour", "moi", "toi"}
+
+
+normalize_question = normalize_text
+
+
+def shared_key(subject, normalized):
+    return f"{subject}\x1f{normalized}"
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def key_tokens(text):
+    """Nombres et mots courts porteurs de sens (« 1940 », « x », « adn »).
+
+    Les trigrammes les voient à peine : « chromosome X » et « chromosome Y »
+    sont presque identiques pour Jaccard, mais n'appellent pas la même réponse.
+    """
+    return frozenset(
+        token for token in re.findall(r"\w+", text)
+        if any(c.isdigit() for c in token) or (len(token) <= 3 and token not in SHORT_FUNCTION_WORDS)
+    )
+
+
+class ResponseCache:
+    """Cache LRU + TTL des réponses du tuteur, par matière et question normalisée.
+
+    Deux niveaux : correspondance exacte sur la question normalisée, puis
+    (si ``similarity_threshold`` > 0, désactivé par défaut) recherche de la
+    question la plus proche par similarité de Jaccard sur les trigrammes de
+    caractères, calculée localement. Une question proche n'est retenue que si
+    elle a exactement les mêmes nombres et mots courts (key_tokens) : « passé
+    en 1940 » ne sert jamais la réponse de « passé en 1944 ».
+
+    Avec plusieurs workers, ``shared`` (SharedStore) garde aussi chaque réponse
+    sous sa question normalisée : une réponse obtenue par un worker sert aux
+    autres en correspondance exacte, puis entre dans leur cache local.
+    """
+
+    def __init__(self, max_entries=1000, ttl=86400, similarity_threshold=0.0, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.shared = shared
+        self._entries = OrderedDict()  # (subject, question normalisée) -> (réponse, expiration, trigrammes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @classmethod
+    def from_env(cls, shared=None):
+        return cls(
+            max_entries=int(os.getenv("TUTEUR_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("TUTEUR_CACHE_TTL", "86400")),
+            similarity_threshold=float(os.getenv("TUTEUR_CACHE_SIMILARITY", "0")),
+            shared=shared,
+        )
+
+    def is_cacheable(self, question, history):
+        """Faux si la réponse dépend de la conversation en cours.
+
+        Sans historique, toute question est autonome. Sinon, les questions
+        courtes, les relances (« et pourquoi ça ? ») et les renvois au contexte
+        contournent le cache.
+        """
+        if self.max_entries <= 0:
+            return False
+        if not history:
+            return True
+        normalized = normalize_question(question)
+        words = normalized.split()
+        if len(words) < MIN_SELF_CONTAINED_WORDS:
+            return False
+        if FOLLOW_UP_PATTERN.match(normalized):
+            return False
+        return not any(word in CONTEXT_WORDS for word in words)
+
+    def get(self, subject, question):
+        """Renvoie la réponse en cache ou None"""
+        normalized = normalize_question(question)
+        key = (subject, normalized)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+
+        if self.shared is not None:
+            answer = self.shared.cache_get(SHARED_NAMESPACE, shared_key(subject, normalized))
+            if answer is not None:
+                with self._lock:
+                    self._store(key, answer)
+                    self.shared_hits += 1
+                return answer
+
+        with self._lock:
+            if self.similarity_threshold > 0:
+                match = self._find_similar(subject, normalized, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.similar_hits += 1
+                    return self._entries[match][0]
+
+            self.misses += 1
+            return None
+
+    def _find_similar(self, subject, normalized, now):
+        query = trigrams(normalized)
+        tokens = key_tokens(normalized)
+        best_key, best_score = None, self.similarity_threshold
+        for key, (_, expires_at, grams) in self._entries.items():
+            if key[0] != subject or expires_at <= now:
+                continue
+            score = len(query & grams) / len(query | grams)
+            if score >= best_score and key_tokens(key[1]) == tokens:
+                best_key, best_score = key, score
+        return best_key
+
+    def put(self, subject, question, answer):
+        normalized = normalize_question(question)
+        key = (subject, normalized)
+        with self._lock:
+            self._store(key, answer)
+        if self.shared is not None:
+            self.shared.cache_put(SHARED_NAMESPACE, shared_key(subject, normalized), answer, self.ttl)
+
+    def _store(self, key, answer):
+        self._entries[key] = (answer, time.monotonic() + self.ttl, trigrams(key[1]))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.shared is not None:
+            self.shared.cache_clear(SHARED_NAMESPACE)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round((self.hits + self.similar_hits + self.shared_hits) / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,153 @@
+"""Rétention : les tables chaudes ne gardent que les données récentes.
+
+Un passage, pour chaque fichier de données d'élèves :
+
+- les messages de plus de TUTEUR_RETENTION_DAYS jours quittent chat_history
+  pour des blocs compressés (zlib) de chat_archive, par élève et matière,
+  une fois comptés par la base d'analyse ; /history continue de les servir
+  quand on remonte jusqu'à eux ;
+- les lignes de progression de cet âge sont regroupées par élève, matière,
+  type d'activité et jour (les totaux ne changent pas), mais seulement une
+  fois copiées dans la base d'analyse : elle les compte une à une ;
+- les pages libérées sont rendues au système (incremental_vacuum).
+
+Tout se fait par petits lots, chacun dans sa propre transaction : les
+requêtes de l'application passent entre deux lots.
+
+    python retention.py run         # un passage (ex. depuis cron)
+    python retention.py stats
+"""
+import asyncio
+import os
+from shared_state import Lease
+
+
+class Retention:
+    """Tâche de fond qui lance un passage de rétention toutes les ``interval`` secondes.
+
+    Avec plusieurs workers, ``lease`` réserve la tâche à un seul d'entre eux.
+    ``analytics`` (AnalyticsStore) borne l'archivage des messages et le regroupement
+    de la progression aux lignes déjà exportées ; sans elle, toutes les lignes
+    assez anciennes sont traitées.
+    """
+
+    def __init__(self, stores, days=90, block_size=200, batch_size=500, interval=3600.0, lease=None,
+                 analytics=None):
+        self.stores = stores
+        self.analytics = analytics
+        self.days = days
+        self.block_size = block_size
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+        self.archived = 0
+        self.compacted = 0
+        self.freed_pages = 0
+        self._task = None
+
+    @classmethod
+    def from_env(cls, db, analytics, shared=None):
+        """TUTEUR_RETENTION_DAYS (0 : tout garder), TUTEUR_ARCHIVE_BLOCK, TUTEUR_RETENTION_BATCH,
+        TUTEUR_RETENTION_INTERVAL (0 : pas de tâche de fond)"""
+        interval = float(os.getenv("TUTEUR_RETENTION_INTERVAL", "3600"))
+        return cls(
+            db.student_stores,
+            days=int(os.getenv("TUTEUR_RETENTION_DAYS", "90")),
+            block_size=int(os.getenv("TUTEUR_ARCHIVE_BLOCK", "200")),
+            batch_size=int(os.getenv("TUTEUR_RETENTION_BATCH", "500")),
+            interval=interval,
+            lease=Lease(shared, "retention", ttl=3 * interval) if shared is not None else None,
+            analytics=analytics,
+        )
+
+    def run_once_sync(self):
+        """Un passage complet ; renvoie (messages archivés, lignes de progression supprimées, pages rendues)"""
+        archived = compacted = freed = 0
+        if self.days > 0:
+            for store in self.stores:
+                archived += store.archive_chat_history(
+                    self.days, block_size=self.block_size, exported_id=self.exported_until(store, "chat_history")
+                )
+                compacted += store.compact_progress(
+                    self.days, batch_size=self.batch_size, exported_id=self.exported_until(store, "progress")
+                )
+                freed += store.incremental_vacuum()
+        self.archived += archived
+        self.compacted += compacted
+        self.freed_pages += freed
+        return archived, compacted, freed
+
+    def exported_until(self, store, table):
+        return None if self.analytics is None else self.analytics.exported_until(store, table)
+
+    async def run_once(self):
+        # Hors de la boucle d'événements : un premier passage sur une grosse base prend du temps
+        return await asyncio.to_thread(self.run_once_sync)
+
+    async def _run(self):
+        while True:
+            try:
+                if self.lease is not None and not await asyncio.to_thread(self.lease.acquire):
+                    await asyncio.sleep(self.interval)
+                    continue
+                archived, compacted, freed = await self.run_once()
+                if archived or compacted or freed:
+                    print(f"🗄️ Rétention: {archived} messages archivés, {compacted} lignes de progression "
+                          f"regroupées, {freed} pages rendues")
+            except Exception as e:
+                print(f"❌ Erreur de la rétention: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.interval > 0 and self.days > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self.lease is not None:
+                await asyncio.to_thread(self.lease.release)
+
+    def stats(self):
+        totals = {}
+        for store in self.stores:
+            for key, value in store.get_archive_stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return {
+            "retention_days": self.days,
+            "archived_since_start": self.archived,
+            "compacted_since_start": self.compacted,
+            "freed_pages_since_start": self.freed_pages,
+            **totals
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from database import open_database
+    from analytics import AnalyticsStore
+
+    parser = argparse.ArgumentParser(description="Rétention de l'historique et de la progression")
+    parser.add_argument("command", choices=["run", "stats"])
+    parser.add_argument("--days", type=int, help="âge d'archivage (défaut : TUTEUR_RETENTION_DAYS)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = open_database(write_behind=False)
+    analytics = AnalyticsStore.from_env()
+    retention = Retention.from_env(db, analytics)
+    if args.days is not None:
+        retention.days = args.days
+    if args.command == "run":
+        archived, compacted, freed = retention.run_once_sync()
+        print(f"✅ {archived} messages archivés, {compacted} lignes de progression regroupées, {freed} pages rendues")
+    for key, value in retention.stats().items():
+        print(f"{key}: {value}")
+    analytics.close()
+    db.close()
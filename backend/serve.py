@@ -0,0 +1,59 @@
+"""Point d'entrée de production : plusieurs processus uvicorn sur le même port.
+
+    cd backend
+    python serve.py                       # TUTEUR_WORKERS processus (défaut : un par cœur)
+    TUTEUR_WORKERS=4 PORT=8080 python serve.py
+
+Chaque worker a sa boucle d'événements, ses connexions SQLite et son pool
+HTTP. Ce qui doit rester cohérent d'un worker à l'autre passe par le fichier
+TUTEUR_SHARED_STATE (défini ici dès qu'il y a plus d'un worker) : versions
+des statistiques, quota Groq, cache des réponses et baux des tâches de fond.
+Les migrations et la construction du frontend (frontend.py) sont faites
+une fois, avant le lancement des workers.
+"""
+import os
+import uvicorn
+from dotenv import load_dotenv
+from database import open_database
+from shared_state import SharedStore
+from frontend import build_frontend, SOURCE_DIR, STATIC_DIR
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    load_dotenv()
+    workers = int(os.getenv("TUTEUR_WORKERS", str(os.cpu_count() or 1)))
+    if workers > 1:
+        # Hérité par les workers
+        os.environ.setdefault("TUTEUR_SHARED_STATE", "tuteur_shared.db")
+
+    # Frontend construit une fois, chargé ensuite par chaque worker
+    if os.getenv("TUTEUR_BUILD_FRONTEND", "1") != "0":
+        source = os.getenv("TUTEUR_FRONTEND_DIR", SOURCE_DIR)
+        if os.path.exists(os.path.join(source, "index.html")):
+            build_frontend(source, os.getenv("TUTEUR_STATIC_DIR", STATIC_DIR))
+            print(f"✅ Frontend construit depuis {source}")
+
+    # Schéma et migrations à jour avant que les workers n'ouvrent la base
+    shared = SharedStore.from_env()
+    open_database(shared, write_behind=False).close()
+    if shared is not None:
+        shared.close()
+
+    print(f"🚀 {workers} worker(s) sur le port {os.getenv('PORT', '8000')}")
+    uvicorn.run(
+        "main:app",
+        app_dir=BACKEND_DIR,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+        timeout_keep_alive=int(os.getenv("TUTEUR_KEEPALIVE", "5")),
+        # Laisse aux flux /chat/stream en cours le temps de finir lors d'un redémarrage
+        timeout_graceful_shutdown=int(os.getenv("TUTEUR_GRACEFUL_TIMEOUT", "30")),
+        log_level=os.getenv("TUTEUR_LOG_LEVEL", "warning"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""État partagé entre les processus workers, dans un petit fichier SQLite local.
+
+Avec un seul processus, versions, quota, cache et tâches de fond vivent en
+mémoire. Avec plusieurs workers (``python serve.py``, TUTEUR_SHARED_STATE),
+ce qui doit être commun à tous est rangé dans ce fichier :
+
+- versions des statistiques (cache de get_statistics et ETag) ;
+- seau de jetons du quota Groq : le quota vaut pour l'ensemble des workers ;
+- réponses du cache du tuteur (correspondance exacte) ;
+- baux des tâches de fond : un seul worker pré-génère les quiz et exporte
+  vers la base d'analyse.
+
+Chaque opération est une transaction de quelques microsecondes ; les
+lectures-modifications prennent le verrou d'écriture dès le début
+(BEGIN IMMEDIATE) et attendent au plus ``busy_timeout`` s'il est pris.
+Ces méthodes sont synchrones : depuis le code asynchrone, elles s'appellent
+dans un thread (asyncio.to_thread), jamais sur la boucle d'événements.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from admission import Overloaded
+
+SHARED_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",   # état reconstructible : pas besoin d'un fsync par écriture
+}
+
+SHARED_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS counters (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS token_buckets (
+        name TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS cache_entries (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (namespace, key)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries(expires_at)",
+    """CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID""",
+]
+
+PRUNE_EVERY = 500  # écritures dans le cache entre deux purges des entrées expirées
+
+
+class SharedStore:
+    """Fichier SQLite partagé par les workers d'une même machine"""
+
+    def __init__(self, path="tuteur_shared.db", busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._puts = 0
+        with self.transaction() as conn:
+            for statement in SHARED_SCHEMA:
+                conn.execute(statement)
+
+    @classmethod
+    def from_env(cls):
+        """Store partagé si TUTEUR_SHARED_STATE est défini, sinon None (tout reste en mémoire)"""
+        path = os.getenv("TUTEUR_SHARED_STATE")
+        if not path:
+            return None
+        return cls(path, busy_timeout=float(os.getenv("TUTEUR_BUSY_TIMEOUT", "5")))
+
+    def get_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Mode autocommit : les transactions sont ouvertes explicitement
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            for name, value in SHARED_PRAGMAS.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    # ========== COMPTEURS ET RÉGLAGES ==========
+
+    def get_counter(self, key):
+        row = self.get_connection().execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def increment(self, keys):
+        """Incrémente plusieurs compteurs en une transaction"""
+        with self.transaction() as conn:
+            conn.executemany(
+                """INSERT INTO counters (key, value) VALUES (?, 1)
+                   ON CONFLICT(key) DO UPDATE SET value = value + 1""",
+                [(key,) for key in keys]
+            )
+
+    def get_setting(self, key, default):
+        """Valeur du réglage, créée avec ``default`` si elle n'existe pas encore"""
+        conn = self.get_connection()
+        row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            return row[0]
+        conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, default))
+        return conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()[0]
+
+    def set_setting(self, key, value):
+        self.get_connection().execute(
+            "INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    # ========== SEAU DE JETONS ==========
+
+    def reserve_token(self, name, rate, burst, max_wait):
+        """Réserve un jeton ; renvoie (attente nécessaire, réservé), sans réserver si l'attente dépasse ``max_wait``"""
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?", (name,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            wait = max(0.0, (1 - tokens) / rate)
+            if wait > max_wait:
+                return wait, False
+            conn.execute(
+                """INSERT INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)
+                   ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated""",
+                (name, tokens - 1, now)
+            )
+        return wait, True
+
+    # ========== CACHE ==========
+
+    def cache_get(self, namespace, key):
+        row = self.get_connection().execute(
+            "SELECT value FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def cache_put(self, namespace, key, value, ttl):
+        now = time.time()
+        conn = self.get_connection()
+        conn.execute(
+            """INSERT INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at""",
+            (namespace, key, value, now + ttl)
+        )
+        self._puts += 1
+        if self._puts % PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+
+    def cache_clear(self, namespace):
+        self.get_connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+
+    # ========== BAUX ==========
+
+    def try_lease(self, name, owner, ttl):
+        """Prend ou prolonge le bail ``name`` pour ``owner`` ; faux si un autre le détient encore"""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                """INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                   ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                   WHERE leases.owner = excluded.owner OR leases.expires_at <= ?""",
+                (name, owner, now + ttl, now)
+            )
+            row = conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+        return row[0] == owner
+
+    def release_lease(self, name, owner):
+        self.get_connection().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+
+class LocalVersions:
+    """Compteurs de versions en mémoire (un seul processus)"""
+
+    def __init__(self):
+        self.instance = uuid.uuid4().hex[:8]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._values.get(key, 0)
+
+    def bump(self, keys):
+        with self._lock:
+            for key in keys:
+                self._values[key] = self._values.get(key, 0) + 1
+
+    def reset(self):
+        """Nouvelle instance : les anciennes versions (et ETag) ne correspondent plus à rien"""
+        self.instance = uuid.uuid4().hex[:8]
+
+
+class SharedVersions:
+    """Mêmes compteurs, rangés dans le store partagé : une écriture faite par un
+    worker invalide le cache et les ETag de tous les autres"""
+
+    def __init__(self, store, scope):
+        self.store = store
+        self.scope = scope  # fichier de base concerné
+
+    @property
+    def instance(self):
+        return self.store.get_setting(f"instance:{self.scope}", uuid.uuid4().hex[:8])
+
+    def _key(self, key):
+        return "\x1f".join((self.scope,) + tuple(key))
+
+    def get(self, key):
+        return self.store.get_counter(self._key(key))
+
+    def bump(self, keys):
+        self.store.increment([self._key(key) for key in keys])
+
+    def reset(self):
+        self.store.set_setting(f"instance:{self.scope}", uuid.uuid4().hex[:8])
+
+
+class SharedTokenBucket:
+    """TokenBucket dont le solde est commun à tous les workers"""
+
+    def __init__(self, store, name, rate, burst):
+        self.store = store
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    async def acquire(self, max_wait):
+        """Prend un jeton, en attendant au plus ``max_wait`` secondes (sinon Overloaded)"""
+        if self.rate <= 0:
+            return
+        # Dans un thread : BEGIN IMMEDIATE peut attendre le verrou jusqu'à busy_timeout
+        wait, reserved = await asyncio.to_thread(self.store.reserve_token, self.name, self.rate, self.burst, max_wait)
+        if not reserved:
+            raise Overloaded(wait, f"Quota {self.name} atteint")
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class Lease:
+    """Bail d'une tâche de fond : un seul worker la fait tourner à la fois.
+
+    Le bail expire au bout de ``ttl`` secondes s'il n'est pas renouvelé : si le
+    worker qui le détient meurt, un autre reprend la tâche au passage suivant.
+    """
+
+    def __init__(self, store, name, ttl):
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def acquire(self):
+        return self.store.try_lease(self.name, self.owner, self.ttl)
+
+    def release(self):
+        self.store.release_lease(self.name, self.owner)
@@ -0,0 +1,46 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Les modules du backend s'importent à plat (comme depuis main.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Base neuve, toutes migrations appliquées"""
+    database = Database(str(tmp_path / "tuteur.db"))
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def ticks_during():
+    """Exécute ``coro`` en comptant les tours d'une autre tâche (toutes les 10 ms) :
+    renvoie (tours, exception levée par ``coro`` ou None). Zéro tour = boucle bloquée."""
+    def run(coro):
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            task = asyncio.create_task(ticker())
+            await asyncio.sleep(0)
+            try:
+                await coro
+                error = None
+            except Exception as e:
+                error = e
+            task.cancel()
+            return ticks, error
+
+        return asyncio.run(scenario())
+    return run
@@ -0,0 +1,56 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from admission import Overloaded, TokenBucket
+from shared_state import SharedStore, SharedTokenBucket
+
+
+def test_quota_message_names_the_provider():
+    bucket = TokenBucket(rate=0.01, burst=1, name="local")
+    asyncio.run(bucket.acquire(max_wait=0))
+    with pytest.raises(Overloaded, match="Quota local atteint"):
+        asyncio.run(bucket.acquire(max_wait=0))
+
+
+def test_shared_quota_message_names_the_provider(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.db"))
+    try:
+        bucket = SharedTokenBucket(store, "local", rate=0.01, burst=1)
+        asyncio.run(bucket.acquire(max_wait=0))
+        with pytest.raises(Overloaded, match="Quota local atteint"):
+            asyncio.run(bucket.acquire(max_wait=0))
+    finally:
+        store.close()
+
+
+def test_shared_bucket_does_not_block_the_event_loop(tmp_path):
+    path = str(tmp_path / "shared.db")
+    store = SharedStore(path, busy_timeout=0.5)
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")  # un autre worker tient le verrou
+    bucket = SharedTokenBucket(store, "groq", rate=10, burst=1)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        with pytest.raises(sqlite3.OperationalError):
+            await bucket.acquire(max_wait=0)
+        task.cancel()
+        return ticks
+
+    try:
+        # Pendant l'attente du verrou (0,5 s), la boucle a continué de tourner
+        assert asyncio.run(scenario()) >= 10
+    finally:
+        other.rollback()
+        other.close()
+        store.close()
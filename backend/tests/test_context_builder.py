@@ -0,0 +1,29 @@
+from context_builder import ContextBuilder
+
+
+def test_overflow_is_summarized_oldest_first(db):
+    for turn in range(10):
+        db.save_message("svt", "user", f"Question {turn}.", student_id="eleve_1")
+        db.save_message("svt", "assistant", f"Réponse {turn}.", student_id="eleve_1")
+    # Fenêtre de 4 messages environ, 3 messages résumés par appel : 16 débordent d'un coup
+    builder = ContextBuilder(history_budget=40, summary_budget=1000, page_size=4, max_summarized_per_update=3)
+
+    builder.build(db, "svt", "eleve_1", "système", "Nouvelle question ?")
+    summary, until_id = db.get_conversation_summary("svt", student_id="eleve_1")
+    assert summary.splitlines() == [
+        "- L'élève a demandé : Question 0.", "  Réponse : Réponse 0.", "- L'élève a demandé : Question 1."
+    ]
+    assert until_id == 3
+
+    # Les appels suivants reprennent juste après, sans rien sauter
+    for _ in range(10):
+        builder.build(db, "svt", "eleve_1", "système", "Nouvelle question ?")
+    summary, until_id = db.get_conversation_summary("svt", student_id="eleve_1")
+    lines = summary.splitlines()
+    assert lines[:4] == [
+        "- L'élève a demandé : Question 0.", "  Réponse : Réponse 0.",
+        "- L'élève a demandé : Question 1.", "  Réponse : Réponse 1.",
+    ]
+    _, oldest_kept_id, _ = builder._pack_history(db, "svt", "eleve_1")
+    assert until_id == oldest_kept_id - 1
+    assert len(lines) == until_id
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from database import Database
+from quiz_parser import CompiledQuiz, QuizParseError, answer_key
+
+LEGACY_QUIZ = {
+    "title": "Quiz : la cellule",
+    "questions": [
+        {"question": "Où se trouve l'ADN ?", "options": ["A) Noyau", "B) Membrane", "C) Paroi", "D) Vacuole"],
+         "correct_answer": "A", "explanation": ""},
+        {"question": "Organite de la respiration ?", "options": ["Ribosome", "Mitochondrie", "Golgi", "Noyau"],
+         "correct_answer": "B", "explanation": ""},
+        {"question": "Organite de la photosynthèse ?", "options": ["Chloroplaste", "Noyau", "Golgi", "Ribosome"],
+         "correct_answer": "Chloroplaste", "explanation": ""},
+    ]
+}
+
+
+def insert_legacy_quiz(db):
+    # Quiz enregistré avant la migration 6 : réponse en lettre ou en texte, pas de clé
+    with db.transaction() as conn:
+        return conn.execute(
+            "INSERT INTO quizzes (subject, topic, quiz_data) VALUES ('svt', 'la cellule', ?)",
+            (json.dumps(LEGACY_QUIZ),)
+        ).lastrowid
+
+
+def test_answer_key_normalises_letters_and_text():
+    assert answer_key(LEGACY_QUIZ) == "0,1,0"
+
+
+def test_answer_key_rejects_unreadable_answer():
+    quiz = {"questions": [{"options": ["a", "b", "c", "d"], "correct_answer": "E"}]}
+    with pytest.raises(QuizParseError):
+        answer_key(quiz)
+
+
+def test_legacy_quiz_without_key_can_be_graded(db):
+    quiz_id = insert_legacy_quiz(db)
+    quiz = CompiledQuiz.from_row(db.get_quiz(quiz_id))
+    assert quiz.answer_key == (0, 1, 0)
+    correct, results = quiz.score([0, 1, 2])
+    assert correct == 2
+    assert results[2]["correct_answer"] == "Chloroplaste"
+
+
+def test_migration_backfills_legacy_keys(tmp_path):
+    path = str(tmp_path / "tuteur.db")
+    db = Database(path)
+    quiz_id = insert_legacy_quiz(db)
+    # Fichier migré avant la correction : clé absente, schéma à la version 8
+    db.get_connection().execute("PRAGMA user_version = 8")
+    db.close()
+
+    db = Database(path)
+    try:
+        row = db.get_connection().execute("SELECT answer_key FROM quizzes WHERE id = ?", (quiz_id,)).fetchone()
+        assert row["answer_key"] == "0,1,0"
+    finally:
+        db.close()
@@ -0,0 +1,45 @@
+import importlib
+import sqlite3
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """Module main importé dans un répertoire vide (tuteur_educatif.db relatif), base mono-fichier"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TUTEUR_BUSY_TIMEOUT", "0.5")
+    monkeypatch.setenv("TUTEUR_ANALYTICS_DB", str(tmp_path / "analytics.db"))
+    for name in ("TUTEUR_SHARED_STATE", "TUTEUR_DB_SHARDS", "TUTEUR_WRITE_BATCH"):
+        monkeypatch.delenv(name, raising=False)
+    sys.modules.pop("main", None)
+    module = importlib.import_module("main")
+    yield module
+    module.db.close()
+    module.analytics.close()
+    sys.modules.pop("main", None)
+
+
+@pytest.fixture
+def locked(main):
+    """Un autre worker tient le verrou d'écriture de la base pendant le test"""
+    other = sqlite3.connect("tuteur_educatif.db")
+    other.execute("BEGIN IMMEDIATE")
+    yield
+    other.rollback()
+    other.close()
+
+
+def test_history_does_not_block_the_event_loop(main, locked, ticks_during):
+    # Message encore en file : la lecture l'écrit d'abord (verrou d'écriture)
+    main.db.save_message("svt", "user", "Qu'est-ce qu'une cellule ?", student_id="eleve_1")
+    ticks, _ = ticks_during(main.get_history("svt", student_id="eleve_1"))
+    assert ticks >= 10  # la boucle a tourné pendant l'attente du verrou (0,5 s)
+
+
+def test_quiz_generate_does_not_block_the_event_loop(main, locked, ticks_during):
+    request = main.QuizRequest(subject="svt", topic="la cellule", student_id="eleve_1")
+    ticks, error = ticks_during(main.generate_quiz(request))
+    assert isinstance(error, main.HTTPException)
+    assert ticks >= 10
@@ -0,0 +1,34 @@
+from database import MIGRATIONS, Database, ShardedDatabase
+
+
+def test_fresh_database_is_fully_migrated(db):
+    assert db.schema_version() == MIGRATIONS[-1][0]
+
+
+def test_hot_queries_use_indexes(db):
+    assert db.check_indexes() == []
+
+
+def test_hot_queries_use_indexes_after_reopening(tmp_path):
+    # Les migrations ne doivent pas dépendre d'un premier lancement
+    path = str(tmp_path / "tuteur.db")
+    Database(path).close()
+    db = Database(path)
+    try:
+        assert db.check_indexes() == []
+    finally:
+        db.close()
+
+
+def test_hot_queries_use_indexes_on_every_shard(tmp_path):
+    db = ShardedDatabase(str(tmp_path / "shards"), 2)
+    try:
+        for store in [db.catalog, *db.student_stores]:
+            assert store.check_indexes() == []
+    finally:
+        db.close()
+
+
+def test_check_indexes_reports_missing_index(db):
+    db.get_connection().execute("DROP INDEX idx_student_totals_points")
+    assert "top_students" in {name for name, _ in db.check_indexes()}
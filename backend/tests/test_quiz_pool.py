@@ -0,0 +1,42 @@
+import asyncio
+import sqlite3
+
+from database import Database
+from quiz_pool import QuizPool
+
+
+def test_get_quiz_does_not_block_the_event_loop(tmp_path, ticks_during):
+    path = str(tmp_path / "catalog.db")
+    db = Database(path, busy_timeout=0.5)
+    other = sqlite3.connect(path)
+    try:
+        other.execute("BEGIN IMMEDIATE")  # un autre worker tient le verrou d'écriture
+
+        async def generate(*args):
+            raise AssertionError("la base est verrouillée avant tout appel au LLM")
+
+        pool = QuizPool(db, generate)
+        ticks, error = ticks_during(pool.get_quiz("svt", "la cellule", "moyen", 5, student_id="eleve_1"))
+        assert isinstance(error, sqlite3.OperationalError)
+        assert ticks >= 10  # la boucle a tourné pendant l'attente du verrou (0,5 s)
+    finally:
+        other.rollback()
+        other.close()
+        db.close()
+
+
+def test_refill_then_serve_from_pool(db, ticks_during):
+    quiz = {"title": "Quiz", "questions": [
+        {"question": "Q ?", "options": ["a", "b", "c", "d"], "correct_answer": 1, "explanation": ""}
+    ]}
+
+    async def generate(*args):
+        return quiz
+
+    pool = QuizPool(db, generate, target=2)
+    _, error = ticks_during(pool.get_quiz("svt", "la cellule", "moyen", 1, student_id="eleve_1"))
+    assert error is None
+    assert asyncio.run(pool.refill_once()) == 2
+    quiz_id, _, from_pool = asyncio.run(pool.get_quiz("svt", "La cellule", "moyen", 1, student_id="eleve_2"))
+    assert from_pool
+    assert pool.stats()["hits"] == 1
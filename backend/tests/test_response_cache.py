@@ -0,0 +1,41 @@
+import pytest
+
+from response_cache import ResponseCache, normalize_question, trigrams
+
+NEAR_MISSES = [
+    ("Quelle est la différence entre le chromosome X chez les mammifères et les autres ?",
+     "Quelle est la différence entre le chromosome Y chez les mammifères et les autres ?"),
+    ("Qu'est-ce qui s'est passé en 1940 en France pendant la guerre ?",
+     "Qu'est-ce qui s'est passé en 1944 en France pendant la guerre ?"),
+    ("Quelles sont les causes principales et les conséquences de la guerre de 1870 en Europe ?",
+     "Quelles sont les causes principales et les conséquences de la guerre de 1914 en Europe ?"),
+]
+
+
+def similarity(a, b):
+    a, b = trigrams(normalize_question(a)), trigrams(normalize_question(b))
+    return len(a & b) / len(a | b)
+
+
+def test_exact_match_only_by_default():
+    cache = ResponseCache()
+    cache.put("svt", "Qu'est-ce que la photosynthèse ?", "réponse")
+    assert cache.get("svt", "qu'est-ce que la photosynthese") == "réponse"
+    assert cache.get("svt", "Qu'est-ce que la photosynthèse chez les plantes ?") is None
+
+
+@pytest.mark.parametrize("cached, asked", NEAR_MISSES)
+def test_near_misses_are_not_served(cached, asked):
+    # Assez proches pour passer le seuil : seuls les nombres ou lettres les séparent
+    assert similarity(cached, asked) >= 0.85
+    for cache in (ResponseCache(), ResponseCache(similarity_threshold=0.85)):
+        cache.put("histoire_geo", cached, "réponse pour une autre question")
+        assert cache.get("histoire_geo", asked) is None
+
+
+def test_similar_question_with_same_key_tokens_is_served():
+    cache = ResponseCache(similarity_threshold=0.85)
+    cache.put("svt", "Explique le rôle de l'ADN dans la cellule en 1 phrase", "réponse")
+    assert cache.get("svt", "Explique moi le role de l'ADN dans la cellule en 1 phrase") == "réponse"
+    assert cache.get("svt", "Explique le rôle de l'ARN dans la cellule en 1 phrase") is None
+    assert cache.stats()["similar_hits"] == 1
@@ -0,0 +1,105 @@
+from analytics import AnalyticsStore
+from retention import Retention
+
+DAYS_AGO = (200, 200, 200, 150, 150, 120)
+
+
+def fill_progress(db, student_id="eleve_1"):
+    """Trois interactions il y a 200 jours, deux il y a 150, une il y a 120, et un quiz"""
+    with db.transaction() as conn:
+        for index, days in enumerate(DAYS_AGO):
+            conn.execute(
+                """INSERT INTO progress (student_id, subject, activity_type, points, timestamp)
+                   VALUES (?, 'svt', 'interaction', 5, datetime('now', ?, ?))""",
+                (student_id, f"-{days} days", f"+{index} minutes")
+            )
+        conn.execute(
+            """INSERT INTO progress (student_id, subject, activity_type, points, details, timestamp)
+               VALUES (?, 'svt', 'quiz_completed', 40, '{"score": 80}', datetime('now', '-200 days'))""",
+            (student_id,)
+        )
+    db.rebuild_summary()
+
+
+def progress_rows(db):
+    return db.get_connection().execute("SELECT COUNT(*) FROM progress").fetchone()[0]
+
+
+def analytics_totals(analytics):
+    rows = analytics.daily_report("svt", days=365)
+    return sum(row["interactions"] for row in rows), sum(row["points"] for row in rows)
+
+
+def test_nothing_is_compacted_before_export(db, tmp_path):
+    fill_progress(db)
+    analytics = AnalyticsStore(str(tmp_path / "analytics.db"))
+    try:
+        assert Retention([db], days=90, analytics=analytics).run_once_sync()[1] == 0
+        assert progress_rows(db) == 7
+    finally:
+        analytics.close()
+
+
+def test_compaction_keeps_summary_and_analytics_totals(db, tmp_path):
+    fill_progress(db)
+    before = db.get_statistics("svt", student_id="eleve_1")
+    analytics = AnalyticsStore(str(tmp_path / "analytics.db"))
+    try:
+        analytics.export([db])
+        assert analytics_totals(analytics) == (6, 70)
+
+        # batch_size=1 : chaque combinaison dans sa transaction
+        assert Retention([db], days=90, batch_size=1, analytics=analytics).run_once_sync()[1] == 3
+        assert progress_rows(db) == 4
+        db.rebuild_summary()
+        after = db.get_statistics("svt", student_id="eleve_1")
+        assert (after["interactions"], after["total_points"]) == (before["interactions"], before["total_points"])
+
+        # Base d'analyse neuve : les lignes regroupées comptent pour toutes leurs activités
+        fresh = AnalyticsStore(str(tmp_path / "fresh.db"))
+        try:
+            fresh.export([db])
+            assert analytics_totals(fresh) == (6, 70)
+        finally:
+            fresh.close()
+    finally:
+        analytics.close()
+
+
+def test_day_split_across_passes_is_merged(db):
+    fill_progress(db)
+    ids = [row[0] for row in db.get_connection().execute("SELECT id FROM progress ORDER BY id")]
+    # Premier passage : seules les deux premières interactions du jour J-200 sont exportées
+    assert db.compact_progress(90, exported_id=ids[1]) == 1
+    assert db.compact_progress(90, exported_id=ids[-1]) == 2
+    rows = db.get_connection().execute(
+        "SELECT points, details FROM progress WHERE activity_type = 'interaction' ORDER BY id"
+    ).fetchall()
+    assert [(row["points"], row["details"]) for row in rows] == [
+        (15, '{"compacted": 3}'), (10, '{"compacted": 2}'), (5, None)
+    ]
+
+
+def fill_messages(db, count=10, student_id="eleve_1"):
+    """``count`` messages d'il y a 200 jours"""
+    with db.transaction() as conn:
+        conn.executemany(
+            """INSERT INTO chat_history (student_id, subject, role, content, timestamp)
+               VALUES (?, 'svt', 'user', ?, datetime('now', '-200 days', ?))""",
+            [(student_id, f"Question {index}", f"+{index} minutes") for index in range(count)]
+        )
+
+
+def test_nothing_is_archived_before_export(db, tmp_path):
+    fill_messages(db)
+    analytics = AnalyticsStore(str(tmp_path / "analytics.db"))
+    try:
+        assert Retention([db], days=90, analytics=analytics).run_once_sync()[0] == 0
+        assert len(db.get_chat_history("svt", student_id="eleve_1")) == 10
+
+        analytics.export([db])
+        assert Retention([db], days=90, block_size=4, analytics=analytics).run_once_sync()[0] == 10
+        assert db.get_connection().execute("SELECT COUNT(*) FROM chat_history").fetchone()[0] == 0
+        assert sum(row["messages"] for row in analytics.daily_report("svt", days=365)) == 10
+    finally:
+        analytics.close()
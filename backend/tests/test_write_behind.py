@@ -0,0 +1,67 @@
+import sqlite3
+import threading
+
+from database import Database
+from write_behind import WriteBehind
+
+
+def count_messages(db):
+    return db.get_connection().execute("SELECT COUNT(*) FROM chat_history").fetchone()[0]
+
+
+def test_locked_batch_is_requeued_not_dropped(tmp_path):
+    path = str(tmp_path / "tuteur.db")
+    db = Database(path, busy_timeout=0.05)
+    writer = WriteBehind(retry_base=0.01)
+    db.write_behind = writer  # sans thread : les écritures partent à chaque flush()
+    other = sqlite3.connect(path)
+    try:
+        db.save_message("svt", "user", "question", student_id="eleve_1")
+        db.update_progress("svt", "interaction", student_id="eleve_1")
+        other.execute("BEGIN IMMEDIATE")  # un autre processus tient le verrou d'écriture
+
+        assert writer.flush() == 2
+        stats = writer.stats()
+        assert stats["pending"] == 2
+        assert stats["failed_rows"] == 0
+
+        other.rollback()
+        assert writer.flush() == 0
+        assert count_messages(db) == 1
+        assert db.get_statistics("svt", student_id="eleve_1")["interactions"] == 1
+        assert writer.stats()["failed_rows"] == 0
+    finally:
+        other.close()
+        db.close()
+
+
+def test_stop_waits_for_the_lock(tmp_path):
+    path = str(tmp_path / "tuteur.db")
+    db = Database(path, busy_timeout=0.05)
+    writer = WriteBehind(retry_base=0.05)
+    db.attach_write_behind(writer)
+    other = sqlite3.connect(path, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    db.save_message("svt", "user", "question", student_id="eleve_1")
+
+    threading.Timer(0.2, other.rollback).start()
+    db.close()  # écrit la file : attend que le verrou soit rendu
+
+    other.close()
+    db = Database(path)
+    try:
+        assert count_messages(db) == 1
+        assert writer.stats()["failed_rows"] == 0
+    finally:
+        db.close()
+
+
+def test_invalid_row_is_dropped_alone(db):
+    writer = WriteBehind()
+    db.write_behind = writer
+    db.save_message("svt", "user", "bonne question", student_id="eleve_1")
+    db.save_message("svt", "user", None, student_id="eleve_1")  # NOT NULL : IntegrityError
+
+    assert writer.flush() == 0
+    assert count_messages(db) == 1
+    assert writer.stats()["failed_rows"] == 1
@@ -0,0 +1,10 @@
+import re
+import unicodedata
+
+
+def normalize_text(text):
+    """Minuscules, sans accents ni ponctuation, espaces compactés"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s'-]", " ", text)
+    return " ".join(text.split())
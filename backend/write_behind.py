@@ -0,0 +1,217 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+SQLITE_BUSY, SQLITE_LOCKED = 5, 6
+
+
+def is_busy(error):
+    """Vrai si l'écriture a échoué parce qu'un autre écrivain tenait le verrou"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xff in (SQLITE_BUSY, SQLITE_LOCKED)
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+
+class WriteBehind:
+    """File d'écriture différée pour les messages, la progression et les résultats de quiz.
+
+    Les écritures sont mises en file au lieu d'ouvrir chacune sa transaction
+    sur le chemin de la requête. Un thread les regroupe par fichier SQLite et
+    les écrit en une transaction (``executemany``) dès que ``max_batch``
+    événements attendent ou que le plus ancien a ``max_delay`` secondes.
+
+    Une lecture des données d'un élève vide d'abord ses écritures en attente
+    (lecture de ses propres écritures), et stop() écrit tout ce qui reste :
+    seul un arrêt brutal du processus peut perdre les ``max_delay`` dernières
+    secondes.
+
+    Si le fichier reste verrouillé au-delà du busy_timeout (un autre processus
+    écrit), le lot est remis en tête de file et réessayé après un délai
+    croissant (``retry_base`` à ``retry_cap`` secondes) : rien n'est perdu.
+    Seules les erreurs propres à une ligne (contrainte non respectée...) font
+    réessayer le lot ligne par ligne, puis abandonner la ligne fautive.
+    """
+
+    def __init__(self, max_batch=200, max_delay=0.05, retry_base=0.05, retry_cap=2.0, stop_retries=10):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.stop_retries = stop_retries
+        self._busy_attempts = 0
+        self._pending = []              # (base, type, ligne, student_id)
+        self._pending_students = Counter()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self.batches = 0
+        self.rows_written = 0
+        self.failed_rows = 0
+        self.requeued_rows = 0
+
+    @classmethod
+    def from_env(cls):
+        """None si TUTEUR_WRITE_BATCH vaut 0 (écritures immédiates)"""
+        max_batch = int(os.getenv("TUTEUR_WRITE_BATCH", "200"))
+        if max_batch <= 0:
+            return None
+        return cls(max_batch=max_batch, max_delay=float(os.getenv("TUTEUR_WRITE_DELAY_MS", "50")) / 1000)
+
+    def submit(self, store, kind, row, student_id):
+        with self._cond:
+            self._pending.append((store, kind, row, student_id))
+            self._pending_students[student_id] += 1
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def flush_student(self, student_id):
+        """Écrit tout de suite la file si cet élève y a des écritures (y compris en cours d'écriture)"""
+        with self._cond:
+            pending = self._pending_students[student_id] > 0
+        if pending:
+            self.flush()
+
+    def flush(self):
+        """Écrit tout ce qui est en file et attend la fin de l'écriture.
+
+        Renvoie le nombre d'écritures remises en file parce que la base était verrouillée.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            retry = []
+            try:
+                retry = self._write(batch)
+            finally:
+                with self._cond:
+                    # En tête de file : l'ordre des écritures est conservé
+                    self._pending[:0] = retry
+                    self._pending_students.subtract(entry[3] for entry in batch)
+                    self._pending_students.update(entry[3] for entry in retry)
+                    self._pending_students += Counter()  # retire les compteurs à zéro
+            return len(retry)
+
+    def _write(self, batch):
+        """Écrit le lot, groupé par fichier ; renvoie les entrées à réessayer (base verrouillée)"""
+        by_store = {}
+        for entry in batch:
+            by_store.setdefault(id(entry[0]), []).append(entry)
+
+        retry = []
+        written = 0
+        for entries in by_store.values():
+            store = entries[0][0]
+            groups = {}
+            for _, kind, row, _ in entries:
+                groups.setdefault(kind, []).append(row)
+            try:
+                store.write_batch(**groups)
+                written += len(entries)
+            except Exception as e:
+                if is_busy(e):
+                    # Réessayer ligne par ligne se heurterait au même verrou
+                    print(f"⏳ Base verrouillée ({str(e)}), {len(entries)} écritures remises en file")
+                    retry += entries
+                    continue
+                # Une ligne invalide ne doit pas faire perdre tout le lot : on réessaie une par une
+                print(f"❌ Écriture groupée impossible ({str(e)}), écriture ligne par ligne")
+                for entry in entries:
+                    _, kind, row, _ = entry
+                    try:
+                        store.write_batch(**{kind: [row]})
+                        written += 1
+                    except Exception as row_error:
+                        if is_busy(row_error):
+                            retry.append(entry)
+                            continue
+                        self.failed_rows += 1
+                        print(f"❌ Écriture perdue ({kind}): {str(row_error)}")
+            self.batches += 1
+        self.rows_written += written
+        self.requeued_rows += len(retry)
+        return retry
+
+    def _backoff(self):
+        """Délai avant de réessayer un lot refusé pour verrou, doublé à chaque échec consécutif"""
+        delay = min(self.retry_cap, self.retry_base * 2 ** self._busy_attempts)
+        self._busy_attempts += 1
+        return delay
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    break
+                # Laisser le lot se remplir, au plus max_delay après la première écriture
+                deadline = time.monotonic() + self.max_delay
+                while len(self._pending) < self.max_batch and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            try:
+                requeued = self.flush()
+            except Exception as e:
+                requeued = 0
+                print(f"❌ Erreur de la file d'écriture: {str(e)}")
+            if not requeued:
+                self._busy_attempts = 0
+                continue
+            with self._cond:
+                deadline = time.monotonic() + self._backoff()
+                while not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Arrête le thread après avoir écrit toute la file (appelé plusieurs fois sans risque)"""
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+        for attempt in range(self.stop_retries):
+            if attempt:
+                time.sleep(self._backoff())
+            if not self.flush():
+                break
+        with self._cond:
+            lost, self._pending = self._pending, []
+            self._pending_students.clear()
+        if lost:
+            self.failed_rows += len(lost)
+            print(f"❌ {len(lost)} écritures perdues à l'arrêt : base toujours verrouillée")
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "failed_rows": self.failed_rows,
+            "requeued_rows": self.requeued_rows,
+            "max_batch": self.max_batch
+        }